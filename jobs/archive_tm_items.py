@@ -5,7 +5,9 @@ from pymongo import InsertOne
 
 from modules.db import get_collection
 from modules.models.collection_types import Collection
-from modules.repositories.market_repo import update_moving_averages_complete
+from modules.repositories.market_repo import (
+    update_moving_averages_complete, invalidate_archive_priors, refresh_ranking_snapshots, update_archive_rollups
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -28,12 +30,22 @@ def archive_and_summarize(offset: int = 0, force_update: bool = False):
     ops = []
     for doc in cursor:
         doc.pop("_id", None)  # remove existing _id so Mongo generates a new one
+        doc.pop("updated_at", None)  # cache watermark of MARKET_AVERAGES only
         doc["timestamp"] = start_date  # update timestamp
         ops.append(InsertOne(doc))
 
     if ops:
         archive_collection.bulk_write(ops, ordered=False)
+        invalidate_archive_priors()
         logging.info(f"Inserted {len(ops)} documents into MARKET_ARCHIVE with updated timestamps.")
+
+        update_archive_rollups(start_date)
+        logging.info("Updated the weekly and monthly archive rollups.")
+
+        # Rankings are served from snapshots; replace every one the new day belongs to
+        snapshot = refresh_ranking_snapshots(start_date)
+        logging.info(f"Stored ranking snapshot of {len(snapshot['items'])} items for "
+                     f"{snapshot['start_date'].date()} - {snapshot['end_date'].date()}.")
     else:
         logging.info("No MARKET_AVERAGES documents found for that date range; nothing to archive.")
         return
@@ -29,14 +29,15 @@ def create_app():
     from modules.routes.api.lootpool import lootpool_bp
     from modules.routes.api.raidpool import raidpool_bp
     from modules.routes.api.market import market_bp
+    from modules.routes.api.metrics import metrics_bp
 
-    for bp in (item_bp, aspect_bp, lootpool_bp, raidpool_bp, market_bp):
+    for bp in (item_bp, aspect_bp, lootpool_bp, raidpool_bp, market_bp, metrics_bp):
         bp.before_request(require_api_key)
         bp.after_request(record_api_usage)
         app.register_blueprint(bp)
 
-    from modules.db import ensure_debug_indexes
-    ensure_debug_indexes()
+    from modules.indexes import ensure_indexes_in_background
+    ensure_indexes_in_background()
 
     app.logger.warning(
         "Successfully started in '%s' mode with min supported version '%s'",
@@ -13,6 +13,65 @@ class Config:
     # Mod API Key
     MOD_API_KEY = env_config("MOD_API_KEY", default=None)
 
+    # Seconds to coalesce moving-average recomputes after market ingest (0 = recompute immediately)
+    MARKET_RECOMPUTE_WINDOW = env_config("MARKET_RECOMPUTE_WINDOW", default=5.0, cast=float)
+
+    # Listings totals: exact up to this many matches, sampled estimate above,
+    # cached per filter for a few seconds
+    LISTINGS_COUNT_EXACT_LIMIT = env_config("LISTINGS_COUNT_EXACT_LIMIT", default=10000, cast=int)
+    LISTINGS_COUNT_SAMPLE_SIZE = env_config("LISTINGS_COUNT_SAMPLE_SIZE", default=1000, cast=int)
+    LISTINGS_COUNT_CACHE_TTL = env_config("LISTINGS_COUNT_CACHE_TTL", default=30.0, cast=float)
+
+    # Max seconds price lookups served from the in-process MARKET_AVERAGES cache may be stale (0 = no cache)
+    MARKET_AVERAGES_CACHE_TTL = env_config("MARKET_AVERAGES_CACHE_TTL", default=10.0, cast=float)
+
+    # Seconds the ranking of a custom date range is cached per process (0 = always recompute),
+    # and the longest range in days the public ranking endpoint aggregates
+    MARKET_RANKING_CACHE_TTL = env_config("MARKET_RANKING_CACHE_TTL", default=3600.0, cast=float)
+    MARKET_RANKING_MAX_DAYS = env_config("MARKET_RANKING_MAX_DAYS", default=90, cast=int)
+
+    # Key of the HMAC that pseudonymizes pool submitters (see pool_submitter_id()); must be the
+    # same for every process, and kept secret so the ids cannot be matched against player names
+    POOL_SUBMITTER_SECRET = env_config("POOL_SUBMITTER_SECRET", default=None)
+
+    # Seconds a cached current-week pool view is served before its rendered version is rechecked
+    POOL_CACHE_TTL = env_config("POOL_CACHE_TTL", default=5.0, cast=float)
+
+    # Max points of a price history response; longer ranges switch to weekly/monthly rollups
+    HISTORY_MAX_POINTS = env_config("HISTORY_MAX_POINTS", default=120, cast=int)
+
+    # Ingest queue: consumer threads (collection types are partitioned across them),
+    # max queued requests per partition and what to do when a partition is full
+    # ("block", "drop_oldest" or "reject")
+    INGEST_WORKER_THREADS = env_config("INGEST_WORKER_THREADS", default=2, cast=int)
+    INGEST_QUEUE_MAX_DEPTH = env_config("INGEST_QUEUE_MAX_DEPTH", default=10000, cast=int)
+    INGEST_QUEUE_FULL_POLICY = env_config("INGEST_QUEUE_FULL_POLICY", default="block")
+    INGEST_QUEUE_BLOCK_TIMEOUT = env_config("INGEST_QUEUE_BLOCK_TIMEOUT", default=5.0, cast=float)
+
+    # Consecutive queued market requests are merged into one insert of at most this many
+    # listings, waiting at most this long for the batch to fill up
+    MARKET_BATCH_MAX_ITEMS = env_config("MARKET_BATCH_MAX_ITEMS", default=1000, cast=int)
+    MARKET_BATCH_MAX_WAIT_MS = env_config("MARKET_BATCH_MAX_WAIT_MS", default=200, cast=int)
+
+    # Directory for the on-disk ingest journal (empty = disabled) and how long
+    # shutdown waits for the queues to drain
+    INGEST_JOURNAL_DIR = env_config("INGEST_JOURNAL_DIR", default="")
+    INGEST_SHUTDOWN_TIMEOUT = env_config("INGEST_SHUTDOWN_TIMEOUT", default=60.0, cast=float)
+
+    # "inline": web workers write from their own queue threads; "external": web workers
+    # only push to the ingest_queue collection and `python -m modules.ingest` writes
+    INGEST_MODE = env_config("INGEST_MODE", default="inline")
+    INGEST_LEASE_SECONDS = env_config("INGEST_LEASE_SECONDS", default=300.0, cast=float)
+    INGEST_MAX_ATTEMPTS = env_config("INGEST_MAX_ATTEMPTS", default=5, cast=int)
+    INGEST_POLL_INTERVAL = env_config("INGEST_POLL_INTERVAL", default=1.0, cast=float)
+
+    # Query profiling (see /internal/metrics): MongoDB commands slower than QUERY_SLOW_MS are
+    # logged, and reads among them explained at most once per QUERY_EXPLAIN_INTERVAL seconds per call site.
+    # Off by default: attributing a command to its call site walks the stack on every command
+    QUERY_PROFILING = env_config("QUERY_PROFILING", default=False, cast=bool)
+    QUERY_SLOW_MS = env_config("QUERY_SLOW_MS", default=100.0, cast=float)
+    QUERY_EXPLAIN_INTERVAL = env_config("QUERY_EXPLAIN_INTERVAL", default=300.0, cast=float)
+
     @classmethod
     def get_current_uri(cls):
         return cls.DEV_URI if cls.ENVIRONMENT == "dev" else cls.PROD_URI
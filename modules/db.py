@@ -5,12 +5,17 @@ from pymongo.server_api import ServerApi
 
 from modules.config import Config
 from modules.models.collection_types import Collection
+from modules.utils.query_profiler import profiler
 
 # Global client instances for connection pooling
 _admin_client = None
 _current_client = None
 
 
+def _event_listeners() -> list:
+    return [profiler] if Config.QUERY_PROFILING else []
+
+
 def get_client(db: str = "current") -> MongoClient:
     """
     Returns a MongoClient pointed at:
@@ -31,6 +36,7 @@ def get_client(db: str = "current") -> MongoClient:
                 maxPoolSize=50,  # Adjust based on expected concurrent connections
                 tz_aware=True,
                 tzinfo=timezone.utc,
+                event_listeners=_event_listeners(),
             )
         return _admin_client
     else:
@@ -43,6 +49,7 @@ def get_client(db: str = "current") -> MongoClient:
                 maxPoolSize=50,  # Adjust based on expected concurrent connections
                 tz_aware=True,
                 tzinfo=timezone.utc,
+                event_listeners=_event_listeners(),
             )
         return _current_client
 
@@ -51,9 +58,3 @@ def get_collection(collection: Collection):
     client = get_client("admin" if collection in (Collection.API_KEYS, Collection.API_USAGE) else "current")
     db = client.get_default_database()
     return db[collection._value_]
-
-
-def ensure_debug_indexes():
-    """Create TTL index on lootpool_debug_logs so documents auto-expire after 7 days."""
-    col = get_collection(Collection.LOOT_DEBUG)
-    col.create_index("received_at", expireAfterSeconds=604800, background=True)
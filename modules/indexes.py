@@ -0,0 +1,189 @@
+"""
+Declared indexes of every collection.
+
+INDEXES is the single source of truth for the indexes the application's queries rely
+on: `ensure_indexes()` builds whatever is missing (called on startup), and
+`scripts/reconcile_indexes.py` diffs the registry against the live database and
+reports undeclared, unused and redundant indexes.
+"""
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from modules.db import get_collection
+from modules.models.collection_types import Collection
+
+logger = logging.getLogger(__name__)
+
+# Index options that change an index's behaviour; an existing index with the same keys
+# but different values for these conflicts with its declaration
+_BEHAVIOUR_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+INDEXES: Dict[Collection, List[IndexModel]] = {
+    Collection.MARKET_LISTINGS: [
+        # Deduplication of re-submitted listings (insert_many(ordered=False) skips duplicates)
+        IndexModel([('hash_code', ASCENDING)], unique=True),
+        # Name search (see modules/utils/search.py)
+        IndexModel([('search_tokens', ASCENDING), ('timestamp', DESCENDING)]),
+        IndexModel([('search_name', ASCENDING), ('timestamp', DESCENDING)]),
+        # Filters and sorts; sort indexes end with _id, the tie-breaker of every sort and cursor seek
+        IndexModel([('item_type', ASCENDING), ('tier', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('item_type', ASCENDING), ('listing_price', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('timestamp', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('listing_price', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('overall_roll', ASCENDING), ('_id', ASCENDING)]),
+        # Statistics of one (name, tier) key
+        IndexModel([('name', ASCENDING), ('tier', ASCENDING), ('timestamp', DESCENDING)]),
+    ],
+    Collection.MARKET_AVERAGES: [
+        # Upsert key of the moving averages
+        IndexModel([('name', ASCENDING), ('tier', ASCENDING), ('shiny', ASCENDING)], unique=True),
+        # Delta polling of the in-process averages cache
+        IndexModel([('updated_at', ASCENDING)]),
+    ],
+    Collection.MARKET_ARCHIVE: [
+        # Price history by normalized name
+        IndexModel([('name_key', ASCENDING), ('shiny', ASCENDING), ('tier', ASCENDING), ('timestamp', ASCENDING)]),
+        # EMA priors of single keys
+        IndexModel([('name', ASCENDING), ('tier', ASCENDING), ('shiny', ASCENDING), ('timestamp', DESCENDING)]),
+        # Day windows: rollups, rankings, prior cache loads
+        IndexModel([('timestamp', ASCENDING)]),
+    ],
+    Collection.MARKET_ARCHIVE_WEEKLY: [
+        IndexModel([('name_key', ASCENDING), ('shiny', ASCENDING), ('tier', ASCENDING), ('timestamp', ASCENDING)]),
+    ],
+    Collection.MARKET_ARCHIVE_MONTHLY: [
+        IndexModel([('name_key', ASCENDING), ('shiny', ASCENDING), ('tier', ASCENDING), ('timestamp', ASCENDING)]),
+    ],
+    Collection.MARKET_RANKING: [
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+        # Dropping the snapshots that cover a newly archived day
+        IndexModel([('start_date', ASCENDING), ('end_date', ASCENDING)]),
+    ],
+    Collection.LOOT: [
+        # One document per region and week: target of the conditional upsert in BasePoolRepo.save()
+        # (scripts/pool_unique_index_migration.py converts the former non-unique index)
+        IndexModel([('year', ASCENDING), ('week', ASCENDING), ('region', ASCENDING)], unique=True),
+    ],
+    Collection.RAID: [
+        IndexModel([('year', ASCENDING), ('week', ASCENDING), ('region', ASCENDING)], unique=True),
+    ],
+    # Rendered pools are read and written by _id ("<year>-<week>") only
+    Collection.LOOT_RENDERED: [],
+    Collection.RAID_RENDERED: [],
+    Collection.GAMBIT: [
+        # One document per gambit day: target of the conditional upsert in save_gambits()
+        IndexModel([('year', ASCENDING), ('month', ASCENDING), ('day', ASCENDING)], unique=True),
+    ],
+    Collection.API_KEYS: [
+        IndexModel([('key_hash', ASCENDING)]),
+    ],
+    Collection.API_USAGE: [
+        IndexModel([('key_hash', ASCENDING)]),
+    ],
+    Collection.LOOT_DEBUG: [
+        # Debug payloads expire after 7 days
+        IndexModel([('received_at', ASCENDING)], expireAfterSeconds=604800),
+    ],
+    Collection.INGEST_QUEUE: [
+        # Claiming the oldest pending request (of a type)
+        IndexModel([('lease_until', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('type', ASCENDING), ('lease_until', ASCENDING), ('_id', ASCENDING)]),
+    ],
+}
+
+
+def _key(index: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple((field, direction) for field, direction in index['key'].items())
+
+
+def _options(index: Dict[str, Any]) -> Dict[str, Any]:
+    # unique=False is the same as no option, expireAfterSeconds=0 is not
+    return {option: index[option] for option in _BEHAVIOUR_OPTIONS
+            if index.get(option) is not None and index.get(option) is not False}
+
+
+def diff_indexes(collection: Collection) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Compare the declared indexes of a collection with the live ones, by key pattern:
+      - missing:     declared, not present
+      - conflicting: present with the same keys but different options (needs a manual rebuild)
+      - undeclared:  present, not declared (the _id index is ignored)
+    Every entry is an index document as returned by list_indexes() / IndexModel.document.
+    """
+    live = {_key(index): index for index in get_collection(collection).list_indexes() if index['name'] != '_id_'}
+    declared = {_key(model.document): model.document for model in INDEXES.get(collection, [])}
+
+    missing, conflicting = [], []
+    for key, spec in declared.items():
+        if key not in live:
+            missing.append(spec)
+        elif _options(live[key]) != _options(spec):
+            conflicting.append(live[key])
+
+    undeclared = [index for key, index in live.items() if key not in declared]
+    return {'missing': missing, 'conflicting': conflicting, 'undeclared': undeclared}
+
+
+def ensure_indexes(collections: Optional[Iterable[Collection]] = None) -> int:
+    """
+    Build the declared indexes that are missing (all collections by default).
+    Indexes are built one at a time, so one that fails (e.g. a unique index over duplicate
+    data) does not keep the others from being built; each failure is logged with its index.
+    Conflicting and undeclared indexes are left alone. Returns the number of indexes built.
+    """
+    built = 0
+    for collection in collections or INDEXES:
+        declared = {_key(model.document): model for model in INDEXES.get(collection, [])}
+        try:
+            missing = diff_indexes(collection)['missing']
+        except PyMongoError as e:
+            logger.error(f"Could not list indexes on {collection.value}: {str(e)}")
+            continue
+
+        for spec in missing:
+            try:
+                get_collection(collection).create_indexes([declared[_key(spec)]])
+                built += 1
+                logger.info(f"Built index {spec['name']} on {collection.value}")
+            except PyMongoError as e:
+                logger.error(f"Could not build index {spec['name']} on {collection.value}: {str(e)}")
+    return built
+
+
+def ensure_indexes_in_background() -> threading.Thread:
+    """Run ensure_indexes() in a daemon thread, so index builds never delay startup."""
+    thread = threading.Thread(target=ensure_indexes, name="ensure-indexes", daemon=True)
+    thread.start()
+    return thread
+
+
+def index_usage(collection: Collection) -> Dict[str, Dict[str, Any]]:
+    """Per-index access counters since the last server restart ($indexStats), by index name."""
+    return {
+        stats['name']: {'ops': stats['accesses']['ops'], 'since': stats['accesses']['since']}
+        for stats in get_collection(collection).aggregate([{'$indexStats': {}}])
+    }
+
+
+def redundant_indexes(indexes: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """
+    (index, covering index) name pairs where the first index's keys are a prefix of the
+    second's, so the second can serve every query of the first. Unique, TTL, sparse and
+    partial indexes are never reported, since they do more than speed up queries.
+    """
+    pairs = []
+    for index in indexes:
+        if index['name'] == '_id_' or _options(index):
+            continue
+        key = _key(index)
+        for other in indexes:
+            other_key = _key(other)
+            if other is not index and len(other_key) > len(key) and other_key[:len(key)] == key \
+                    and not other.get('sparse') and not other.get('partialFilterExpression'):
+                pairs.append((index['name'], other['name']))
+                break
+    return pairs
@@ -0,0 +1,109 @@
+"""
+Dedicated ingest consumer.
+
+With INGEST_MODE=external the web workers only push write requests into the
+INGEST_QUEUE collection; this process claims them and performs the repository
+writes, so Mongo writes and moving-average recomputes never compete with request
+handling. Run it with:
+
+    python -m modules.ingest
+"""
+import logging
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+from modules.config import Config
+from modules.indexes import ensure_indexes
+from modules.models.collection_request import CollectionRequest
+from modules.models.collection_types import Collection
+from modules.repositories import ingest_queue_repo, market_repo
+from modules.utils.ingest_dispatch import process_request
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)-8s ingest %(process)d: %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+_stopping = False
+
+
+def _claim_market_batch(first: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Claim further market requests until MARKET_BATCH_MAX_ITEMS listings are collected."""
+    docs = [first]
+    item_count = len(first.get("items", []))
+
+    while item_count < Config.MARKET_BATCH_MAX_ITEMS:
+        doc = ingest_queue_repo.claim(Config.INGEST_LEASE_SECONDS, Collection.MARKET_LISTINGS)
+        if doc is None:
+            break
+        docs.append(doc)
+        item_count += len(doc.get("items", []))
+
+    return docs
+
+
+def process_next() -> bool:
+    """
+    Claim and process the next request (market requests are merged into one insert).
+    Returns False when the queue is empty.
+    """
+    doc = ingest_queue_repo.claim(Config.INGEST_LEASE_SECONDS)
+    if doc is None:
+        return False
+
+    request = CollectionRequest.from_dict(doc)
+    docs = [doc]
+    if request.type == Collection.MARKET_LISTINGS:
+        docs = _claim_market_batch(doc)
+        request = CollectionRequest(
+            type=Collection.MARKET_LISTINGS,
+            items=[item for claimed in docs for item in claimed.get("items", [])]
+        )
+
+    try:
+        process_request(request)
+    except Exception as e:
+        # Leave the requests leased; they become claimable again once the lease
+        # expires, until they run out of attempts
+        exhausted = [claimed["_id"] for claimed in docs if claimed.get("attempts", 0) >= Config.INGEST_MAX_ATTEMPTS]
+        logger.error(f"Error processing {request.type} request: {str(e)}; "
+                     f"dropping {len(exhausted)} of {len(docs)} requests after {Config.INGEST_MAX_ATTEMPTS} attempts")
+        ingest_queue_repo.ack(exhausted)
+        return True
+
+    ingest_queue_repo.ack([claimed["_id"] for claimed in docs])
+    logger.info(f"Processed {request.type.name} requests: {len(docs)}, items: {len(request.items)}")
+    return True
+
+
+def _request_stop(signum: int, frame: Optional[Any]) -> None:
+    global _stopping
+    logger.info(f"Received signal {signum}, stopping after the current request")
+    _stopping = True
+
+
+def run() -> None:
+    """Consume the ingest queue until SIGTERM/SIGINT, then flush pending recomputes."""
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    ensure_indexes([Collection.INGEST_QUEUE])
+    logger.info(f"Ingest consumer started, {ingest_queue_repo.depth()} requests waiting")
+
+    while not _stopping:
+        try:
+            if not process_next():
+                time.sleep(Config.INGEST_POLL_INTERVAL)
+        except Exception as e:
+            logger.error(f"Unexpected error in ingest loop: {str(e)}", exc_info=True)
+            time.sleep(Config.INGEST_POLL_INTERVAL)
+
+    market_repo.flush_moving_averages()
+    logger.info("Ingest consumer stopped")
+
+
+if __name__ == "__main__":
+    run()
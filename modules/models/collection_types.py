@@ -5,9 +5,15 @@ class Collection(Enum):
     MARKET_LISTINGS = "trademarket_listings"
     MARKET_AVERAGES = "trademarket_averages"
     MARKET_ARCHIVE = "trademarket_archive"
+    MARKET_ARCHIVE_WEEKLY = "trademarket_archive_weekly"
+    MARKET_ARCHIVE_MONTHLY = "trademarket_archive_monthly"
+    MARKET_RANKING = "trademarket_ranking"
     LOOT = "lootpool"
     RAID = "raidpool"
+    LOOT_RENDERED = "lootpool_rendered"
+    RAID_RENDERED = "raidpool_rendered"
     GAMBIT = "gambit"
     API_KEYS = "api_keys"
     API_USAGE = "api_usage"
     LOOT_DEBUG = "lootpool_debug_logs"
+    INGEST_QUEUE = "ingest_queue"
@@ -1,14 +1,46 @@
+import hashlib
+import hmac
 import logging
+import secrets
+import time
 
-from datetime import datetime, timedelta, timezone
-from typing import List, Tuple, Dict, Optional
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Callable, List, Set, Tuple, Dict, Optional
 
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from modules.config import Config
 from modules.db import get_collection
 from modules.models.collection_types import Collection
 from modules.utils.time_validation import get_lootpool_week, get_lootpool_week_for_timestamp, get_raidpool_week
 
 logger = logging.getLogger(__name__)
 
+_DUPLICATE_KEY_ERROR = 11000
+
+# Item fields identifying an item within a region, see pool_item_key()
+_ITEM_KEY_FIELDS = ("itemType", "type", "name", "rarity", "tier", "amount", "shiny")
+# Per-submission fields of a payload that are not stored on the region document
+_SUBMISSION_FIELDS = ("items", "timestamp", "submitter", "playerName", "modVersion")
+
+# Views of the current week served by BasePoolRepo.fetch_current()
+POOL_VIEW_ITEMS = "items"      # rendered (grouped and sorted) regions
+POOL_VIEW_CURRENT = "current"  # raw regions, as returned by build_pool_pipeline()
+
+# Pool views per (collection, year, week), see BasePoolRepo._cached_view().
+# An entry holds the week version it was loaded at and is rechecked against
+# the rendered document and the regions every Config.POOL_CACHE_TTL seconds.
+_POOL_CACHE_MAX_WEEKS = 8
+_pool_cache: Dict[Tuple[Collection, int, int], Dict[str, Any]] = {}
+_pool_cache_lock = Lock()
+
+# Key of pool_submitter_id() while Config.POOL_SUBMITTER_SECRET is unset (development)
+_fallback_submitter_secret: Optional[bytes] = None
+
+
 def build_pool_pipeline(
         year: Optional[int] = None,
         week: Optional[int] = None
@@ -47,7 +79,8 @@ def build_pool_pipeline(
                 "icon": "$items.icon",
                 "itemType": "$items.itemType",
                 "subtype": "$items.subtype",
-                "tier": "$items.tier"
+                "tier": "$items.tier",
+                "confirmations": "$items.confirmations"
             }},
             "type": {"$first": "$type"}
         }
@@ -104,79 +137,442 @@ def build_pool_pipeline(
     return pipeline
 
 
+def pool_item_key(item: Dict) -> str:
+    """Stable key of an item within a region: the same for every player reporting it."""
+    return "|".join(str(item.get(field)) for field in _ITEM_KEY_FIELDS)
+
+
+def _submitter_secret() -> bytes:
+    global _fallback_submitter_secret
+    if Config.POOL_SUBMITTER_SECRET:
+        return Config.POOL_SUBMITTER_SECRET.encode('utf-8')
+    if _fallback_submitter_secret is None:
+        logger.warning("POOL_SUBMITTER_SECRET is not set; submitter ids are only stable within this process")
+        _fallback_submitter_secret = secrets.token_bytes(32)
+    return _fallback_submitter_secret
+
+
+def pool_submitter_id(player_name: str) -> str:
+    """
+    Pseudonymous id of a pool submitter, so confirmations count distinct players
+    without storing their names: an HMAC of the lower-cased name keyed by
+    Config.POOL_SUBMITTER_SECRET, which cannot be reversed with a list of player names.
+    """
+    if not player_name:
+        raise ValueError("A submitter id needs a player name")
+    digest = hmac.new(_submitter_secret(), player_name.lower().encode('utf-8'), hashlib.sha256)
+    return digest.hexdigest()[:16]
+
+
+def _item_key_expression(item: str) -> Dict:
+    """
+    pool_item_key() of the item in variable `item`, computed by the server: null and
+    missing fields read "None", booleans "True" / "False" like Python's str().
+    (Pool payloads only hold integral numbers, which $toString formats like str().)
+    """
+    parts = []
+    for field in _ITEM_KEY_FIELDS:
+        value = f"$${item}.{field}"
+        if parts:
+            parts.append("|")
+        parts.append({"$switch": {
+            "branches": [
+                {"case": {"$in": [{"$type": value}, ["missing", "null"]]}, "then": "None"},
+                {"case": {"$eq": [{"$type": value}, "bool"]}, "then": {"$cond": [value, "True", "False"]}},
+            ],
+            "default": {"$toString": value}
+        }})
+    return {"$concat": parts}
+
+
+def strip_merge_fields() -> Dict:
+    """Stage removing the per-item merge bookkeeping (key, submitters) from region documents."""
+    return {"$unset": ["items.key", "items.submitters"]}
+
+
+def merge_pool_pipeline(pool: Dict, submitter: str) -> List[Dict]:
+    """
+    Update pipeline upserting a submission into its region document. Items are unioned
+    by pool_item_key(): a reported item already stored gets the submitter added to its
+    `submitters` set ($addToSet semantics, order kept) and `confirmations` set to the
+    set's size, an unknown item is appended with one confirmation. Region fields are
+    overwritten, but `timestamp` only moves when the items change, so a repeated
+    submission leaves the document unmodified. Stored items without a `key` (written
+    before the merge fields existed) are keyed first, so they are confirmed, not duplicated.
+
+    Items are never removed and reads don't filter on `confirmations`: a pool is complete
+    from its first upload, at the price of keeping a bad upload's items for the week.
+    """
+    items = {}
+    for item in pool.get('items', []):
+        items.setdefault(pool_item_key(item), item)
+    new_items = [
+        {**item, "key": key, "submitters": [submitter], "confirmations": 1}
+        for key, item in items.items()
+    ]
+
+    confirmed = {"$let": {
+        "vars": {"submitters": {"$ifNull": ["$$item.submitters", []]}},
+        "in": {"$cond": {
+            "if": {"$in": [submitter, "$$submitters"]},
+            "then": "$$item",
+            "else": {"$mergeObjects": ["$$item", {
+                "submitters": {"$concatArrays": ["$$submitters", [submitter]]},
+                "confirmations": {"$add": [{"$size": "$$submitters"}, 1]}
+            }]}
+        }}
+    }}
+    merged = {"$concatArrays": [
+        {"$map": {
+            "input": {"$ifNull": ["$items", []]},
+            "as": "item",
+            "in": {"$cond": {
+                "if": {"$in": ["$$item.key", {"$literal": list(items)}]},
+                "then": confirmed,
+                "else": "$$item"
+            }}
+        }},
+        {"$filter": {
+            # $literal keeps "$"-prefixed strings in the payload from being read as field paths
+            "input": {"$literal": new_items},
+            "as": "item",
+            "cond": {"$not": [{"$in": ["$$item.key", {"$ifNull": ["$items.key", []]}]}]}
+        }}
+    ]}
+    region_fields = {
+        field: {"$literal": value} for field, value in pool.items() if field not in _SUBMISSION_FIELDS
+    }
+    # Items stored before the merge fields existed get them like in scripts/pool_consensus_migration.py
+    # (no submitters, 0 confirmations), so the submission confirms them instead of appending duplicates
+    keyed = {"$map": {
+        "input": {"$ifNull": ["$items", []]},
+        "as": "item",
+        "in": {"$cond": {
+            "if": {"$eq": [{"$type": "$$item.key"}, "missing"]},
+            "then": {"$mergeObjects": [
+                {"submitters": [], "confirmations": 0}, "$$item", {"key": _item_key_expression("item")}
+            ]},
+            "else": "$$item"
+        }}
+    }}
+
+    return [
+        {"$set": {"items": keyed}},
+        {"$set": {"_merged_items": merged}},
+        {"$set": {
+            **region_fields,
+            "timestamp": {"$cond": {
+                "if": {"$eq": ["$_merged_items", "$items"]},
+                "then": "$timestamp",
+                "else": {"$literal": pool['timestamp']}
+            }},
+            "items": "$_merged_items"
+        }},
+        {"$unset": "_merged_items"}
+    ]
+
+
+def replace_pool_pipeline(pool: Dict, stale_before: datetime, items_field: str = 'items') -> List[Dict]:
+    """
+    Update pipeline upserting a pool document with the replacement rule:
+    the stored document is replaced if there is none yet, if the new pool has more
+    items, or if the stored one is older than `stale_before` and the new pool has
+    at least as many items. Otherwise the stored document is kept unchanged.
+    """
+    new_count = len(pool.get(items_field, []))
+    old_count = {"$size": {"$ifNull": [f"${items_field}", []]}}
+    return [{
+        "$replaceWith": {
+            "$cond": {
+                "if": {"$or": [
+                    {"$eq": [{"$type": "$timestamp"}, "missing"]},
+                    {"$gt": [new_count, old_count]},
+                    {"$and": [
+                        {"$lt": ["$timestamp", stale_before]},
+                        {"$gte": [new_count, old_count]}
+                    ]}
+                ]},
+                # $literal keeps "$"-prefixed strings in the payload from being read as field paths
+                "then": {"$mergeObjects": [{"_id": "$_id"}, {"$literal": pool}]},
+                "else": "$$ROOT"
+            }
+        }
+    }]
+
+
+def bulk_upsert(collection, ops: List[UpdateOne]) -> Tuple[Set[int], int]:
+    """
+    Run conditional upserts with one bulk_write(ordered=False). Upserts that lost a race
+    against a concurrent insert of the same key (duplicate key error) are retried once,
+    then updating the winner's document. Returns the indexes of the ops that inserted
+    a document and the number of documents modified.
+    """
+    try:
+        result = collection.bulk_write(ops, ordered=False)
+        return set(result.upserted_ids), result.modified_count
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != _DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        upserted = {entry['index'] for entry in e.details.get('upserted', [])}
+        modified = e.details.get('nModified', 0)
+
+    retry = [error['index'] for error in errors]
+    result = collection.bulk_write([ops[index] for index in retry], ordered=False)
+    upserted.update(retry[index] for index in result.upserted_ids)
+    return upserted, modified + result.modified_count
+
+
+def rendered_pool_id(year: int, week: int) -> str:
+    """_id of the rendered pool document of a week, e.g. "2026-11"."""
+    return f"{year}-{week:02d}"
+
+
+def _is_newer_version(version: Tuple, other: Tuple) -> bool:
+    """Whether every known component of a week version is at least the other's, and one is newer."""
+    pairs = list(zip(version, other))
+    if any(a is None or b is None for a, b in pairs):
+        return False
+    return version != other and all(a >= b for a, b in pairs)
+
+
+def _pool_etag(data: Any) -> str:
+    return hashlib.sha1(json_util.dumps(data).encode('utf-8')).hexdigest()
+
+
 class BasePoolRepo:
     """
     Base repository class for lootpool and raidpool operations.
     Provides common functionality for saving and retrieving pool data.
+
+    With a rendered collection and render pipeline, the processed view of a week
+    is materialized whenever save() changes a region, so reads are a single find_one.
     """
 
-    def __init__(self, collection_type: Collection):
+    def __init__(
+            self,
+            collection_type: Collection,
+            rendered_collection: Optional[Collection] = None,
+            render_pipeline: Optional[Callable[[int, int], List[Dict]]] = None
+    ):
         self.collection_type = collection_type
+        self.rendered_collection = rendered_collection
+        self.render_pipeline = render_pipeline
 
     def save(self, pools: List[Dict]) -> None:
         """
-        Insert or update pool documents for each dict in the given list,
-        applying duplicate checks and timestamp logic.
-        """
-        collection = get_collection(self.collection_type)
+        Merge each pool dict in the given list into its region document
+        (see merge_pool_pipeline), confirming its items for the pool's submitter.
 
+        All regions of the payload are written with one unordered bulk_write of upserts,
+        so concurrent submissions of the same region merge instead of overwriting each other.
+        """
+        ops = []
+        weeks = []
         for pool in pools:
-            # Compute week/year from the payload's timestamp
-            if self.collection_type == Collection.RAID:
-                year, week = get_lootpool_week_for_timestamp(pool.get('timestamp'), reset_hour=18)
-            elif self.collection_type == Collection.LOOT:
-                year, week = get_lootpool_week_for_timestamp(pool.get('timestamp'), reset_hour=19)
-            else:
-                raise ValueError(f"Unsupported collection type: {self.collection_type}")
-
             payload_ts = pool.get('timestamp')
-            pool['week'] = week
-            pool['year'] = year
-            pool['timestamp'] = datetime.now(timezone.utc)
-
-            # Build a filter for existing documents in same region/week/year
+            if not pool.get('submitter') and not pool.get('playerName'):
+                # Anonymous submissions could confirm items any number of times
+                logger.warning(f"[{pool.get('region')}] pool without a submitter; skipping")
+                continue
+            submitter = pool.get('submitter') or pool_submitter_id(pool['playerName'])
+            year, week = self._prepare_pool(pool)
             region = pool.get('region')
-            filter_q = {'region': region, 'week': week, 'year': year}
-            existing = collection.find_one(filter_q)
-
+            ops.append(UpdateOne(
+                {'region': region, 'week': week, 'year': year},
+                merge_pool_pipeline(pool, submitter),
+                upsert=True
+            ))
+            weeks.append((year, week))
             logger.info(
                 f"[{region}] payload_ts={payload_ts}, week={week}, year={year}, "
-                f"new_item_count={len(pool.get('items', []))}, has_existing={existing is not None}"
+                f"new_item_count={len(pool.get('items', []))}"
             )
 
-            if existing:
-                # Apply replacement rules
-                existing_ts = existing['timestamp']
-                if existing_ts.tzinfo is None:
-                    existing_ts = existing_ts.replace(tzinfo=timezone.utc)
-
-                age = datetime.now(timezone.utc) - existing_ts
-                new_items = pool.get('items', [])
-                old_items = existing.get('items', [])
-
-                has_more = len(new_items) > len(old_items)
-                has_enough_and_stale = age > timedelta(hours=1) and len(new_items) >= len(old_items)
-
-                logger.info(
-                    f"[{region}] existing_ts={existing_ts}, age={age}, "
-                    f"new_items={len(new_items)}, old_items={len(old_items)}, "
-                    f"has_more={has_more}, has_enough_and_stale={has_enough_and_stale}"
-                )
-
-                if has_more or has_enough_and_stale:
-                    # Replace the old document
-                    collection.delete_one(filter_q)
-                    collection.insert_one(pool)
-                    logger.info(f"Inserted fresh document for {region}")
-                else:
-                    if not has_enough_and_stale:
-                        logger.info(f"Payload is older than existing, skipping update: {pool['region']}")
-                    elif not has_more:
-                        logger.info(f"Payload has fewer items ({len(old_items) - len(new_items)}) than existing, skipping update: {pool['region']}")
+        if not ops:
+            return
+
+        upserted, modified = bulk_upsert(get_collection(self.collection_type), ops)
+        logger.info(
+            f"Saved {len(ops)} {self.collection_type.value} regions: {len(upserted)} inserted, "
+            f"{modified} merged, {len(ops) - len(upserted) - modified} unchanged (already confirmed by the submitter)"
+        )
+
+        # The result only counts modifications, so any merge re-renders every week of the payload
+        changed_weeks = {weeks[index] for index in upserted}
+        if modified:
+            changed_weeks.update(weeks)
+
+        for year, week in sorted(changed_weeks):
+            try:
+                self.render(year, week)
+            except Exception:
+                # The regions are saved; the next merged region (or a read) renders again
+                logger.exception(f"Failed to render {self.collection_type.value} {year}/{week}")
+            self.invalidate_cache(year, week)
+
+    def _prepare_pool(self, pool: Dict) -> Tuple[int, int]:
+        """Set the pool's week/year (from the payload's timestamp) and server timestamp."""
+        # Compute week/year from the payload's timestamp
+        if self.collection_type == Collection.RAID:
+            year, week = get_lootpool_week_for_timestamp(pool.get('timestamp'), reset_hour=18)
+        elif self.collection_type == Collection.LOOT:
+            year, week = get_lootpool_week_for_timestamp(pool.get('timestamp'), reset_hour=19)
+        else:
+            raise ValueError(f"Unsupported collection type: {self.collection_type}")
+
+        pool['week'] = week
+        pool['year'] = year
+        pool['timestamp'] = datetime.now(timezone.utc)
+        return year, week
+
+    def render(self, year: int, week: int) -> None:
+        """
+        Run the render pipeline over the regions of a week and $merge the result
+        into the rendered collection as one document, bumping its version.
+
+        The rendered document records the newest region `timestamp` it was built from
+        (`source_updated_at`). A render that read older regions than the stored document
+        (it lost a race against a concurrent save's render) leaves it unchanged.
+        """
+        if self.rendered_collection is None or self.render_pipeline is None:
+            return
+
+        newer = {"$gte": ["$$new.source_updated_at", "$source_updated_at"]}
+        pipeline = self.render_pipeline(year, week) + [
+            {"$group": {"_id": None, "regions": {"$push": "$$ROOT"}, "source_updated_at": {"$max": "$timestamp"}}},
+            {"$project": {
+                "_id": {"$literal": rendered_pool_id(year, week)},
+                "year": {"$literal": year},
+                "week": {"$literal": week},
+                "version": {"$literal": 1},
+                "rendered_at": "$$NOW",
+                "source_updated_at": 1,
+                "regions": 1
+            }},
+            {"$merge": {
+                "into": self.rendered_collection.value,
+                "on": "_id",
+                "whenMatched": [{"$replaceWith": {"$cond": {
+                    "if": newer,
+                    "then": {"$mergeObjects": ["$$ROOT", {
+                        "version": {"$add": ["$version", 1]},
+                        "rendered_at": "$$new.rendered_at",
+                        "source_updated_at": "$$new.source_updated_at",
+                        "regions": "$$new.regions"
+                    }]},
+                    "else": "$$ROOT"
+                }}}],
+                "whenNotMatched": "insert"
+            }}
+        ]
+        get_collection(self.collection_type).aggregate(pipeline)
+        logger.info(f"Rendered {self.collection_type.value} {year}/{week}")
+
+    def fetch_rendered(self, year: int, week: int) -> Optional[dict]:
+        """
+        The rendered document of a week ({year, week, version, rendered_at, regions}),
+        rendering it first if it does not exist yet or is older than the newest region
+        (a render after a save failed). None if the week has no regions.
+        """
+        collection = get_collection(self.rendered_collection)
+        rendered = collection.find_one({"_id": rendered_pool_id(year, week)}, projection={"_id": 0})
+        newest = self._newest_region_timestamp(year, week)
+        if rendered is None or (newest is not None and rendered.get("source_updated_at") is not None
+                                and rendered["source_updated_at"] < newest):
+            self.render(year, week)
+            rendered = collection.find_one({"_id": rendered_pool_id(year, week)}, projection={"_id": 0})
+        if rendered is not None:
+            rendered.pop("source_updated_at", None)
+        return rendered
+
+    def fetch_week(self, year: int, week: int) -> dict:
+        """The raw regions of a week ({year, week, regions}), or {} if there are none."""
+        cursor = get_collection(self.collection_type).aggregate(build_pool_pipeline(year, week))
+        return next(cursor, {})
+
+    def fetch_current(self, view: str) -> Tuple[Any, str]:
+        """
+        A view of the current week (POOL_VIEW_ITEMS or POOL_VIEW_CURRENT) and its ETag,
+        served from the per-process cache. The data is shared, callers must not modify it.
+        """
+        year, week = self._get_week_year()
+        loaders = {
+            POOL_VIEW_ITEMS: lambda: (self.fetch_rendered(year, week) or {}).get("regions", []),
+            POOL_VIEW_CURRENT: lambda: self.fetch_week(year, week),
+        }
+        return self._cached_view(year, week, view, loaders[view])
+
+    def invalidate_cache(self, year: int, week: int) -> None:
+        """Drop this process's cached views of a week (other processes notice the new version)."""
+        with _pool_cache_lock:
+            _pool_cache.pop((self.collection_type, year, week), None)
+
+    def _rendered_version(self, year: int, week: int) -> Optional[int]:
+        doc = get_collection(self.rendered_collection).find_one(
+            {"_id": rendered_pool_id(year, week)}, projection={"version": 1}
+        )
+        return doc.get("version") if doc else None
+
+    def _newest_region_timestamp(self, year: int, week: int) -> Optional[datetime]:
+        doc = get_collection(self.collection_type).find_one(
+            {"year": year, "week": week}, projection={"_id": 0, "timestamp": 1}, sort=[("timestamp", -1)]
+        )
+        return doc.get("timestamp") if doc else None
+
+    def _week_version(self, year: int, week: int) -> Tuple[Optional[int], Optional[datetime]]:
+        """
+        (rendered version, newest region timestamp) of a week. The regions' timestamp moves
+        on every merge even when the render after it fails, so the raw view never outlives it.
+        """
+        return self._rendered_version(year, week), self._newest_region_timestamp(year, week)
+
+    def _cached_view(self, year: int, week: int, view: str, loader: Callable[[], Any]) -> Tuple[Any, str]:
+        """
+        (data, etag) of a view, loaded at most once per version of the week (its rendered
+        version and newest region timestamp, see _week_version). The version is rechecked
+        when the entry is older than Config.POOL_CACHE_TTL seconds, so writes by other
+        processes show up within that time.
+
+        Mongo is only read outside _pool_cache_lock (a miss never blocks other views);
+        the lock just guards looking up and publishing entries.
+        """
+        key = (self.collection_type, year, week)
+        now = time.monotonic()
+
+        with _pool_cache_lock:
+            entry = _pool_cache.get(key)
+            if entry is not None and now - entry["checked_at"] < Config.POOL_CACHE_TTL and view in entry["views"]:
+                return entry["views"][view]
+
+        if entry is not None and now - entry["checked_at"] >= Config.POOL_CACHE_TTL:
+            if self._week_version(year, week) == entry["version"]:
+                with _pool_cache_lock:
+                    entry["checked_at"] = now
+            else:
+                entry = None
+
+        if entry is None:
+            entry = {"version": self._week_version(year, week), "checked_at": now, "views": {}}
+
+        with _pool_cache_lock:
+            cached = entry["views"].get(view)
+        if cached is None:
+            data = loader()
+            cached = (data, _pool_etag(data))
+
+        with _pool_cache_lock:
+            current = _pool_cache.get(key)
+            if current is not None and current["version"] == entry["version"]:
+                entry = current  # loaded concurrently, or the entry we revalidated
+            elif current is not None and _is_newer_version(current["version"], entry["version"]):
+                return cached  # another request already published a newer version
             else:
-                # No duplicate, insert fresh
-                logger.info(f"Inserted fresh document for {region}")
-                collection.insert_one(pool)
+                _pool_cache.pop(key, None)
+                _pool_cache[key] = entry
+                while len(_pool_cache) > _POOL_CACHE_MAX_WEEKS:
+                    _pool_cache.pop(next(iter(_pool_cache)))
+            return entry["views"].setdefault(view, cached)
 
     def fetch_pool_raw(self) -> List[dict]:
         """
@@ -185,7 +581,7 @@ class BasePoolRepo:
         year, week = self._get_week_year()
         cursor = get_collection(self.collection_type).find(
             {'year': year, 'week': week},
-            projection={'_id': 0}
+            projection={'_id': 0, 'items.key': 0, 'items.submitters': 0}
         )
         return list(cursor)
 
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+
+from modules.db import get_collection
+from modules.models.collection_request import CollectionRequest
+from modules.models.collection_types import Collection
+
+
+def push(request: CollectionRequest) -> None:
+    """
+    Append a request to the shared work queue consumed by the ingest process.
+    A new request is immediately claimable (its lease is already expired).
+    """
+    now = datetime.now(timezone.utc)
+    get_collection(Collection.INGEST_QUEUE).insert_one({
+        **request.to_dict(),
+        "enqueued_at": now,
+        "lease_until": now,
+        "attempts": 0,
+    })
+
+
+def claim(lease_seconds: float, collection_type: Optional[Collection] = None) -> Optional[Dict[str, Any]]:
+    """
+    Lease the oldest claimable request, optionally of a single collection type.
+    The request is hidden from other consumers until the lease runs out; if the
+    consumer dies before ack(), it becomes claimable again.
+    """
+    now = datetime.now(timezone.utc)
+    query: Dict[str, Any] = {"lease_until": {"$lte": now}}
+    if collection_type is not None:
+        query["type"] = collection_type.value
+
+    return get_collection(Collection.INGEST_QUEUE).find_one_and_update(
+        query,
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds)}, "$inc": {"attempts": 1}},
+        sort=[("_id", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def ack(ids: List[Any]) -> None:
+    """Remove processed requests from the queue."""
+    if ids:
+        get_collection(Collection.INGEST_QUEUE).delete_many({"_id": {"$in": ids}})
+
+
+def depth() -> int:
+    """Approximate number of requests waiting in the queue."""
+    return get_collection(Collection.INGEST_QUEUE).estimated_document_count()
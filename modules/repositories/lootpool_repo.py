@@ -1,12 +1,8 @@
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 from modules.db import get_collection
 from modules.models.collection_types import Collection
-from modules.repositories.base_pool_repo import BasePoolRepo, build_pool_pipeline
-from modules.utils.time_validation import get_lootpool_week
-
-# Initialize the base repository and aggregator with the LOOT collection type
-_repo = BasePoolRepo(Collection.LOOT)
+from modules.repositories.base_pool_repo import BasePoolRepo, build_pool_pipeline, strip_merge_fields, POOL_VIEW_ITEMS
 
 
 def save(pool: dict) -> None:
@@ -39,11 +35,7 @@ def fetch_lootpools(
 
     # 1) Single‐object case
     if year is not None and week is not None:
-        cursor = coll.aggregate(pipeline)
-        try:
-            return cursor.next()
-        except StopIteration:
-            return {}
+        return _repo.fetch_week(year, week)
 
     paged_pipeline = pipeline + [
         {"$skip": skip},
@@ -61,17 +53,15 @@ def fetch_lootpools(
     }
 
 
-def fetch_lootpool() -> List[dict]:
+def build_lootpool_pipeline(year: int, week: int) -> List[Dict]:
     """
-    Retrieve the processed lootpool items for the current week/year,
+    Pipeline producing the processed lootpool items of a week/year,
     grouped and sorted by region, group, and shiny status.
 
     Change: items that don't have a shinyStat are NOT treated as shiny for grouping.
             (effectiveShiny = shiny == True AND shinyStat exists/not-null)
     """
-    year, week = get_lootpool_week()
-
-    pipeline = [
+    return [
         # Match documents for the given week and year
         {
             "$match": {
@@ -79,6 +69,8 @@ def fetch_lootpool() -> List[dict]:
                 "year": year
             }
         },
+        # Drop the merge bookkeeping (item keys and submitter ids), it is never served
+        strip_merge_fields(),
 
         # Map over items to assign 'group' and 'type' fields
         # + compute effectiveShiny and override items.shiny with it for downstream grouping
@@ -362,5 +354,23 @@ def fetch_lootpool() -> List[dict]:
         }
     ]
 
-    cursor = get_collection(Collection.LOOT).aggregate(pipeline)
-    return list(cursor)
+
+# Initialize the base repository and aggregator with the LOOT collection type
+_repo = BasePoolRepo(Collection.LOOT, Collection.LOOT_RENDERED, build_lootpool_pipeline)
+
+
+def fetch_lootpool() -> List[dict]:
+    """
+    Retrieve the processed lootpool items for the current week/year,
+    as rendered when the week's regions were last saved.
+    """
+    regions, _ = _repo.fetch_current(POOL_VIEW_ITEMS)
+    return regions
+
+
+def fetch_current(view: str) -> Tuple[Any, str]:
+    """
+    A view of the current week's lootpool (POOL_VIEW_ITEMS or POOL_VIEW_CURRENT) and its ETag,
+    from the per-process pool cache.
+    """
+    return _repo.fetch_current(view)
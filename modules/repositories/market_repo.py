@@ -1,17 +1,26 @@
+import hashlib
 import logging
 import math
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
 from datetime import timedelta
 from datetime import timezone, datetime
-from typing import List, Dict, Any
+from threading import Lock, Timer
+from typing import List, Dict, Any, Tuple, Iterable
 from typing import Optional
 
+from bson import json_util
+from pymongo import UpdateOne
 from pymongo.errors import BulkWriteError
 
+from modules.config import Config
 from modules.db import get_collection
 from modules.models.collection_types import Collection as ColEnum
 from modules.models.sort_options import SortOption
+from modules.utils import weighted_stats
+from modules.utils.cache import TTLCache
+from modules.utils.cursor import decode_cursor, encode_cursor
+from modules.utils.search import NGRAM_SIZE, name_tokens, normalize_name, search_fields
 
 # 7-day EMA: α = 2 / (N + 1) where N = 7. Applied once per calendar day using
 # the previous day's MARKET_ARCHIVE snapshot as the prior. Within a single day all
@@ -21,6 +30,53 @@ _P50_EMA_ALPHA = 2.0 / (7 + 1)
 
 TIERED_TYPES = ["MaterialItem", "PowderItem", "AmplifierItem", "EmeraldPouchItem"]
 
+# Max number of (name, tier, shiny) keys recomputed per statistics aggregation / bulk_write.
+_RECOMPUTE_CHUNK_SIZE = 500
+
+# Internal fields never returned by the price endpoints
+_AVERAGES_PROJECTION = {'_id': False, 'updated_at': False, 'name_key': False}
+# The averages cache needs `updated_at` for its watermark and pops it itself
+_AVERAGES_CACHE_PROJECTION = {field: False for field in _AVERAGES_PROJECTION if field != 'updated_at'}
+
+# Internal fields never returned by the listings endpoints (_id is only read to build cursors)
+_LISTING_PROJECTION = {'player_name': 0, 'search_name': 0, 'search_tokens': 0}
+
+# Listings totals keyed by normalized filter, see _count_listings()
+_listing_counts = TTLCache(maxsize=1024)
+
+# Keys marked dirty by save(), flushed together after Config.MARKET_RECOMPUTE_WINDOW seconds.
+_dirty_items: Dict[Tuple, Dict[str, Any]] = {}
+_dirty_lock = Lock()
+_flush_timer: Optional[Timer] = None
+
+# EMA priors per (name, tier, shiny), loaded once per calendar day (see _get_archive_priors).
+_ARCHIVE_PRIOR_LOOKBACK_DAYS = 7
+_ARCHIVE_PRIOR_RECHECK_SECONDS = 300
+_archive_priors: Dict[Tuple, Tuple[Optional[float], Optional[float]]] = {}
+_archive_priors_day: Optional[datetime] = None
+_archive_priors_watermark: Optional[int] = None
+_archive_priors_checked_at = 0.0
+_archive_priors_lock = Lock()
+
+# MARKET_AVERAGES mirrored in memory for price lookups (see _get_cached_averages).
+# Deltas are polled via the `updated_at` watermark. The server stamps `updated_at` when it
+# applies a write, so app clocks and slow recompute chunks don't matter; the overlap covers
+# concurrent writes stamped just before a polled one but committed after it.
+_AVERAGES_WATERMARK_OVERLAP = timedelta(seconds=5)
+_AVERAGES_FULL_RELOAD_SECONDS = 3600
+_averages_cache: Dict[Tuple[str, bool, Optional[int]], Dict[str, Any]] = {}
+_averages_watermark: Optional[datetime] = None
+_averages_loaded_at: Optional[float] = None
+_averages_checked_at = 0.0
+_averages_lock = Lock()
+
+# How long the nightly default-window ranking snapshot is kept (replaced by the next run)
+_RANKING_SNAPSHOT_RETENTION = timedelta(days=2)
+
+# Rankings of custom date ranges, kept per process instead of in MARKET_RANKING so
+# clients varying the dates cannot grow the collection (see get_ranking_snapshot)
+_ranking_cache = TTLCache(maxsize=64)
+
 
 def save(items: List[Dict[str, Any]]) -> None:
     """
@@ -35,6 +91,7 @@ def save(items: List[Dict[str, Any]]) -> None:
     ts = datetime.now(timezone.utc)
     for item in items:
         item['timestamp'] = ts
+        item.update(search_fields(item.get('name')))
 
     market_collection = get_collection(ColEnum.MARKET_LISTINGS)
 
@@ -46,7 +103,77 @@ def save(items: List[Dict[str, Any]]) -> None:
         inserted = bwe.details.get("nInserted", 0)
 
     if inserted > 0:
-        update_moving_averages(items=items)
+        mark_dirty(items)
+
+
+def _average_key(item: Dict[str, Any]) -> Tuple[str, Optional[int], bool]:
+    """(name, tier, shiny) identity of the MARKET_AVERAGES document for a listing or stub."""
+    return item['name'], item.get('tier'), item.get('shiny_stat') is not None
+
+
+def _stats_key(name: str, tier: Optional[int], shiny: bool, item_type: Optional[str]) -> Tuple:
+    """
+    Group key used by the multi-item statistics pipeline. Non-tiered items are
+    grouped regardless of their stored tier, mirroring calculate_listing_averages.
+    """
+    return name, (tier if item_type in TIERED_TYPES else None), shiny
+
+
+def mark_dirty(items: List[Dict[str, Any]]) -> None:
+    """
+    Mark the (name, tier, shiny) keys of the given listings as needing a
+    moving-average recompute. Keys are deduplicated over a short window and
+    flushed together by flush_moving_averages(), so repeated POSTs for the same
+    item within the window cost a single recompute.
+    """
+    global _flush_timer
+
+    with _dirty_lock:
+        for item in items:
+            if not item.get('name'):
+                continue
+            key = _average_key(item)
+            last_ts = item.get('last_ts') or item.get('timestamp')
+            pending = _dirty_items.get(key)
+            if pending is None or (last_ts and pending['last_ts'] and last_ts > pending['last_ts']):
+                _dirty_items[key] = {
+                    'name': item['name'],
+                    'tier': item.get('tier'),
+                    'shiny_stat': item.get('shiny_stat'),
+                    'icon': item.get('icon'),
+                    'item_type': item.get('item_type'),
+                    'last_ts': last_ts,
+                }
+
+        window = Config.MARKET_RECOMPUTE_WINDOW
+        if window > 0 and _flush_timer is None and _dirty_items:
+            _flush_timer = Timer(window, flush_moving_averages)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+    if Config.MARKET_RECOMPUTE_WINDOW <= 0:
+        flush_moving_averages()
+
+
+def flush_moving_averages() -> None:
+    """
+    Recompute the moving averages of every key marked dirty since the last flush.
+    Safe to call at any time (e.g. on shutdown); does nothing when nothing is pending.
+    """
+    global _flush_timer
+
+    with _dirty_lock:
+        stubs = list(_dirty_items.values())
+        _dirty_items.clear()
+        _flush_timer = None
+
+    if not stubs:
+        return
+
+    try:
+        update_moving_averages(items=stubs)
+    except Exception as e:
+        logging.error(f"Error flushing moving averages for {len(stubs)} items with exception {e}")
 
 
 def update_moving_averages(
@@ -60,133 +187,238 @@ def update_moving_averages(
     recalculate and upsert the moving‐average document only if:
       - force_update=True, OR
       - last_ts is newer than the stored average AND (optionally) within [start_date, end_date).
+
+    All stale keys are recomputed together: one staleness lookup and one statistics
+    aggregation per chunk, and a single bulk_write. EMA priors come from the per-day cache.
     """
     if not items:
         return
 
-    averages_coll = get_collection(ColEnum.MARKET_AVERAGES)
-    ts = datetime.now(timezone.utc)
-
-    def worker(item: Dict[str, Any]) -> None:
-        name = item['name']
-        shiny = item.get('shiny_stat') is not None
-        tier = item.get('tier')
-        icon = item.get('icon')
-        item_type = item.get('item_type')
-
+    # 1) Deduplicate stubs by (name, tier, shiny), keeping the newest listing timestamp
+    stubs: Dict[Tuple, Dict[str, Any]] = {}
+    for item in items:
         last_listing_ts: datetime = item.get('last_ts') if 'last_ts' in item else item.get('timestamp')
         if last_listing_ts:
             last_listing_ts = last_listing_ts.replace(tzinfo=timezone.utc)
 
         # If a date window was given, skip items outside it
         if start_date is not None and last_listing_ts < start_date:
-            return
+            continue
         if end_date is not None and last_listing_ts >= end_date:
-            return
+            continue
 
-        filter_q: Dict[str, Any] = {
-            'name': name,
-            'tier': tier,
-            'shiny': shiny
-        }
+        key = _average_key(item)
+        existing_stub = stubs.get(key)
+        if existing_stub is None or (last_listing_ts and existing_stub['last_ts']
+                                     and last_listing_ts > existing_stub['last_ts']):
+            stubs[key] = {**item, 'last_ts': last_listing_ts}
 
-        # Fetch existing doc only to check staleness — EMA is updated separately by the archive job
-        existing = averages_coll.find_one(filter_q, {'timestamp': 1})
-        existing_ts = None
+    _update_moving_averages_in_chunks(stubs, force_update, start_date, end_date)
 
-        if existing:
-            raw_ts = existing.get('timestamp')
-            if raw_ts:
-                existing_ts = raw_ts.replace(tzinfo=timezone.utc)
-
-        if not force_update and existing_ts is not None and existing_ts >= last_listing_ts:
-            # No newer listings; skip recalculation
-            return
-
-        # Recalculate only if listings are newer (or forced)
-        price_data = calculate_listing_averages(
-            item_name=name,
-            shiny=shiny,
-            tier=tier,
-            start_date=start_date,
-            end_date=end_date
+
+def _update_moving_averages_in_chunks(
+        stubs: Dict[Tuple, Dict[str, Any]],
+        force_update: bool,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        all_stats: Optional[Dict[Tuple, Dict[str, Any]]] = None
+) -> None:
+    keys = list(stubs)
+    for offset in range(0, len(keys), _RECOMPUTE_CHUNK_SIZE):
+        chunk = {key: stubs[key] for key in keys[offset:offset + _RECOMPUTE_CHUNK_SIZE]}
+        try:
+            _update_moving_averages_chunk(chunk, force_update, start_date, end_date, all_stats)
+        except Exception as e:
+            logging.error(f"Error updating moving averages for {len(chunk)} items with exception {e}")
+
+
+def _update_moving_averages_chunk(
+        stubs: Dict[Tuple, Dict[str, Any]],
+        force_update: bool,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        all_stats: Optional[Dict[Tuple, Dict[str, Any]]] = None
+) -> None:
+    averages_coll = get_collection(ColEnum.MARKET_AVERAGES)
+    ts = datetime.now(timezone.utc)
+
+    # Fetch existing docs only to check staleness — EMA is updated separately by the archive job
+    if not force_update:
+        existing_ts: Dict[Tuple, datetime] = {}
+        cursor = averages_coll.find(
+            {'$or': [{'name': name, 'tier': tier, 'shiny': shiny} for name, tier, shiny in stubs]},
+            {'_id': 0, 'name': 1, 'tier': 1, 'shiny': 1, 'timestamp': 1}
         )
+        for doc in cursor:
+            raw_ts = doc.get('timestamp')
+            if raw_ts:
+                existing_ts[(doc.get('name'), doc.get('tier'), doc.get('shiny'))] = raw_ts.replace(tzinfo=timezone.utc)
 
-        if not price_data:
-            return
+        # No newer listings; skip recalculation
+        stubs = {
+            key: stub for key, stub in stubs.items()
+            if key not in existing_ts or stub['last_ts'] is None or existing_ts[key] < stub['last_ts']
+        }
 
-        price_data.pop('_id', None)
+    if not stubs:
+        return
 
-        # Compute calendar-day-anchored P50 EMA (7-day, α = 0.25).
-        # Read the prior from MARKET_ARCHIVE (yesterday's immutable snapshot) rather than
-        # MARKET_AVERAGES (today's mutable doc). Within a single calendar day every worker
-        # call finds the same archive prior, so the EMA value is stable intraday and only
-        # truly advances when a new day's archive entry is written by the nightly job.
-        midnight_today = ts.replace(hour=0, minute=0, second=0, microsecond=0)
-        archive_prior = get_collection(ColEnum.MARKET_ARCHIVE).find_one(
-            {'name': name, 'tier': tier, 'shiny': shiny, 'timestamp': {'$lt': midnight_today}},
-            {
-                'average_p50_ema_price': 1,
-                'p50_price': 1,
-                'average_mid_80_percent_price': 1,          # legacy fallback seed for old docs
-                'unidentified_average_p50_ema_price': 1,
-                'unidentified_p50_price': 1,
-                'unidentified_average_mid_80_percent_price': 1,
-            },
-            sort=[('timestamp', -1)]
-        )
+    # Recalculate only if listings are newer (or forced); statistics may already be known
+    # from a full scan (see update_moving_averages_complete)
+    if all_stats is None:
+        all_stats = calculate_listing_averages_bulk(stubs.values(), start_date=start_date, end_date=end_date)
+    priors = _get_archive_priors(list(stubs), ts)
 
-        current_p50 = price_data.get('p50_price')
-        if current_p50 is not None:
-            if archive_prior is not None:
-                # Prefer the smoothed EMA, fall back to raw P50, then to mid-80% avg for old docs
-                prev_ema = (archive_prior.get('average_p50_ema_price')
-                            or archive_prior.get('p50_price')
-                            or archive_prior.get('average_mid_80_percent_price'))
-                if prev_ema is not None:
-                    price_data['average_p50_ema_price'] = round(
-                        _P50_EMA_ALPHA * current_p50 + (1.0 - _P50_EMA_ALPHA) * prev_ema, 2
-                    )
-                else:
-                    price_data['average_p50_ema_price'] = round(current_p50, 2)
-            else:
-                # No archive history at all — bootstrap from current P50
-                price_data['average_p50_ema_price'] = round(current_p50, 2)
-
-        current_unid_p50 = price_data.get('unidentified_p50_price')
-        if current_unid_p50 is not None:
-            if archive_prior is not None:
-                prev_unid_ema = (archive_prior.get('unidentified_average_p50_ema_price')
-                                 or archive_prior.get('unidentified_p50_price')
-                                 or archive_prior.get('unidentified_average_mid_80_percent_price'))
-                if prev_unid_ema is not None:
-                    price_data['unidentified_average_p50_ema_price'] = round(
-                        _P50_EMA_ALPHA * current_unid_p50 + (1.0 - _P50_EMA_ALPHA) * prev_unid_ema, 2
-                    )
-                else:
-                    price_data['unidentified_average_p50_ema_price'] = round(current_unid_p50, 2)
-            else:
-                price_data['unidentified_average_p50_ema_price'] = round(current_unid_p50, 2)
+    ops = []
+    for key, stub in stubs.items():
+        name, tier, shiny = key
+        price_data = all_stats.get(_stats_key(name, tier, shiny, stub.get('item_type')))
+        if not price_data:
+            continue
+
+        price_data = dict(price_data)
+        price_data.pop('_id', None)
+        _apply_p50_ema(price_data, priors[key])
 
         if start_date is not None:
-            price_data['timestamp'] = last_listing_ts
+            price_data['timestamp'] = stub['last_ts']
         else:
             price_data['timestamp'] = ts
-        price_data['icon'] = icon
-        price_data['item_type'] = item_type
+        price_data['icon'] = stub.get('icon')
+        price_data['item_type'] = stub.get('item_type')
+        price_data['name_key'] = normalize_name(name)
 
-        averages_coll.update_one(
-            filter_q,
-            {'$set': price_data},
-            upsert=True
-        )
+        # `updated_at` is stamped by the server when the write is applied (see _get_cached_averages)
+        ops.append(UpdateOne({'name': name, 'tier': tier, 'shiny': shiny},
+                             {'$set': price_data, '$currentDate': {'updated_at': True}}, upsert=True))
 
-    with ThreadPoolExecutor() as executor:
-        future_to_item = {executor.submit(worker, it): it for it in items}
-        for fut in as_completed(future_to_item):
-            item = future_to_item[fut]
-            if fut.exception():
-                logging.error(f"Error updating moving average for {item.get('name')} with exception {fut.exception()}")
+    if ops:
+        averages_coll.bulk_write(ops, ordered=False)
+        invalidate_averages_cache()
+
+
+def _resolve_prior(doc: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Reduce an archive snapshot to its (identified, unidentified) EMA priors.
+    Prefers the smoothed EMA, falls back to raw P50, then to mid-80% avg for old docs.
+    """
+    return (
+        doc.get('average_p50_ema_price')
+        or doc.get('p50_price')
+        or doc.get('average_mid_80_percent_price'),
+        doc.get('unidentified_average_p50_ema_price')
+        or doc.get('unidentified_p50_price')
+        or doc.get('unidentified_average_mid_80_percent_price'),
+    )
+
+
+def _archive_prior_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Latest MARKET_ARCHIVE snapshot per (name, tier, shiny) among the matched documents."""
+    return [
+        {'$match': match},
+        {'$sort': {'timestamp': -1}},
+        {'$group': {
+            '_id': {'name': '$name', 'tier': '$tier', 'shiny': '$shiny'},
+            'average_p50_ema_price': {'$first': '$average_p50_ema_price'},
+            'p50_price': {'$first': '$p50_price'},
+            'average_mid_80_percent_price': {'$first': '$average_mid_80_percent_price'},  # legacy fallback seed for old docs
+            'unidentified_average_p50_ema_price': {'$first': '$unidentified_average_p50_ema_price'},
+            'unidentified_p50_price': {'$first': '$unidentified_p50_price'},
+            'unidentified_average_mid_80_percent_price': {'$first': '$unidentified_average_mid_80_percent_price'},
+        }}
+    ]
+
+
+def _aggregate_archive_priors(match: Dict[str, Any]) -> Dict[Tuple, Tuple[Optional[float], Optional[float]]]:
+    priors: Dict[Tuple, Tuple[Optional[float], Optional[float]]] = {}
+    cursor = get_collection(ColEnum.MARKET_ARCHIVE).aggregate(_archive_prior_pipeline(match), allowDiskUse=True)
+    for doc in cursor:
+        key = doc.pop('_id')
+        priors[(key.get('name'), key.get('tier'), key.get('shiny'))] = _resolve_prior(doc)
+    return priors
+
+
+def invalidate_archive_priors() -> None:
+    """Drop the cached archive priors, e.g. after the archive job wrote new snapshots."""
+    global _archive_priors_day
+
+    with _archive_priors_lock:
+        _archive_priors.clear()
+        _archive_priors_day = None
+
+
+def _get_archive_priors(keys, ts: datetime) -> Dict[Tuple, Tuple[Optional[float], Optional[float]]]:
+    """
+    EMA priors (latest MARKET_ARCHIVE snapshot before midnight today) for the given keys.
+
+    By design the prior cannot change within a calendar day, so all priors of the last
+    _ARCHIVE_PRIOR_LOOKBACK_DAYS are loaded with one aggregation per day and kept in
+    memory. Keys without a snapshot in that window are looked up once and memoized
+    (including "no prior"). The cache is reloaded when the day rolls over, when
+    invalidate_archive_priors() is called, or when another process (the nightly job)
+    changed MARKET_ARCHIVE, detected via its document count.
+    """
+    global _archive_priors_day, _archive_priors_watermark, _archive_priors_checked_at
+
+    midnight_today = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    archive_coll = get_collection(ColEnum.MARKET_ARCHIVE)
+
+    with _archive_priors_lock:
+        reload = _archive_priors_day != midnight_today
+        if not reload and time.monotonic() - _archive_priors_checked_at > _ARCHIVE_PRIOR_RECHECK_SECONDS:
+            _archive_priors_checked_at = time.monotonic()
+            reload = archive_coll.estimated_document_count() != _archive_priors_watermark
+
+        if reload:
+            _archive_priors_watermark = archive_coll.estimated_document_count()
+            _archive_priors_checked_at = time.monotonic()
+            _archive_priors.clear()
+            _archive_priors.update(_aggregate_archive_priors({'timestamp': {
+                '$gte': midnight_today - timedelta(days=_ARCHIVE_PRIOR_LOOKBACK_DAYS),
+                '$lt': midnight_today
+            }}))
+            _archive_priors_day = midnight_today
+
+        missing = [key for key in keys if key not in _archive_priors]
+        if missing:
+            found = _aggregate_archive_priors({
+                '$or': [{'name': name, 'tier': tier, 'shiny': shiny} for name, tier, shiny in missing],
+                'timestamp': {'$lt': midnight_today}
+            })
+            for key in missing:
+                _archive_priors[key] = found.get(key, (None, None))
+
+        return {key: _archive_priors[key] for key in keys}
+
+
+def _apply_p50_ema(price_data: Dict[str, Any], prior: Tuple[Optional[float], Optional[float]]) -> None:
+    """
+    Compute calendar-day-anchored P50 EMA (7-day, α = 0.25).
+    The prior comes from MARKET_ARCHIVE (yesterday's immutable snapshot) rather than
+    MARKET_AVERAGES (today's mutable doc). Within a single calendar day every
+    recompute finds the same archive prior, so the EMA value is stable intraday and only
+    truly advances when a new day's archive entry is written by the nightly job.
+    """
+    prev_ema, prev_unid_ema = prior
+
+    current_p50 = price_data.get('p50_price')
+    if current_p50 is not None:
+        if prev_ema is not None:
+            price_data['average_p50_ema_price'] = round(
+                _P50_EMA_ALPHA * current_p50 + (1.0 - _P50_EMA_ALPHA) * prev_ema, 2
+            )
+        else:
+            # No archive history at all — bootstrap from current P50
+            price_data['average_p50_ema_price'] = round(current_p50, 2)
+
+    current_unid_p50 = price_data.get('unidentified_p50_price')
+    if current_unid_p50 is not None:
+        if prev_unid_ema is not None:
+            price_data['unidentified_average_p50_ema_price'] = round(
+                _P50_EMA_ALPHA * current_unid_p50 + (1.0 - _P50_EMA_ALPHA) * prev_unid_ema, 2
+            )
+        else:
+            price_data['unidentified_average_p50_ema_price'] = round(current_unid_p50, 2)
 
 
 def update_moving_averages_complete(force_update: bool = False,
@@ -194,76 +426,37 @@ def update_moving_averages_complete(force_update: bool = False,
                                     end_date: datetime = None,
                                     ) -> None:
     """
-    Scan MARKET_LISTINGS via an aggregation that returns one document per unique
-    (name, tier, shiny‐flag) combination, along with the most recent listing timestamp.
-    Then call update_moving_averages(...) only for those whose listings are newer
-    than the saved average.
+    Recompute the moving averages of every unique (name, tier, shiny‐flag) combination
+    in MARKET_LISTINGS with a single grouped statistics scan, which also yields the most
+    recent listing timestamp of each group. Only groups whose listings are newer than the
+    saved average are written (unless force_update=True).
     """
-    listing_coll = get_collection(ColEnum.MARKET_LISTINGS)
-
-    match_stage: Dict[str, Any] = {}
-    if start_date is not None or end_date is not None:
-        ts_filter: Dict[str, Any] = {}
-        if start_date is not None:
-            ts_filter["$gte"] = start_date
-        if end_date is not None:
-            ts_filter["$lt"] = end_date
-
-        match_stage["timestamp"] = ts_filter
-
-    pipeline: List[Dict[str, Any]] = []
-    if match_stage:
-        pipeline.append({"$match": match_stage})
-
-    # Pipeline:
-    # 1) Project name, tier, shiny‐flag, and timestamp
-    # 2) Group by {name, tier, shiny}, taking the max timestamp
-    pipeline.extend([
-        {
-            "$project": {
-                "_id": 0,
-                "name": 1,
-                "tier": 1,
-                "shiny": {"$cond": [{"$ne": ["$shiny_stat", None]}, True, False]},
-                "icon": 1,
-                "item_type": 1,
-                "timestamp": 1
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "name": "$name",
-                    "tier": "$tier",
-                    "shiny": "$shiny",
-                    "icon": "$icon",
-                    "item_type": "$item_type"
-                },
-                "last_ts": {"$max": "$timestamp"}
-            }
+    all_stats = calculate_listing_averages_bulk(
+        start_date=start_date,
+        end_date=end_date,
+        extra_accumulators={
+            'icon': {'$first': '$icon'},
+            'item_type': {'$first': '$item_type'},
+            'last_ts': {'$max': '$timestamp'}
         }
-    ])
-
-    cursor = listing_coll.aggregate(pipeline, allowDiskUse=True)
-
-    unique_items: List[Dict[str, Any]] = []
-    for entry in cursor:
-        key = entry["_id"]
-
-        # Reconstruct a stub. Only shiny_stat != None when shiny_flag is True.
-        shiny_stat = True if key["shiny"] else None
+    )
 
-        unique_items.append({
-            "name": key["name"],
-            "tier": key["tier"],
-            "shiny_stat": shiny_stat,
-            "icon": key.get("icon"),
-            "item_type": key["item_type"],
-            "last_ts": entry["last_ts"]
-        })
+    stubs: Dict[Tuple, Dict[str, Any]] = {}
+    for key, stats in all_stats.items():
+        name, tier, shiny = key
+        last_ts = stats.pop('last_ts', None)
+        stubs[key] = {
+            'name': name,
+            'tier': tier,
+            # Only shiny_stat != None when shiny flag is True.
+            'shiny_stat': True if shiny else None,
+            'icon': stats.pop('icon', None),
+            'item_type': stats.pop('item_type', None),
+            'last_ts': last_ts.replace(tzinfo=timezone.utc) if last_ts else None
+        }
 
-    if unique_items:
-        update_moving_averages(items=unique_items, force_update=force_update, start_date=start_date, end_date=end_date)
+    if stubs:
+        _update_moving_averages_in_chunks(stubs, force_update, start_date, end_date, all_stats)
 
 
 def get_trade_market_item_listings(
@@ -277,6 +470,7 @@ def get_trade_market_item_listings(
         sort_option: Optional[SortOption] = SortOption.TIMESTAMP_DESC,
         page: Optional[int] = 1,
         page_size: Optional[int] = 50,
+        cursor: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Retrieve market entries, optionally filtering by:
@@ -284,9 +478,16 @@ def get_trade_market_item_listings(
       - shiny status (if shiny is True/False; if None, don't filter by shiny)
       - tier (for MaterialItem or globally if no name/type)
       - item_type
+
+    Pages are addressed either by `page` (offset) or by `cursor`, the `next_cursor` of the
+    previous page. Cursor pages seek past the last listing seen instead of skipping, so
+    every page costs the same no matter how deep it is.
+
+    Raises:
+        ValueError: If the cursor is malformed or was issued for a different sort order.
     """
     skip = (page - 1) * page_size
-    sort_option = sort_option or SortOption.TIMESTAMP_DESC
+    sort_option = SortOption(sort_option or SortOption.TIMESTAMP_DESC)
 
     query_filter: Dict[str, Any] = {}
 
@@ -316,10 +517,7 @@ def get_trade_market_item_listings(
 
     # 1) NAME branch
     if item_name:
-        query_filter['name'] = {
-            '$regex': f'.*{re.escape(item_name)}.*',
-            '$options': 'i'
-        }
+        query_filter.update(_name_search_filter(item_name))
 
         if item_type is not None:
             # explicit single-type + optional tier
@@ -348,29 +546,245 @@ def get_trade_market_item_listings(
         query_filter['type'] = sub_type
 
     coll = get_collection(ColEnum.MARKET_LISTINGS)
-    total = coll.count_documents(query_filter)
+    total, total_is_estimate = _count_listings(coll, query_filter)
 
     sort_field, sort_dir = sort_option.to_mongo_sort()
 
-    cursor = coll.find(
-        filter=query_filter,
-        projection={
-            '_id': 0,
-            'player_name': 0
-        }
-    ).sort(sort_field, sort_dir).skip(skip).limit(page_size)
+    find_filter = query_filter
+    if cursor is not None:
+        find_filter = {'$and': [query_filter, _listing_seek_filter(decode_cursor(cursor), sort_option)]}
+        skip = 0
+
+    # _id breaks ties between listings with the same sort value (e.g. one ingest batch
+    # shares a timestamp), so the order is total and cursors never skip or repeat items
+    result_cursor = coll.find(
+        filter=find_filter,
+        projection=_LISTING_PROJECTION
+    ).sort([(sort_field, sort_dir), ('_id', sort_dir)]).skip(skip).limit(page_size)
+
+    items = list(result_cursor)
 
-    items = list(cursor)
+    next_cursor = None
+    if items and len(items) == page_size:
+        last = items[-1]
+        next_cursor = encode_cursor({'sort': sort_option.value, 'value': last.get(sort_field), 'id': last['_id']})
+    for item in items:
+        item.pop('_id', None)
 
     return {
-        'page': (skip // page_size) + 1,
+        'page': (skip // page_size) + 1 if cursor is None else None,
         'page_size': page_size,
         'count': len(items),
         'total': total,
+        'total_is_estimate': total_is_estimate,
+        'next_cursor': next_cursor,
         'items': items
     }
 
 
+def _count_listings(coll, query_filter: Dict[str, Any]) -> Tuple[int, bool]:
+    """
+    Total number of listings matching the filter, as (total, is_estimate):
+      - no filter: collection metadata count (estimated_document_count)
+      - selective filters: exact count, stopped at Config.LISTINGS_COUNT_EXACT_LIMIT matches
+      - broader filters: the share of a random sample that matches, scaled to the collection size
+    Results are cached per normalized filter for Config.LISTINGS_COUNT_CACHE_TTL seconds.
+    """
+    cache_key = json_util.dumps(query_filter, sort_keys=True)
+    cached = _listing_counts.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if not query_filter:
+        result = (coll.estimated_document_count(), True)
+    else:
+        limit = Config.LISTINGS_COUNT_EXACT_LIMIT
+        exact = coll.count_documents(query_filter, limit=limit)
+        if exact < limit:
+            result = (exact, False)
+        else:
+            result = (max(limit, _sample_listing_count(coll, query_filter)), True)
+
+    _listing_counts.set(cache_key, result, Config.LISTINGS_COUNT_CACHE_TTL)
+    return result
+
+
+def _sample_listing_count(coll, query_filter: Dict[str, Any]) -> int:
+    """Estimate the number of matches from a random sample of the collection."""
+    sample_size = Config.LISTINGS_COUNT_SAMPLE_SIZE
+    pipeline = [
+        {'$sample': {'size': sample_size}},
+        {'$match': query_filter},
+        {'$count': 'matched'},
+    ]
+    matched = next(coll.aggregate(pipeline), {}).get('matched', 0)
+    return round(coll.estimated_document_count() * matched / sample_size)
+
+
+def _listing_seek_filter(position: Dict[str, Any], sort_option: SortOption) -> Dict[str, Any]:
+    """
+    Filter for the listings after `position` ({sort, value, id}) in (sort field, _id) order.
+    Missing values sort as null, i.e. before every number/date, and `$lt`/`$gt` never match
+    null, so the null group is handled explicitly.
+    """
+    if position.get('sort') != sort_option.value or 'id' not in position:
+        raise ValueError("Cursor does not match the requested sort order")
+
+    field, direction = sort_option.to_mongo_sort()
+    value, last_id = position.get('value'), position['id']
+    after = '$gt' if direction == 1 else '$lt'
+
+    if value is None:
+        same_value = {field: None, '_id': {after: last_id}}
+        # ascending: all non-null values follow the nulls; descending: nulls are last
+        return {'$or': [same_value, {field: {'$ne': None}}]} if direction == 1 else same_value
+
+    clauses = [{field: {after: value}}, {field: value, '_id': {after: last_id}}]
+    if direction == -1:
+        clauses.append({field: None})
+    return {'$or': clauses}
+
+
+def _name_search_filter(item_name: str) -> Dict[str, Any]:
+    """
+    Substring match on the normalized name. Queries of at least NGRAM_SIZE characters
+    are narrowed through the indexed `search_tokens` trigrams; the regex then confirms
+    the trigrams are contiguous. Shorter queries scan the `search_name` index.
+    """
+    normalized = normalize_name(item_name)
+    name_filter: Dict[str, Any] = {'search_name': {'$regex': re.escape(normalized)}}
+    if len(normalized) >= NGRAM_SIZE:
+        name_filter['search_tokens'] = {'$all': name_tokens(normalized)}
+    return name_filter
+
+
+def _listing_timestamp_filter(start_date: Optional[datetime], end_date: Optional[datetime]) -> Dict[str, Any]:
+    ts_filter: Dict[str, Any] = {}
+    if start_date is not None:
+        ts_filter['$gte'] = start_date
+    if end_date is not None:
+        ts_filter['$lt'] = end_date
+    return ts_filter
+
+
+def _listing_stats_stages(
+        group_id: Any,
+        extra_accumulators: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Aggregation stages collecting the (price, amount) pairs of the matched listings,
+    grouped by `group_id` (None for a single item). `extra_accumulators` are added
+    to the $group stage and passed through unchanged.
+
+    Listings are not expanded per unit: each one contributes a single pair, so the
+    sort and the pushed arrays stay bounded by the number of listings. The weighted
+    statistics are computed by _finalize_listing_stats().
+    """
+    extra_accumulators = extra_accumulators or {}
+    identified = {'$ne': ['$unidentified', True]}
+    unidentified = {'$eq': ['$unidentified', True]}
+    pair = {'p': '$listing_price', 'a': '$amount'}
+
+    return [
+        # A listing with amount < 1 contributes no data points
+        {'$match': {'amount': {'$gte': 1}, 'listing_price': {'$ne': None}}},
+        {'$sort': {'listing_price': 1}},
+
+        # Single pass grouping
+        {'$group': {
+            '_id': group_id,
+            # pull tier & name from the first doc in sort order
+            'tier': {'$first': '$tier'},
+            'name': {'$first': '$name'},
+
+            # price-sorted (price, amount) pairs, one per listing
+            'identifiedPrices': {'$push': {'$cond': [identified, pair, '$$REMOVE']}},
+            'unidentifiedPrices': {'$push': {'$cond': [unidentified, pair, '$$REMOVE']}},
+            **extra_accumulators
+        }}
+    ]
+
+
+def _finalize_listing_stats(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn a grouped document from _listing_stats_stages() into the price statistics
+    fields stored in MARKET_AVERAGES. Every listing counts `amount` times.
+    """
+    identified = weighted_stats.summarize([(pair['p'], pair['a']) for pair in doc.pop('identifiedPrices', [])])
+    unidentified = weighted_stats.summarize([(pair['p'], pair['a']) for pair in doc.pop('unidentifiedPrices', [])])
+
+    def _round(value):
+        return round(value, 2) if value is not None else None
+
+    doc.update({
+        'lowest_price': _round(identified['min']),
+        'unidentified_lowest_price': _round(unidentified['min']),
+        'highest_price': _round(identified['max']),
+        'unidentified_highest_price': _round(unidentified['max']),
+        'average_price': _round(identified['mean']),
+        'total_count': identified['count'] + unidentified['count'],
+        'unidentified_count': unidentified['count'],
+        'unidentified_average_price': _round(unidentified['mean']),
+        'p50_price': identified['median'],
+        'unidentified_p50_price': unidentified['median'],
+        'average_mid_80_percent_price': _round(identified['mid_80_mean']),
+        'unidentified_average_mid_80_percent_price': _round(unidentified['mid_80_mean']),
+    })
+    return doc
+
+
+def calculate_listing_averages_bulk(
+        stubs: Optional[Iterable[Dict[str, Any]]] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        extra_accumulators: Optional[Dict[str, Any]] = None
+) -> Dict[Tuple, Dict[str, Any]]:
+    """
+    Set-based variant of calculate_listing_averages(): computes the same statistics for
+    many items in a single aggregation, grouped by (name, tier, shiny).
+
+    If `stubs` is given, only listings of those (name, tier, shiny) keys are scanned;
+    if it is None, every listing within [start_date, end_date) is grouped.
+    Returns a dict keyed by _stats_key(name, tier, shiny, item_type).
+    """
+    query_filter: Dict[str, Any] = {}
+
+    if stubs is not None:
+        clauses: Dict[Tuple, Dict[str, Any]] = {}
+        for stub in stubs:
+            name, tier, shiny = _average_key(stub)
+            key = _stats_key(name, tier, shiny, stub.get('item_type'))
+            if key in clauses:
+                continue
+            clause: Dict[str, Any] = {'name': name, 'shiny_stat': {'$ne' if shiny else '$eq': None}}
+            if key[1] is not None:
+                clause.update({'item_type': {'$in': TIERED_TYPES}, 'tier': key[1]})
+            else:
+                clause['item_type'] = {'$nin': TIERED_TYPES}
+            clauses[key] = clause
+
+        if not clauses:
+            return {}
+        query_filter['$or'] = list(clauses.values())
+
+    ts_filter = _listing_timestamp_filter(start_date, end_date)
+    if ts_filter:
+        query_filter['timestamp'] = ts_filter
+
+    group_id = {
+        'name': '$name',
+        'tier': {'$cond': [{'$in': ['$item_type', TIERED_TYPES]}, {'$ifNull': ['$tier', None]}, None]},
+        'shiny': {'$ne': [{'$ifNull': ['$shiny_stat', None]}, None]}
+    }
+    pipeline = [{'$match': query_filter}] + _listing_stats_stages(group_id, extra_accumulators)
+
+    results: Dict[Tuple, Dict[str, Any]] = {}
+    for stats in get_collection(ColEnum.MARKET_LISTINGS).aggregate(pipeline, allowDiskUse=True):
+        key = stats.get('_id') or {}
+        results[(key.get('name'), key.get('tier'), key.get('shiny'))] = _finalize_listing_stats(stats)
+    return results
+
+
 def calculate_listing_averages(
         item_name: str,
         shiny: bool = False,
@@ -393,188 +807,11 @@ def calculate_listing_averages(
         {'item_type': {'$in': TIERED_TYPES}, 'tier': tier}
     ]}
 
-    if start_date is not None or end_date is not None:
-        ts_filter: Dict[str, Any] = {}
-        if start_date is not None:
-            ts_filter['$gte'] = start_date
-        if end_date is not None:
-            ts_filter['$lt'] = end_date
+    ts_filter = _listing_timestamp_filter(start_date, end_date)
+    if ts_filter:
         query_filter['timestamp'] = ts_filter
 
-    # 2) build pipeline
-    pipeline = [
-        # 1) Only the docs we care about, in price order
-        {'$match': query_filter},
-        {'$addFields': {'unitIndex': {'$range': [0, '$amount']}}},
-        {'$unwind': '$unitIndex'},
-        {'$sort': {'listing_price': 1}},
-
-        # 2) Single pass grouping
-        {'$group': {
-            '_id': None,
-            # pull tier & name from the first doc in sort order
-            'tier': {'$first': '$tier'},
-            'name': {'$first': '$name'},
-
-            # all identified prices in one array
-            'identifiedPrices': {
-                '$push': {
-                    '$cond': [
-                        {'$ne': ['$unidentified', True]},
-                        '$listing_price',
-                        '$$REMOVE'
-                    ]
-                }
-            },
-            # all unidentified prices in another
-            'unidentifiedPrices': {
-                '$push': {
-                    '$cond': [
-                        {'$eq': ['$unidentified', True]},
-                        '$listing_price',
-                        '$$REMOVE'
-                    ]
-                }
-            },
-
-            # counts & sums & mins & maxes
-            'identifiedCount': {'$sum': {'$cond': [{'$ne': ['$unidentified', True]}, 1, 0]}},
-            'unidentifiedCount': {'$sum': {'$cond': [{'$eq': ['$unidentified', True]}, 1, 0]}},
-            'identifiedMin': {'$min': {'$cond': [{'$ne': ['$unidentified', True]}, '$listing_price', None]}},
-            'unidentifiedMin': {'$min': {'$cond': [{'$eq': ['$unidentified', True]}, '$listing_price', None]}},
-            'identifiedMax': {'$max': {'$cond': [{'$ne': ['$unidentified', True]}, '$listing_price', None]}},
-            'unidentifiedMax': {'$max': {'$cond': [{'$eq': ['$unidentified', True]}, '$listing_price', None]}},
-            'identifiedAvg': {'$avg': {'$cond': [{'$ne': ['$unidentified', True]}, '$listing_price', None]}},
-            'unidentifiedAvg': {'$avg': {'$cond': [{'$eq': ['$unidentified', True]}, '$listing_price', None]}}
-        }},
-
-        # 3) Final projection
-        {'$project': {
-            'tier': 1,
-            'name': 1,
-
-            'lowest_price': {'$round': ['$identifiedMin', 2]},
-            'unidentified_lowest_price': {'$round': ['$unidentifiedMin', 2]},
-            'highest_price': {'$round': ['$identifiedMax', 2]},
-            'unidentified_highest_price': {'$round': ['$unidentifiedMax', 2]},
-            'average_price': {'$round': ['$identifiedAvg', 2]},
-
-            'total_count': {
-                '$add': ['$identifiedCount', '$unidentifiedCount']
-            },
-            'unidentified_count': '$unidentifiedCount',
-            'unidentified_average_price': {'$round': ['$unidentifiedAvg', 2]},
-
-            # P50 (median) for identified listings — prices array is pre-sorted ascending
-            'p50_price': {
-                '$cond': [
-                    {'$eq': [{'$size': '$identifiedPrices'}, 0]},
-                    None,
-                    {
-                        '$let': {
-                            'vars': {
-                                'n': {'$size': '$identifiedPrices'},
-                                'prices': '$identifiedPrices'
-                            },
-                            'in': {
-                                '$cond': [
-                                    {'$eq': [{'$mod': ['$$n', 2]}, 0]},
-                                    # even count: average of two middle elements
-                                    {'$avg': [
-                                        {'$arrayElemAt': ['$$prices', {'$floor': {'$subtract': [{'$divide': ['$$n', 2]}, 1]}}]},
-                                        {'$arrayElemAt': ['$$prices', {'$floor': {'$divide': ['$$n', 2]}}]}
-                                    ]},
-                                    # odd count: middle element
-                                    {'$arrayElemAt': ['$$prices', {'$floor': {'$divide': ['$$n', 2]}}]}
-                                ]
-                            }
-                        }
-                    }
-                ]
-            },
-
-            # P50 (median) for unidentified listings
-            'unidentified_p50_price': {
-                '$cond': [
-                    {'$eq': [{'$size': '$unidentifiedPrices'}, 0]},
-                    None,
-                    {
-                        '$let': {
-                            'vars': {
-                                'n': {'$size': '$unidentifiedPrices'},
-                                'prices': '$unidentifiedPrices'
-                            },
-                            'in': {
-                                '$cond': [
-                                    {'$eq': [{'$mod': ['$$n', 2]}, 0]},
-                                    {'$avg': [
-                                        {'$arrayElemAt': ['$$prices', {'$floor': {'$subtract': [{'$divide': ['$$n', 2]}, 1]}}]},
-                                        {'$arrayElemAt': ['$$prices', {'$floor': {'$divide': ['$$n', 2]}}]}
-                                    ]},
-                                    {'$arrayElemAt': ['$$prices', {'$floor': {'$divide': ['$$n', 2]}}]}
-                                ]
-                            }
-                        }
-                    }
-                ]
-            },
-
-            'average_mid_80_percent_price': {
-                '$round': [
-                    {
-                        '$cond': [
-                            {'$gt': [{'$size': '$identifiedPrices'}, 2]},
-                            {'$avg': {
-                                '$slice': [
-                                    '$identifiedPrices',
-                                    {'$ceil': {'$multiply': [{'$size': '$identifiedPrices'}, 0.1]}},
-                                    {
-                                        '$subtract': [
-                                            {'$size': '$identifiedPrices'},
-                                            {'$multiply': [
-                                                2,
-                                                {'$ceil': {'$multiply': [{'$size': '$identifiedPrices'}, 0.1]}}
-                                            ]}
-                                        ]
-                                    }
-                                ]
-                            }},
-                            {'$avg': '$identifiedPrices'}
-                        ]
-                    },
-                    2
-                ]
-            },
-
-            # mid-80-percent for unidentified
-            'unidentified_average_mid_80_percent_price': {
-                '$round': [
-                    {
-                        '$cond': [
-                            {'$gt': [{'$size': '$unidentifiedPrices'}, 2]},
-                            {'$avg': {
-                                '$slice': [
-                                    '$unidentifiedPrices',
-                                    {'$ceil': {'$multiply': [{'$size': '$unidentifiedPrices'}, 0.1]}},
-                                    {
-                                        '$subtract': [
-                                            {'$size': '$unidentifiedPrices'},
-                                            {'$multiply': [
-                                                2,
-                                                {'$ceil': {'$multiply': [{'$size': '$unidentifiedPrices'}, 0.1]}}
-                                            ]}
-                                        ]
-                                    }
-                                ]
-                            }},
-                            {'$avg': '$unidentifiedPrices'}
-                        ]
-                    },
-                    2
-                ]
-            }
-        }}
-    ]
+    pipeline = [{'$match': query_filter}] + _listing_stats_stages(None)
 
     cursor = get_collection(ColEnum.MARKET_LISTINGS).aggregate(pipeline)
     try:
@@ -582,7 +819,14 @@ def calculate_listing_averages(
     except StopIteration:
         return {}
 
-    return stats
+    return _finalize_listing_stats(stats)
+
+
+def price_key(item_name: str, shiny: bool = False, tier: Optional[int] = None) -> Tuple[str, bool, Optional[int]]:
+    """(name, shiny, tier) identity of a price lookup; tiers <= 0 mean "no tier"."""
+    if tier and tier <= 0:
+        tier = None
+    return item_name, bool(shiny), tier
 
 
 def get_trademarket_item_price(
@@ -590,8 +834,10 @@ def get_trademarket_item_price(
         shiny: bool = False,
         tier: Optional[int] = None
 ) -> Dict[str, Any]:
-    if tier and tier <= 0:
-        tier = None
+    item_name, shiny, tier = price_key(item_name, shiny, tier)
+
+    if Config.MARKET_AVERAGES_CACHE_TTL > 0:
+        return dict(_get_cached_averages().get((item_name, shiny, tier), {}))
 
     filter_q = {
         'name': item_name,
@@ -599,7 +845,7 @@ def get_trademarket_item_price(
         'shiny': shiny
     }
 
-    result = get_collection(ColEnum.MARKET_AVERAGES).find_one(filter_q, {"_id": False})
+    result = get_collection(ColEnum.MARKET_AVERAGES).find_one(filter_q, _AVERAGES_PROJECTION)
 
     if result:
         return result
@@ -607,51 +853,325 @@ def get_trademarket_item_price(
         return {}
 
 
-def get_price_history(
-        item_name: str,
-        shiny: bool = False,
-        tier: Optional[int] = None,
-        start_date: datetime = None,
-        end_date: datetime = None,
+def invalidate_averages_cache() -> None:
+    """Make the next price lookup poll MARKET_AVERAGES for changes (called after our own writes)."""
+    global _averages_checked_at
+    with _averages_lock:
+        _averages_checked_at = 0.0
+
+
+def _get_cached_averages() -> Dict[Tuple[str, bool, Optional[int]], Dict[str, Any]]:
+    """
+    All MARKET_AVERAGES documents keyed by price_key(), at most
+    Config.MARKET_AVERAGES_CACHE_TTL seconds stale. The collection holds one document
+    per (name, tier, shiny), so it is loaded in full once and then refreshed with the
+    documents whose `updated_at` passed the watermark; a full reload every
+    _AVERAGES_FULL_RELOAD_SECONDS also catches documents written without `updated_at`.
+    Refreshes publish a new dict, so the returned one is never modified afterwards.
+    """
+    global _averages_cache, _averages_watermark, _averages_loaded_at, _averages_checked_at
+
+    now = time.monotonic()
+    if now - _averages_checked_at < Config.MARKET_AVERAGES_CACHE_TTL:
+        return _averages_cache
+
+    with _averages_lock:
+        if now - _averages_checked_at < Config.MARKET_AVERAGES_CACHE_TTL:
+            return _averages_cache
+
+        averages_coll = get_collection(ColEnum.MARKET_AVERAGES)
+        full_reload = _averages_loaded_at is None or now - _averages_loaded_at >= _AVERAGES_FULL_RELOAD_SECONDS
+        if full_reload or _averages_watermark is None:
+            query: Dict[str, Any] = {}
+        else:
+            query = {'updated_at': {'$gte': _averages_watermark - _AVERAGES_WATERMARK_OVERLAP}}
+
+        docs = {}
+        for doc in averages_coll.find(query, _AVERAGES_CACHE_PROJECTION):
+            updated_at = doc.pop('updated_at', None)
+            if updated_at is not None and (_averages_watermark is None or updated_at > _averages_watermark):
+                _averages_watermark = updated_at
+            docs[(doc.get('name'), bool(doc.get('shiny')), doc.get('tier'))] = doc
+
+        # Copy-on-write: readers keep the dict they got, a reload never shows them a partial one
+        if full_reload:
+            _averages_cache = docs
+            _averages_loaded_at = now
+        elif docs:
+            _averages_cache = {**_averages_cache, **docs}
+        _averages_checked_at = now
+
+    return _averages_cache
+
+
+def get_trademarket_item_prices(
+        keys: Iterable[Tuple[str, bool, Optional[int]]]
+) -> Dict[Tuple[str, bool, Optional[int]], Dict[str, Any]]:
+    """
+    Batched get_trademarket_item_price(): resolve many (name, shiny, tier) keys with a
+    single query. Returns a dict keyed by price_key(); keys without statistics map to {}.
+    """
+    wanted = {price_key(*key) for key in keys}
+    if not wanted:
+        return {}
+
+    if Config.MARKET_AVERAGES_CACHE_TTL > 0:
+        cached = _get_cached_averages()
+        return {key: dict(cached.get(key, {})) for key in wanted}
+
+    prices: Dict[Tuple[str, bool, Optional[int]], Dict[str, Any]] = {key: {} for key in wanted}
+    clauses = [{'name': name, 'tier': tier, 'shiny': shiny} for name, shiny, tier in wanted]
+
+    for doc in get_collection(ColEnum.MARKET_AVERAGES).find({'$or': clauses}, _AVERAGES_PROJECTION):
+        key = (doc.get('name'), bool(doc.get('shiny')), doc.get('tier'))
+        if key in prices:
+            prices[key] = doc
+
+    return prices
+
+
+def _archive_window(
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
         default_days: int = 7
-) -> List[Dict[str, Any]]:
+) -> Tuple[datetime, datetime]:
     """
-    Retrieve the price history of an item over a given date range.
+    Normalize an archive date range to whole UTC days (both inclusive).
+    Without an end_date the window ends yesterday, the newest archived day;
+    without a start_date it spans `default_days` days before end_date.
     """
     lagged_now = datetime.now(timezone.utc) - timedelta(days=1)
 
-    # 2) If end_date wasn’t given, use lagged_now
-    end_date = end_date or lagged_now
+    end_date = _as_utc(end_date or lagged_now)
     end_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    # 3) If start_date wasn’t given, backfill to a full default_days window
-    start_date = start_date or (end_date - timedelta(days=default_days))
+    start_date = _as_utc(start_date) if start_date else (end_date - timedelta(days=default_days))
     start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    # 4) Inclusive end_date via half-open interval
-    exclusive_end = end_date + timedelta(days=1)
+    return start_date, end_date
+
 
-    query_filter: Dict[str, Any] = {
-        'name': {'$regex': f'^{re.escape(item_name)}$', '$options': 'i'},
+def _as_utc(value: datetime) -> datetime:
+    # Query dates are parsed without a timezone; archive timestamps are UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _item_archive_filter(item_name: str, shiny: bool, tier: Optional[int]) -> Dict[str, Any]:
+    # `name_key` is the normalized name (see modules/utils/search.py), so lookups ignore
+    # case and accents and still seek the (name_key, shiny, tier, timestamp) indexes
+    return {
+        'name_key': normalize_name(item_name),
         'shiny': shiny,
         '$or': [
             {'item_type': {'$nin': TIERED_TYPES}},
             {'item_type': {'$in': TIERED_TYPES}, 'tier': tier}
-        ],
-        'timestamp': {
-            '$gte': start_date,
-            '$lt': exclusive_end
-        }
+        ]
     }
 
-    cursor = get_collection(ColEnum.MARKET_ARCHIVE).find(
+
+# ─── ARCHIVE ROLLUPS ───────────────────────────────────────────────────────────
+# MARKET_ARCHIVE holds one document per item and day. The archive job keeps weekly
+# (ISO weeks, starting Monday) and monthly rollups of it with the same statistic
+# fields, so long history ranges read a few documents instead of one per day.
+# Prices are averaged over the days of the period like get_historic_average() does;
+# `sums`/`counts` keep the per-field totals so rollups can be combined exactly.
+
+_ROLLUP_AVG_FIELDS = [
+    'lowest_price', 'highest_price', 'average_price', 'average_mid_80_percent_price', 'p50_price',
+    'unidentified_lowest_price', 'unidentified_highest_price', 'unidentified_average_price',
+    'unidentified_average_mid_80_percent_price', 'unidentified_p50_price',
+]
+_ROLLUP_SUM_FIELDS = ['total_count', 'unidentified_count']
+_ROLLUP_LAST_FIELDS = ['average_p50_ema_price', 'unidentified_average_p50_ema_price', 'item_type', 'icon', 'name_key']
+
+# Internal fields never returned by the history endpoints
+_ARCHIVE_PROJECTION = {'_id': False, 'name_key': False}
+_ROLLUP_PROJECTION = {'_id': False, 'name_key': False, 'sums': False, 'counts': False}
+
+# Statistic fields a history request can be restricted to, and the metadata always returned with them
+HISTORY_FIELDS = _ROLLUP_AVG_FIELDS + _ROLLUP_SUM_FIELDS + [
+    'average_p50_ema_price', 'unidentified_average_p50_ema_price', 'document_count'
+]
+_HISTORY_METADATA_FIELDS = ['name', 'tier', 'shiny', 'item_type', 'icon', 'timestamp', 'period']
+
+PERIOD_DAY = 'day'
+PERIOD_WEEK = 'week'
+PERIOD_MONTH = 'month'
+
+
+def _week_start(day: datetime) -> datetime:
+    return day - timedelta(days=day.weekday())
+
+
+def _next_week(week: datetime) -> datetime:
+    return week + timedelta(days=7)
+
+
+def _month_start(day: datetime) -> datetime:
+    return day.replace(day=1)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+# period -> (collection, start of the period containing a day, start of the following period)
+_ROLLUPS = {
+    PERIOD_WEEK: (ColEnum.MARKET_ARCHIVE_WEEKLY, _week_start, _next_week),
+    PERIOD_MONTH: (ColEnum.MARKET_ARCHIVE_MONTHLY, _month_start, _next_month),
+}
+
+
+def _rollup_pipeline(period: str, period_start: datetime, period_end: datetime) -> List[Dict[str, Any]]:
+    collection = _ROLLUPS[period][0]
+    group: Dict[str, Any] = {
+        '_id': {'name': '$name', 'tier': '$tier', 'shiny': '$shiny'},
+        'document_count': {'$sum': 1},
+    }
+    for field in _ROLLUP_AVG_FIELDS:
+        group[f'sum_{field}'] = {'$sum': f'${field}'}
+        group[f'count_{field}'] = {'$sum': {'$cond': [{'$isNumber': f'${field}'}, 1, 0]}}
+    for field in _ROLLUP_SUM_FIELDS:
+        group[field] = {'$sum': f'${field}'}
+    for field in _ROLLUP_LAST_FIELDS:
+        group[field] = {'$last': f'${field}'}
+
+    project: Dict[str, Any] = {
+        '_id': {'name': '$_id.name', 'tier': '$_id.tier', 'shiny': '$_id.shiny',
+                'timestamp': {'$literal': period_start}},
+        'name': '$_id.name',
+        'tier': '$_id.tier',
+        'shiny': '$_id.shiny',
+        'timestamp': {'$literal': period_start},
+        'period': {'$literal': period},
+        'document_count': 1,
+        'sums': {field: f'$sum_{field}' for field in _ROLLUP_AVG_FIELDS},
+        'counts': {field: f'$count_{field}' for field in _ROLLUP_AVG_FIELDS},
+    }
+    for field in _ROLLUP_AVG_FIELDS:
+        project[field] = {'$cond': [
+            {'$gt': [f'$count_{field}', 0]},
+            {'$round': [{'$divide': [f'$sum_{field}', f'$count_{field}']}, 2]},
+            None
+        ]}
+    for field in _ROLLUP_SUM_FIELDS + _ROLLUP_LAST_FIELDS:
+        project[field] = 1
+
+    return [
+        {'$match': {'timestamp': {'$gte': period_start, '$lt': period_end}}},
+        {'$sort': {'timestamp': 1}},
+        {'$group': group},
+        {'$project': project},
+        {'$merge': {'into': collection.value, 'on': '_id', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ]
+
+
+def rebuild_archive_rollup(period: str, day: datetime) -> datetime:
+    """
+    Rebuild the PERIOD_WEEK/PERIOD_MONTH rollups of the period containing `day` from
+    MARKET_ARCHIVE (all items at once, via $merge). Returns the start of the next period.
+    """
+    _, period_start, next_period = _ROLLUPS[period]
+    start = period_start(_as_utc(day).replace(hour=0, minute=0, second=0, microsecond=0))
+    end = next_period(start)
+    get_collection(ColEnum.MARKET_ARCHIVE).aggregate(_rollup_pipeline(period, start, end), allowDiskUse=True)
+    return end
+
+
+def update_archive_rollups(day: datetime) -> None:
+    """
+    Rebuild the weekly and monthly rollups containing `day`.
+    Called by the archive job after it wrote that day.
+    """
+    for period in _ROLLUPS:
+        rebuild_archive_rollup(period, day)
+
+
+def _history_period(days: int, max_points: int) -> str:
+    """The finest granularity that shows `days` days in at most `max_points` points."""
+    if days <= max_points:
+        return PERIOD_DAY
+    if math.ceil(days / 7) <= max_points:
+        return PERIOD_WEEK
+    return PERIOD_MONTH
+
+
+def get_price_history(
+        item_name: str,
+        shiny: bool = False,
+        tier: Optional[int] = None,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        default_days: int = 7,
+        max_points: Optional[int] = None,
+        fields: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve the price history of an item over a given date range.
+    Ranges longer than `max_points` days (default Config.HISTORY_MAX_POINTS) are
+    served from the weekly or monthly rollups; those points carry a `period` field
+    and cover the whole week/month they start in.
+    With `fields` (a subset of HISTORY_FIELDS) only those statistics and the item
+    metadata are fetched.
+    """
+    start_date, end_date = _archive_window(start_date, end_date, default_days)
+
+    # Inclusive end_date via half-open interval
+    exclusive_end = end_date + timedelta(days=1)
+
+    period = _history_period((exclusive_end - start_date).days, max_points or Config.HISTORY_MAX_POINTS)
+    if period == PERIOD_DAY:
+        collection, projection = ColEnum.MARKET_ARCHIVE, _ARCHIVE_PROJECTION
+    else:
+        collection, period_start, _ = _ROLLUPS[period]
+        start_date, projection = period_start(start_date), _ROLLUP_PROJECTION
+
+    if fields is not None:
+        projection = {'_id': False, **{field: True for field in _HISTORY_METADATA_FIELDS + list(fields)}}
+
+    query_filter = _item_archive_filter(item_name, shiny, tier)
+    query_filter['timestamp'] = {
+        '$gte': start_date,
+        '$lt': exclusive_end
+    }
+
+    cursor = get_collection(collection).find(
         filter=query_filter,
         sort=[('timestamp', 1)],
-        projection={'_id': 0}
+        projection=projection
     )
     return list(cursor)
 
 
+def _rollup_segments(
+        start: datetime,
+        end: datetime,
+        periods: Tuple[str, ...] = (PERIOD_MONTH, PERIOD_WEEK)
+) -> List[Tuple[str, datetime, datetime]]:
+    """
+    Split the half-open day range [start, end) into (period, start, end) segments:
+    whole months, then whole weeks of the remainder, then single days.
+    """
+    if start >= end:
+        return []
+    if not periods:
+        return [(PERIOD_DAY, start, end)]
+
+    period, rest = periods[0], periods[1:]
+    _, period_start, next_period = _ROLLUPS[period]
+
+    first = period_start(start)
+    if first < start:
+        first = next_period(first)
+    last = period_start(end)
+    if first >= last:
+        return _rollup_segments(start, end, rest)
+
+    return (_rollup_segments(start, first, rest)
+            + [(period, first, last)]
+            + _rollup_segments(last, end, rest))
+
+
 def get_historic_average(
         item_name: str,
         shiny: bool = False,
@@ -665,92 +1185,77 @@ def get_historic_average(
     If neither start_date nor end_date is provided, uses the last `default_days`.
     If only one is provided, fills the other to span a `default_days` window
     (or up to now for the end).
+    Whole months and weeks of the range are read from the rollups and only the
+    remaining days from MARKET_ARCHIVE, so the cost does not grow with the range.
     """
-    # 1) Shift “now” back by default_days once
-    lagged_now = datetime.now(timezone.utc) - timedelta(days=1)
-
-    # 2) If end_date wasn’t given, use lagged_now
-    end_date = end_date or lagged_now
-    end_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date, end_date = _archive_window(start_date, end_date, default_days)
 
-    # 3) If start_date wasn’t given, backfill to a full default_days window
-    start_date = start_date or (end_date - timedelta(days=default_days))
-    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # 4) Inclusive end_date via half-open interval
+    # Inclusive end_date via half-open interval
     exclusive_end = end_date + timedelta(days=1)
 
-    # base query
-    query: Dict[str, Any] = {
-        'name': item_name,
-        'shiny': shiny,
-        '$or': [
-            {'item_type': {'$nin': TIERED_TYPES}},
-            {'item_type': {'$in': TIERED_TYPES}, 'tier': tier}
-        ],
-        'timestamp': {
-            '$gte': start_date,
-            '$lt': exclusive_end
-        }
-    }
-
-    pipeline = [
-        {'$match': query},
+    ranges: Dict[str, List[Dict[str, Any]]] = {}
+    for period, segment_start, segment_end in _rollup_segments(start_date, exclusive_end):
+        ranges.setdefault(period, []).append({'timestamp': {'$gte': segment_start, '$lt': segment_end}})
 
-        {'$sort': {'timestamp': 1}},
+    docs: List[Dict[str, Any]] = []
+    for period, timestamp_ranges in ranges.items():
+        collection = ColEnum.MARKET_ARCHIVE if period == PERIOD_DAY else _ROLLUPS[period][0]
+        query = {'$and': [_item_archive_filter(item_name, shiny, tier), {'$or': timestamp_ranges}]}
+        docs.extend(get_collection(collection).find(query, {'_id': 0, 'name_key': 0}))
 
-        {'$group': {
-            '_id': None,
-            'name': {'$first': '$name'},
-            'tier': {'$first': '$tier'},
-            'document_count': {'$sum': 1},
+    return _combine_archive_docs(docs)
 
-            # averages over the matched docs
-            'lowest_price': {'$avg': '$lowest_price'},
-            'highest_price': {'$avg': '$highest_price'},
-            'average_price': {'$avg': '$average_price'},
 
-            'total_count': {'$sum': '$total_count'},
-            'avg_mid80': {'$avg': '$average_mid_80_percent_price'},
-            'unidentified_avg': {'$avg': '$unidentified_average_price'},
-            'unidentified_mid80_avg': {'$avg': '$unidentified_average_mid_80_percent_price'},
-            'unidentified_count': {'$sum': '$unidentified_count'},
-            'avg_p50': {'$avg': '$p50_price'},
-            'unidentified_avg_p50': {'$avg': '$unidentified_p50_price'},
-            'average_p50_ema_price': {'$last': '$average_p50_ema_price'},
-            'unidentified_average_p50_ema_price': {
-                '$last': '$unidentified_average_p50_ema_price'
-            },
-        }},
-        {'$project': {
-            '_id': 0,
-            'name': 1,
-            'tier': 1,
-            'document_count': 1,
-            'lowest_price': {'$round': ['$lowest_price', 2]},
-            'highest_price': {'$round': ['$highest_price', 2]},
-            'average_price': {'$round': ['$average_price', 2]},
-            'total_count': {'$toInt': '$total_count'},
-            'average_mid_80_percent_price': {'$round': ['$avg_mid80', 2]},
-            'unidentified_average_price': {'$round': ['$unidentified_avg', 2]},
-            'unidentified_average_mid_80_percent_price': {'$round': ['$unidentified_mid80_avg', 2]},
-            'unidentified_count': {'$toInt': '$unidentified_count'},
-            'p50_price': {'$round': ['$avg_p50', 2]},
-            'unidentified_p50_price': {'$round': ['$unidentified_avg_p50', 2]},
-            'average_p50_ema_price': {
-                '$round': ['$average_p50_ema_price', 2]
-            },
-            'unidentified_average_p50_ema_price': {
-                '$round': ['$unidentified_average_p50_ema_price', 2]
-            },
-        }}
-    ]
+def _combine_archive_docs(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Average daily snapshots and rollups of one item as if every day was averaged individually."""
+    if not docs:
+        return {}
+    docs.sort(key=lambda doc: doc['timestamp'])
+
+    sums = dict.fromkeys(_ROLLUP_AVG_FIELDS, 0.0)
+    counts = dict.fromkeys(_ROLLUP_AVG_FIELDS, 0)
+    totals = dict.fromkeys(_ROLLUP_SUM_FIELDS, 0)
+    document_count = 0
+    for doc in docs:
+        if 'period' in doc:
+            document_count += doc['document_count']
+            for field in _ROLLUP_AVG_FIELDS:
+                sums[field] += doc['sums'][field]
+                counts[field] += doc['counts'][field]
+        else:
+            document_count += 1
+            for field in _ROLLUP_AVG_FIELDS:
+                value = doc.get(field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    sums[field] += value
+                    counts[field] += 1
+        for field in _ROLLUP_SUM_FIELDS:
+            totals[field] += doc.get(field) or 0
+
+    def average(field: str) -> Optional[float]:
+        return round(sums[field] / counts[field], 2) if counts[field] else None
+
+    def last(field: str) -> Optional[float]:
+        value = docs[-1].get(field)
+        return round(value, 2) if value is not None else None
 
-    result = list(
-        get_collection(ColEnum.MARKET_ARCHIVE)
-        .aggregate(pipeline, allowDiskUse=False)
-    )
-    return result[0] if result else {}
+    return {
+        'name': docs[0]['name'],
+        'tier': docs[0].get('tier'),
+        'document_count': document_count,
+        'lowest_price': average('lowest_price'),
+        'highest_price': average('highest_price'),
+        'average_price': average('average_price'),
+        'total_count': int(totals['total_count']),
+        'average_mid_80_percent_price': average('average_mid_80_percent_price'),
+        'unidentified_average_price': average('unidentified_average_price'),
+        'unidentified_average_mid_80_percent_price': average('unidentified_average_mid_80_percent_price'),
+        'unidentified_count': int(totals['unidentified_count']),
+        'p50_price': average('p50_price'),
+        'unidentified_p50_price': average('unidentified_p50_price'),
+        'average_p50_ema_price': last('average_p50_ema_price'),
+        'unidentified_average_p50_ema_price': last('unidentified_average_p50_ema_price'),
+    }
 
 
 def get_all_items_ranking(
@@ -763,19 +1268,9 @@ def get_all_items_ranking(
     automatically lagged by `default_days + 1` so the latest
     document is always `default_days` days in the past.
     """
+    start_date, end_date = _archive_window(start_date, end_date, default_days)
 
-    # 1) Shift “now” back by default_days once
-    lagged_now = datetime.now(timezone.utc) - timedelta(days=1)
-
-    # 2) If end_date wasn’t given, use lagged_now
-    end_date = end_date or lagged_now
-    end_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # 3) If start_date wasn’t given, backfill to a full default_days window
-    start_date = start_date or (end_date - timedelta(days=default_days))
-    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # 4) Inclusive end_date via half-open interval
+    # Inclusive end_date via half-open interval
     exclusive_end = end_date + timedelta(days=1)
 
     date_filter: Dict[str, Any] = {
@@ -828,3 +1323,99 @@ def get_all_items_ranking(
         ranked.append(item)
 
     return ranked
+
+
+def _ranking_snapshot_id(start_date: datetime, end_date: datetime) -> str:
+    return f"{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}"
+
+
+def _ranking_etag(items: List[Dict[str, Any]]) -> str:
+    return hashlib.sha1(json_util.dumps(items).encode('utf-8')).hexdigest()
+
+
+def save_ranking_snapshot(
+        start_date: datetime,
+        end_date: datetime,
+        items: List[Dict[str, Any]],
+        expires_at: datetime
+) -> Dict[str, Any]:
+    """
+    Store the ranking of a (normalized) date range together with an ETag of its items.
+    Snapshots are removed by the TTL index on `expires_at`.
+    """
+    snapshot = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'items': items,
+        'etag': _ranking_etag(items),
+        'computed_at': datetime.now(timezone.utc),
+        'expires_at': expires_at,
+    }
+    get_collection(ColEnum.MARKET_RANKING).replace_one(
+        {'_id': _ranking_snapshot_id(start_date, end_date)}, snapshot, upsert=True
+    )
+    return snapshot
+
+
+def get_ranking_snapshot(
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """
+    Return the ranking snapshot of a date range ({start_date, end_date, items, etag, ...}).
+    Only the default window is stored in MARKET_RANKING (written by the nightly archive job);
+    any other range is computed on first request and cached in this process for
+    Config.MARKET_RANKING_CACHE_TTL seconds. Ranges longer than Config.MARKET_RANKING_MAX_DAYS
+    or ending before they start raise ValueError.
+    """
+    start_date, end_date = _archive_window(start_date, end_date)
+    if end_date < start_date:
+        raise ValueError("start_date must not be after end_date")
+    if (end_date - start_date).days + 1 > Config.MARKET_RANKING_MAX_DAYS:
+        raise ValueError(f"Ranking ranges are limited to {Config.MARKET_RANKING_MAX_DAYS} days")
+
+    snapshot_id = _ranking_snapshot_id(start_date, end_date)
+    if (start_date, end_date) == _archive_window():
+        snapshot = get_collection(ColEnum.MARKET_RANKING).find_one(
+            {'_id': snapshot_id, 'expires_at': {'$gt': datetime.now(timezone.utc)}},
+            {'_id': False}
+        )
+        if snapshot is not None:
+            return snapshot
+
+        # The archive job has not stored today's window yet
+        items = get_all_items_ranking(start_date=start_date, end_date=end_date)
+        return save_ranking_snapshot(
+            start_date, end_date, items, datetime.now(timezone.utc) + _RANKING_SNAPSHOT_RETENTION
+        )
+
+    snapshot = _ranking_cache.get(snapshot_id)
+    if snapshot is not None:
+        return snapshot
+
+    items = get_all_items_ranking(start_date=start_date, end_date=end_date)
+    snapshot = {'start_date': start_date, 'end_date': end_date, 'items': items, 'etag': _ranking_etag(items)}
+    if Config.MARKET_RANKING_CACHE_TTL > 0:
+        _ranking_cache.set(snapshot_id, snapshot, Config.MARKET_RANKING_CACHE_TTL)
+    return snapshot
+
+
+def refresh_ranking_snapshots(archived_day: datetime) -> Dict[str, Any]:
+    """
+    Called after `archived_day` was written to MARKET_ARCHIVE: drops every stored
+    ranking whose range covers that day and precomputes the default window.
+    Custom ranges cached by other processes expire after Config.MARKET_RANKING_CACHE_TTL.
+    """
+    archived_day = archived_day.replace(hour=0, minute=0, second=0, microsecond=0)
+    _ranking_cache.clear()
+    deleted = get_collection(ColEnum.MARKET_RANKING).delete_many({
+        'start_date': {'$lte': archived_day},
+        'end_date': {'$gte': archived_day}
+    })
+    logging.info(f"Dropped {deleted.deleted_count} ranking snapshots covering {archived_day.date()}")
+
+    start_date, end_date = _archive_window()
+    items = get_all_items_ranking(start_date=start_date, end_date=end_date)
+    return save_ranking_snapshot(
+        start_date, end_date, items, datetime.now(timezone.utc) + _RANKING_SNAPSHOT_RETENTION
+    )
@@ -1,17 +1,18 @@
 import logging
 import time
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 UTC = timezone.utc
 
+from pymongo.errors import DuplicateKeyError
+
 from modules.db import get_collection
 from modules.models.collection_types import Collection
-from modules.repositories.base_pool_repo import BasePoolRepo, build_pool_pipeline
-from modules.utils.time_validation import get_raidpool_week, get_current_gambit_day, parse_utc_timestamp
-
-# Initialize the base repository and aggregator with the RAID collection type
-_repo = BasePoolRepo(Collection.RAID)
+from modules.repositories.base_pool_repo import (
+    BasePoolRepo, build_pool_pipeline, replace_pool_pipeline, strip_merge_fields, POOL_VIEW_ITEMS
+)
+from modules.utils.time_validation import get_current_gambit_day, parse_utc_timestamp
 
 
 def save(pool: dict) -> None:
@@ -75,34 +76,13 @@ def save_gambits(gambits: List[Dict]) -> None:
     gambit_day["day"] = next_reset.day
     gambit_day["gambits"] = valid_gambits
 
-    existing = collection.find_one(filter_q)
-    if existing:
-        existing_ts = existing.get("timestamp")
-        if existing_ts is None:
-            # If somehow missing, treat as replaceable
-            existing_ts = datetime.fromtimestamp(0, tz=UTC)
-
-        if not hasattr(existing_ts, 'tzinfo'):
-            raise TypeError(f"Existing timestamp is not a datetime: {type(existing_ts)!r}")
-
-        if existing_ts.tzinfo is None:
-            # strict: do not silently assume UTC
-            raise ValueError("Existing document has naive 'timestamp' (must be UTC-aware)")
-
-        existing_ts = existing_ts.astimezone(UTC)
-
-        existing_ts_age = datetime.now(UTC) - existing_ts
-
-        existing_gambits = existing.get("gambits", [])
-        has_more = len(gambits) > len(existing_gambits)
-        has_enough_and_stale = existing_ts_age > timedelta(hours=1) and len(gambits) >= len(existing_gambits)
-
-        if has_more or has_enough_and_stale:
-            collection.delete_one(filter_q)
-            collection.insert_one(gambit_day)
-    else:
-        collection.insert_one(gambit_day)
-
+    # Same replacement rule as pool regions: more gambits, or stale by 1h with at least as many
+    update = replace_pool_pipeline(gambit_day, datetime.now(UTC) - timedelta(hours=1), items_field="gambits")
+    try:
+        collection.update_one(filter_q, update, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent upload inserted the day first; the rule now applies to its document
+        collection.update_one(filter_q, update, upsert=True)
 
 
 def fetch_raidpools(
@@ -127,11 +107,7 @@ def fetch_raidpools(
 
     # 1) Single‐object case
     if year is not None and week is not None:
-        cursor = coll.aggregate(pipeline)
-        try:
-            return cursor.next()
-        except StopIteration:
-            return {}
+        return _repo.fetch_week(year, week)
 
     paged_pipeline = pipeline + [
         {"$skip": skip},
@@ -150,9 +126,12 @@ def fetch_raidpools(
 
 
 # OLD GROUPED FORMAT
-def fetch_raidpool():
-    year, week = get_raidpool_week()
-    pipeline = [
+def build_raidpool_pipeline(year: int, week: int) -> List[Dict]:
+    """
+    Pipeline producing the processed raidpool items of a week/year,
+    grouped by region and item group, sorted by group and rarity.
+    """
+    return [
         # Match documents for the given week and year
         {
             "$match": {
@@ -160,6 +139,8 @@ def fetch_raidpool():
                 "year": year
             }
         },
+        # Drop the merge bookkeeping (item keys and submitter ids), it is never served
+        strip_merge_fields(),
         # Add 'group', 'rarityFormatted', and 'rarityLower' fields to each item
         {
             "$addFields": {
@@ -432,8 +413,26 @@ def fetch_raidpool():
         }
     ]
 
-    cursor = get_collection(Collection.RAID).aggregate(pipeline)
-    return list(cursor)
+
+# Initialize the base repository and aggregator with the RAID collection type
+_repo = BasePoolRepo(Collection.RAID, Collection.RAID_RENDERED, build_raidpool_pipeline)
+
+
+def fetch_raidpool() -> List[dict]:
+    """
+    Retrieve the processed raidpool items for the current week/year,
+    as rendered when the week's regions were last saved.
+    """
+    regions, _ = _repo.fetch_current(POOL_VIEW_ITEMS)
+    return regions
+
+
+def fetch_current(view: str) -> Tuple[Any, str]:
+    """
+    A view of the current week's raidpool (POOL_VIEW_ITEMS or POOL_VIEW_CURRENT) and its ETag,
+    from the per-process pool cache.
+    """
+    return _repo.fetch_current(view)
 
 
 def fetch_gambits(
@@ -5,9 +5,11 @@ from flask import Blueprint, g, request
 
 from modules.auth import require_scope, mod_allowed
 from modules.models.collection_types import Collection
+from modules.repositories.base_pool_repo import POOL_VIEW_ITEMS, POOL_VIEW_CURRENT
 from modules.services import base_pool_service
-from modules.utils.param_utils import api_response, handle_request_error
-from modules.utils.time_validation import get_lootpool_week, get_raidpool_week, is_in_reset_window
+from modules.utils.param_utils import api_response, conditional_response, handle_request_error
+from modules.utils.queue_worker import QueueFullError
+from modules.utils.time_validation import is_in_reset_window
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +57,8 @@ class BasePoolBlueprint:
             try:
                 base_pool_service.save(collection_type=collection_type, raw_data=data)
                 return api_response({'message': 'Items received successfully'})
+            except QueueFullError as qe:
+                return handle_request_error(qe, error_msg="Ingest queue is full, try again later", status_code=503)
             except ValueError as ve:
                 return handle_request_error(ve, error_msg="Validation error while processing items", status_code=400)
             except Exception as e:
@@ -66,10 +70,11 @@ class BasePoolBlueprint:
             """
             GET /api/{name}/items
             Retrieve the processed pool items for the current week.
+            Supports If-None-Match (304).
             """
             try:
-                items = base_pool_service.get_current_pools(self.collection_type)
-                return api_response(items)
+                items, etag = base_pool_service.get_current_pool_view(self.collection_type, POOL_VIEW_ITEMS)
+                return conditional_response(items, etag)
             except Exception as e:
                 return handle_request_error(e)
 
@@ -80,14 +85,12 @@ class BasePoolBlueprint:
             """
             GET /api/{name}/current
             Retrieve the pools for the current week.
+            Supports If-None-Match (304).
             """
             try:
-                if self.collection_type == Collection.LOOT:
-                    year, week = get_lootpool_week()
-                    return get_specific_pool(year, week)
-                elif self.collection_type == Collection.RAID:
-                    year, week = get_raidpool_week()
-                    return get_specific_pool(year, week)
+                if self.collection_type in (Collection.LOOT, Collection.RAID):
+                    pool, etag = base_pool_service.get_current_pool_view(self.collection_type, POOL_VIEW_CURRENT)
+                    return conditional_response(pool, etag)
 
                 return api_response({'message': 'No data found'}, 404)
             except Exception as e:
@@ -1,11 +1,15 @@
 from flask import Blueprint, request
+from pydantic import ValidationError
 
 from modules.auth import require_scope, public_endpoint, mod_allowed
-from modules.services.market_service import save_items, get_price, get_item_listings, get_history, \
+from modules.repositories.market_repo import HISTORY_FIELDS, price_key
+from modules.schemas.price_request import PriceBatchRequest
+from modules.services.market_service import save_items, get_price, get_prices, get_item_listings, get_history, \
     get_historic_item_price, \
-    get_ranking
+    get_ranking, to_columnar_history, HISTORY_FORMAT_DOCUMENTS, HISTORY_FORMAT_COLUMNAR, DEFAULT_COLUMNAR_FIELDS
 from modules.utils.param_utils import api_response, parse_boolean_param, parse_tier_param, parse_date_params
-from modules.utils.param_utils import handle_request_error
+from modules.utils.param_utils import conditional_response, handle_request_error
+from modules.utils.queue_worker import QueueFullError
 
 market_bp = Blueprint('market', __name__, url_prefix='/api')
 
@@ -27,6 +31,8 @@ def save_trade_market_items():
         # Log the number of items and a sample of the data for debugging
         save_items(data)
         return api_response({'message': 'Items received successfully'})
+    except QueueFullError as qe:
+        return handle_request_error(qe, "Ingest queue is full, try again later", 503)
     except ValueError as ve:
         return handle_request_error(ve, "Validation error while processing items", 400)
     except Exception as e:
@@ -55,6 +61,7 @@ def get_market_item_info(item_name):
     type_param = request.args.get('itemType')
     subtype_param = request.args.get('subType', type=str)
     sort_option = request.args.get('sort')
+    cursor = request.args.get('cursor', None, type=str)
 
     try:
         result = get_item_listings(
@@ -68,9 +75,12 @@ def get_market_item_info(item_name):
             sort_option=sort_option,
             page=page,
             page_size=page_size,
+            cursor=cursor,
         )
 
         return api_response(result)
+    except ValueError as ve:
+        return handle_request_error(ve, "Invalid sort or cursor", 400)
     except Exception as e:
         return handle_request_error(e)
 
@@ -99,13 +109,39 @@ def get_market_item_price_info(item_name):
         return handle_request_error(e)
 
 
+@market_bp.post('/trademarket/items/prices')
+@require_scope('read:market')
+@mod_allowed
+def get_market_item_prices():
+    """
+    POST /api/trademarket/items/prices
+    Retrieve price statistics for many items at once.
+    Body: [{"name": str, "tier": int | null, "shiny": bool}, ...]
+    Returns one result per requested item, in request order ({} if unknown).
+    """
+    try:
+        req = PriceBatchRequest.model_validate(request.get_json(silent=True))
+    except ValidationError as ve:
+        return handle_request_error(ve, error_msg="Validation error while processing items", status_code=400)
+
+    try:
+        keys = [price_key(item.name, item.shiny, item.tier) for item in req.root]
+        prices = get_prices(keys)
+        return api_response([prices.get(key, {}) for key in keys])
+    except Exception as e:
+        return handle_request_error(e)
+
+
 @market_bp.get('/trademarket/history/<item_name>')
 @public_endpoint
 def get_market_history(item_name):
     """
-    GET /api/trademarket/history/<item_name>?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD
+    GET /api/trademarket/history/<item_name>?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD&max_points=N
+        &format=documents|columnar&fields=p50_price,...
     Retrieve price history for an item over a date range (inclusive).
     If no dates are provided, returns the past 7 days.
+    Ranges longer than max_points days are returned as weekly or monthly points.
+    format=columnar returns parallel arrays of the requested fields instead of one document per point.
     """
     if not item_name:
         return api_response({'message': 'No item name provided'}, 400)
@@ -125,15 +161,35 @@ def get_market_history(item_name):
     # Parse tier parameter
     tier = parse_tier_param(request.args.get('tier'))
 
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None:
+        max_points = max(1, max_points)
+
+    response_format = request.args.get('format', HISTORY_FORMAT_DOCUMENTS)
+    if response_format not in (HISTORY_FORMAT_DOCUMENTS, HISTORY_FORMAT_COLUMNAR):
+        return api_response({'error': f"Invalid format. Use '{HISTORY_FORMAT_DOCUMENTS}' or '{HISTORY_FORMAT_COLUMNAR}'."}, 400)
+
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        if not fields or any(field not in HISTORY_FIELDS for field in fields):
+            return api_response({'error': f"Invalid fields. Valid fields: {', '.join(HISTORY_FIELDS)}"}, 400)
+    elif response_format == HISTORY_FORMAT_COLUMNAR:
+        fields = DEFAULT_COLUMNAR_FIELDS
+
     try:
         result = get_history(
             item_name=item_name,
             shiny=shiny,
             tier=tier,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            max_points=max_points,
+            fields=fields
         )
 
+        if response_format == HISTORY_FORMAT_COLUMNAR:
+            return api_response(to_columnar_history(result, fields))
         return api_response(result)
     except Exception as e:
         return handle_request_error(e)
@@ -184,7 +240,8 @@ def get_latest_market_history(item_name):
 def get_all_items_ranking_endpoint():
     """
     GET /api/trademarket/ranking?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD
-    Retrieve a ranking of items by average price, optionally restricted to a date range.
+    Retrieve a ranking of items by average price, optionally restricted to a date range
+    of at most MARKET_RANKING_MAX_DAYS days.
     """
     # Parse date parameters
     start_date, end_date, date_error = parse_date_params(
@@ -197,6 +254,8 @@ def get_all_items_ranking_endpoint():
 
     try:
         ranking = get_ranking(start_date=start_date, end_date=end_date)
-        return api_response(ranking)
+        return conditional_response(ranking['items'], ranking['etag'])
+    except ValueError as ve:
+        return handle_request_error(ve, "Invalid date range", 400)
     except Exception as e:
         return handle_request_error(e)
@@ -0,0 +1,63 @@
+import os
+import time
+
+from flask import Blueprint, Response
+
+from modules.auth import require_scope
+from modules.utils.param_utils import handle_request_error
+from modules.utils.query_profiler import profiler
+from modules.utils.queue_worker import get_queue_metrics
+
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/internal')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Every Gunicorn worker keeps its own counters and a scrape reaches a random one, so each
+# sample is labelled with the worker's pid: its series only grow, and restarts show as new pids
+_PROCESS_START_TIME = time.time()
+
+# get_queue_metrics() field -> (metric name, type, help)
+_QUEUE_METRICS = {
+    'depth': ('ingest_queue_depth', 'gauge', 'Requests waiting in the ingest queue partition.'),
+    'max_depth': ('ingest_queue_max_depth', 'gauge', 'Capacity of the ingest queue partition.'),
+    'enqueued': ('ingest_queue_enqueued_total', 'counter', 'Requests accepted by the partition.'),
+    'processed': ('ingest_queue_processed_total', 'counter', 'Requests handled by the partition worker.'),
+    'dropped': ('ingest_queue_dropped_total', 'counter', 'Requests evicted by the drop_oldest policy.'),
+    'rejected': ('ingest_queue_rejected_total', 'counter', 'Requests refused because the partition was full.'),
+    'lag_seconds': ('ingest_queue_lag_seconds', 'gauge', 'Age of the oldest waiting request.'),
+    'last_lag_seconds': ('ingest_queue_last_lag_seconds', 'gauge', 'Queue wait of the last processed request.'),
+}
+
+
+def _process_metric_lines(pid: int) -> list:
+    return [
+        '# HELP process_start_time_seconds Start time of the worker process since the epoch.',
+        '# TYPE process_start_time_seconds gauge',
+        f'process_start_time_seconds{{pid="{pid}"}} {_PROCESS_START_TIME:.3f}',
+    ]
+
+
+def _queue_metric_lines(pid: int) -> list:
+    partitions = get_queue_metrics()
+    lines = []
+    for field, (name, metric_type, help_text) in _QUEUE_METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+        lines += [f'{name}{{pid="{pid}",partition="{partition["partition"]}"}} {partition[field]}'
+                  for partition in partitions]
+    return lines
+
+
+@metrics_bp.get('/metrics')
+@require_scope('read:metrics')
+def get_internal_metrics():
+    """
+    GET /internal/metrics
+    Query profiling and ingest queue metrics of the serving worker process in the
+    Prometheus text format, every sample labelled with the worker's pid.
+    """
+    try:
+        pid = os.getpid()
+        lines = _process_metric_lines(pid) + profiler.render_prometheus({'pid': pid}) + _queue_metric_lines(pid)
+        return Response('\n'.join(lines) + '\n', content_type=PROMETHEUS_CONTENT_TYPE)
+    except Exception as e:
+        return handle_request_error(e)
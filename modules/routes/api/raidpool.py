@@ -8,6 +8,7 @@ from modules.routes.api.base_pool_blueprint import BasePoolBlueprint
 from modules.services import raidpool_service
 from modules.services.raidpool_service import save_gambits
 from modules.utils.param_utils import api_response, handle_request_error
+from modules.utils.queue_worker import QueueFullError
 
 logging.basicConfig(
     level=logging.INFO,
@@ -38,6 +39,8 @@ def save_gambit_items():
     try:
         save_gambits(data)
         return api_response({'message': 'Gambits received successfully'})
+    except QueueFullError as qe:
+        return handle_request_error(qe, error_msg="Ingest queue is full, try again later", status_code=503)
     except ValueError as ve:
         return handle_request_error(ve, error_msg="Validation error while processing gambits ", status_code=400)
     except Exception as e:
@@ -4,7 +4,7 @@ from flask import Blueprint, render_template, jsonify, request
 
 from modules.models.collection_types import Collection
 from modules.models.sort_options import SortOption
-from modules.repositories.market_repo import TIERED_TYPES
+from modules.repositories.market_repo import TIERED_TYPES, price_key
 from modules.services import base_pool_service, market_service, raidpool_service
 from modules.utils.time_validation import get_week_range
 
@@ -221,20 +221,14 @@ def build_icon_url(icon: dict) -> str | None:
 
 
 def enrich_listings(listings: list[dict]) -> list[dict]:
-    for item in listings:
-        item["icon_url"] = build_icon_url(item.get("icon"))
-        name: str = item.get("name")
-        shiny: bool = (item.get("shiny_stat") is not None)
-        tier: int | None = None
-
-        raw_tier = item.get("tier")
-        if raw_tier is not None:
-            try:
-                tier: int = int(raw_tier)
-            except (ValueError, TypeError):
-                raise TypeError(f"Expected 'tier' to be int‐castable, but got {raw_tier!r}")
+    # Resolve the prices of all distinct items on the page with a single query
+    keys = [price_key(item.get("name"), item.get("shiny_stat") is not None, _listing_tier(item))
+            for item in listings]
+    prices = market_service.get_prices(keys)
 
-        item["price_averages"] = market_service.get_price(item_name=name, shiny=shiny, tier=tier)
+    for item, key in zip(listings, keys):
+        item["icon_url"] = build_icon_url(item.get("icon"))
+        item["price_averages"] = prices.get(key, {})
 
         fixed_stats = []  # statRange.fixed == True   → always-same value
         rolled_stats = []  # statRange.fixed == False  → can roll
@@ -248,6 +242,16 @@ def enrich_listings(listings: list[dict]) -> list[dict]:
     return listings
 
 
+def _listing_tier(item: dict) -> int | None:
+    raw_tier = item.get("tier")
+    if raw_tier is None:
+        return None
+    try:
+        return int(raw_tier)
+    except (ValueError, TypeError):
+        raise TypeError(f"Expected 'tier' to be int‐castable, but got {raw_tier!r}")
+
+
 def enrich_pools(raw_pools: list[dict], items_key: str) -> list[dict]:
     """
     Adds 'last_updated', 'icon_url', and optionally 'raid_full_name' to each pool.
@@ -0,0 +1,16 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, RootModel
+
+# Upper bound on the number of items per bulk price request
+MAX_PRICE_ITEMS = 1000
+
+
+class PriceKey(BaseModel):
+    name: str = Field(min_length=1)
+    tier: Optional[int] = None
+    shiny: bool = False
+
+
+class PriceBatchRequest(RootModel[List[PriceKey]]):
+    root: List[PriceKey] = Field(min_length=1, max_length=MAX_PRICE_ITEMS)
@@ -1,10 +1,11 @@
 import logging
-from typing import Any, Dict, List, Union, Optional
+from typing import Any, Dict, List, Tuple, Union, Optional
 
 from modules.config import Config
 from modules.models.collection_request import CollectionRequest
 from modules.models.collection_types import Collection
 from modules.repositories import lootpool_repo, raidpool_repo
+from modules.repositories.base_pool_repo import pool_submitter_id
 from modules.utils.queue_worker import enqueue
 from modules.utils.time_validation import is_time_valid
 from modules.utils.version import compare_versions
@@ -39,6 +40,16 @@ def save(collection_type: Collection, raw_data: Union[Dict[str, Any], List[Dict[
         #     logging.warning(f"Lootpool contains too many Mythic AspectItems ({mythic_aspect_count}) at index {idx}; skipping")
         #     continue
 
+        # Only a hash of the submitting player is kept, to count distinct confirmations per item
+        player_name = region.pop('playerName', None) or next(
+            (item.get('playerName') for item in loot_items if item.get('playerName')), None
+        )
+
+        if not player_name:
+            # Every submission needs a distinct player to count as a confirmation
+            logging.warning(f"Region at index {idx} has no player name; skipping")
+            continue
+
         valid_loot_items = []
 
         for idx, item in enumerate(loot_items):
@@ -58,6 +69,7 @@ def save(collection_type: Collection, raw_data: Union[Dict[str, Any], List[Dict[
             continue
 
         region['items'] = valid_loot_items
+        region['submitter'] = pool_submitter_id(player_name)
         valid_regions.append(region)
 
     # Enqueue all valid items at once
@@ -74,6 +86,19 @@ def get_current_pools(collection_type: Collection) -> List[Dict[str, Any]]:
     return []
 
 
+def get_current_pool_view(collection_type: Collection, view: str) -> Tuple[Any, str]:
+    """
+    A view of the current week's pool (POOL_VIEW_ITEMS or POOL_VIEW_CURRENT)
+    and its ETag, served from the per-process pool cache.
+    """
+    if collection_type == Collection.LOOT:
+        return lootpool_repo.fetch_current(view)
+    elif collection_type == Collection.RAID:
+        return raidpool_repo.fetch_current(view)
+
+    raise ValueError(f"Unsupported collection type: {collection_type}")
+
+
 def get_pools(
         collection_type: Collection,
         page: Optional[int] = 1,
@@ -1,13 +1,13 @@
 import logging
 from datetime import datetime
-from typing import List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 
 from modules.config import Config
 from modules.models.collection_request import CollectionRequest
 from modules.models.collection_types import Collection
 from modules.models.sort_options import SortOption
 from modules.repositories.market_repo import get_trade_market_item_listings, get_price_history, get_historic_average, \
-    get_all_items_ranking, get_trademarket_item_price
+    get_ranking_snapshot, get_trademarket_item_price, get_trademarket_item_prices, PERIOD_DAY
 from modules.utils.queue_worker import enqueue
 from modules.utils.version import compare_versions
 
@@ -19,6 +19,14 @@ logging.basicConfig(
 # Get module-specific logger
 logger = logging.getLogger(__name__)
 
+HISTORY_FORMAT_DOCUMENTS = 'documents'
+HISTORY_FORMAT_COLUMNAR = 'columnar'
+
+# Series of a columnar history response when no fields are requested
+DEFAULT_COLUMNAR_FIELDS = [
+    'p50_price', 'average_p50_ema_price', 'lowest_price', 'highest_price', 'total_count', 'unidentified_count'
+]
+
 
 def _format_item_for_db(item: dict) -> dict:
     item_data = item.get('item', {})
@@ -100,12 +108,33 @@ def get_history(
         shiny: bool = False,
         tier: Optional[int] = None,
         start_date: datetime = None,
-        end_date: datetime = None
+        end_date: datetime = None,
+        max_points: Optional[int] = None,
+        fields: Optional[List[str]] = None
 ) -> List[dict]:
     """
-    Retrieve historical price data for an item between start_date and end_date (inclusive).
+    Retrieve historical price data for an item between start_date and end_date (inclusive),
+    in daily, weekly or monthly points depending on the range and max_points.
+    """
+    return get_price_history(item_name, shiny, tier, start_date, end_date, max_points=max_points, fields=fields)
+
+
+def to_columnar_history(docs: List[dict], fields: List[str]) -> dict:
+    """
+    Convert history documents into parallel arrays: the item metadata once,
+    `timestamps` as epoch milliseconds and one array per requested field.
     """
-    return get_price_history(item_name, shiny, tier, start_date, end_date)
+    first = docs[0] if docs else {}
+    return {
+        'name': first.get('name'),
+        'tier': first.get('tier'),
+        'shiny': first.get('shiny'),
+        'item_type': first.get('item_type'),
+        'icon': first.get('icon'),
+        'period': first.get('period', PERIOD_DAY) if docs else None,
+        'timestamps': [int(doc['timestamp'].timestamp() * 1000) for doc in docs],
+        **{field: [doc.get(field) for doc in docs] for field in fields}
+    }
 
 
 def get_price(
@@ -119,6 +148,14 @@ def get_price(
     return get_trademarket_item_price(item_name=item_name, shiny=shiny, tier=tier)
 
 
+def get_prices(keys: Iterable[Tuple[str, bool, Optional[int]]]) -> Dict[Tuple[str, bool, Optional[int]], dict]:
+    """
+    Retrieve price statistics for many (item_name, shiny, tier) keys at once.
+    Results are keyed by market_repo.price_key(); unknown items map to {}.
+    """
+    return get_trademarket_item_prices(keys)
+
+
 def get_item_listings(
         item_name: Optional[str],
         shiny: Optional[bool] = None,
@@ -129,7 +166,8 @@ def get_item_listings(
         sub_type: Optional[str] = None,
         sort_option: Optional[SortOption] = SortOption.TIMESTAMP_DESC,
         page: Optional[int] = 1,
-        page_size: Optional[int] = 50
+        page_size: Optional[int] = 50,
+        cursor: Optional[str] = None
 ) -> dict[str, Any]:
     """
     Retrieve market item info by name.
@@ -144,14 +182,16 @@ def get_item_listings(
         sub_type=sub_type,
         sort_option=sort_option,
         page=page,
-        page_size=page_size)
+        page_size=page_size,
+        cursor=cursor)
 
 
 def get_ranking(
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None
-) -> List[dict]:
+) -> dict:
     """
-    Retrieve a ranking of items based on archived price data.
+    Retrieve the ranking snapshot of items based on archived price data.
+    The ranked items are under 'items', their ETag under 'etag'.
     """
-    return get_all_items_ranking(start_date=start_date, end_date=end_date)
+    return get_ranking_snapshot(start_date=start_date, end_date=end_date)
@@ -0,0 +1,36 @@
+import base64
+import binascii
+from datetime import timezone
+from typing import Any, Dict
+
+from bson import json_util
+
+# Decode datetimes as aware UTC values, like the Mongo client does
+_JSON_OPTIONS = json_util.JSONOptions(tz_aware=True, tzinfo=timezone.utc)
+
+
+def encode_cursor(data: Dict[str, Any]) -> str:
+    """
+    Encode pagination state into an opaque, URL-safe token.
+    Uses extended JSON, so datetimes and ObjectIds survive the round trip.
+    """
+    raw = json_util.dumps(data, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """
+    Decode a token produced by encode_cursor().
+
+    Raises:
+        ValueError: If the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json_util.loads(raw.decode('utf-8'), json_options=_JSON_OPTIONS)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if not isinstance(data, dict):
+        raise ValueError("Invalid cursor")
+    return data
@@ -0,0 +1,34 @@
+import logging
+from typing import Optional
+
+from modules.models.collection_request import CollectionRequest
+from modules.models.collection_types import Collection
+from modules.repositories import market_repo, lootpool_repo, raidpool_repo
+from modules.repositories.usage_repo import UsageRepository
+
+logger = logging.getLogger(__name__)
+
+
+def process_request(request: CollectionRequest, usage_repo: Optional[UsageRepository] = None) -> None:
+    """
+    Persist a single request with the repository configured for its collection type.
+    Shared by the in-process queue worker and the external ingest consumer, so a new
+    collection type is wired up in one place.
+
+    API usage records are buffered per process and only stored with a `usage_repo`.
+    """
+    collection_type = request.type
+    items_to_process = request.items
+
+    if collection_type == Collection.MARKET_LISTINGS:
+        market_repo.save(items_to_process)
+    elif collection_type == Collection.LOOT:
+        lootpool_repo.save(items_to_process)
+    elif collection_type == Collection.RAID:
+        raidpool_repo.save(items_to_process)
+    elif collection_type == Collection.GAMBIT:
+        raidpool_repo.save_gambits(items_to_process)
+    elif collection_type == Collection.API_USAGE and usage_repo is not None:
+        usage_repo.save(items_to_process)
+    else:
+        logger.error(f"No repository configured for {collection_type!r}")
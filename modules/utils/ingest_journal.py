@@ -0,0 +1,188 @@
+import fcntl
+import glob
+import logging
+import os
+import struct
+import threading
+import uuid
+import zlib
+from typing import Callable, Dict, Iterator, List
+
+import bson
+
+from modules.models.collection_request import CollectionRequest
+
+logger = logging.getLogger(__name__)
+
+# Every record is: <payload length: uint32 LE> <crc32 of payload: uint32 LE> <BSON payload>
+_HEADER = struct.Struct("<II")
+_SUFFIX = ".journal"
+
+_OP_REQUEST = "req"
+_OP_ACK = "ack"
+
+
+class IngestJournal:
+    """
+    Append-only, per-process journal of queued ingest requests.
+
+    Every request is written to the journal before it is put on the in-memory queue
+    and acknowledged once the queue worker has processed it. If the process dies with
+    requests still queued, the next process that starts with the same journal directory
+    replays the unacknowledged requests of the orphaned file.
+
+    A journal file is held under an exclusive flock for as long as its process lives,
+    which is how other processes tell a live journal from an orphaned one. Every process
+    creates a new, uniquely named file (pid + uuid), so a restarted process that reuses a
+    dead worker's pid can never claim, let alone truncate, the journal it left behind.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.path = os.path.join(directory, f"ingest-{os.getpid()}-{uuid.uuid4().hex}{_SUFFIX}")
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._outstanding: Dict[int, bytes] = {}  # seq -> encoded request record
+        self._file = self._create_locked(self.path)
+
+    # ─── WRITE PATH ────────────────────────────────────────────────────────────
+    def append(self, request: CollectionRequest) -> int:
+        """Durably record a request; returns the sequence number to ack() it with."""
+        with self._lock:
+            self._seq += 1
+            record = _encode({"op": _OP_REQUEST, "seq": self._seq, "request": request.to_dict()})
+            self._write(record)
+            self._outstanding[self._seq] = record
+            return self._seq
+
+    def ack(self, seqs: List[int]) -> None:
+        """Mark requests as processed. The file is emptied whenever nothing is outstanding."""
+        with self._lock:
+            acked = [seq for seq in seqs if self._outstanding.pop(seq, None) is not None]
+            if not acked:
+                return
+
+            if not self._outstanding:
+                self._file.seek(0)
+                self._file.truncate(0)
+                return
+
+            for seq in acked:
+                self._write(_encode({"op": _OP_ACK, "seq": seq}))
+            if self._file.tell() > self.max_bytes:
+                self._compact()
+
+    def close(self, remove: bool = True) -> None:
+        """Release the journal. The file is only removed when nothing is outstanding."""
+        with self._lock:
+            if self._file.closed:
+                return
+            if remove and not self._outstanding:
+                os.remove(self.path)
+            self._file.close()
+
+    def pending(self) -> int:
+        """Number of journaled requests that have not been acknowledged yet."""
+        with self._lock:
+            return len(self._outstanding)
+
+    def _write(self, record: bytes) -> None:
+        self._file.write(record)
+        self._file.flush()
+
+    def _compact(self) -> None:
+        """Rewrite the journal with only the outstanding requests (caller holds _lock)."""
+        tmp_path = self.path + ".compact"
+        tmp = self._create_locked(tmp_path)
+        for seq in sorted(self._outstanding):
+            tmp.write(self._outstanding[seq])
+        tmp.flush()
+        os.fsync(tmp.fileno())
+
+        # The new file is locked before it takes the journal's name, so no other
+        # process can mistake it for an orphan
+        os.replace(tmp_path, self.path)
+        self._file.close()
+        self._file = tmp
+
+    # ─── RECOVERY ──────────────────────────────────────────────────────────────
+    def replay_orphans(self, requeue: Callable[[CollectionRequest], None]) -> int:
+        """
+        Hand the unacknowledged requests of every journal in the directory that no live
+        process holds to `requeue`, in their original order. An orphaned file is removed
+        only after all of its requests were requeued; if `requeue` raises, the file is kept
+        for the next attempt. Returns the number of requests replayed.
+        """
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, f"*{_SUFFIX}"))):
+            if path == self.path:
+                continue
+
+            try:
+                orphan = open(path, "r+b")
+            except FileNotFoundError:
+                continue
+
+            try:
+                try:
+                    fcntl.flock(orphan.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # owned by a live process
+
+                if os.fstat(orphan.fileno()).st_nlink == 0:
+                    continue  # already replayed by another process
+
+                requests = _unacknowledged(orphan)
+                for request in requests:
+                    requeue(request)
+                os.remove(path)
+
+                replayed += len(requests)
+                logger.info(f"Replayed {len(requests)} requests from orphaned journal {path}")
+            finally:
+                orphan.close()
+
+        return replayed
+
+    @staticmethod
+    def _create_locked(path: str):
+        """Create (never open an existing) file and lock it; only files this process created are written."""
+        file = open(path, "x+b")
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return file
+
+
+def _encode(doc: dict) -> bytes:
+    payload = bson.encode(doc)
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_records(file) -> Iterator[dict]:
+    """Decode records from the start of the file, stopping at the first torn or corrupt one."""
+    file.seek(0)
+    while True:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+
+        length, crc = _HEADER.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning(f"Ignoring corrupt journal tail in {file.name}")
+            return
+
+        yield bson.decode(payload)
+
+
+def _unacknowledged(file) -> List[CollectionRequest]:
+    requests: Dict[int, dict] = {}
+    for record in _read_records(file):
+        if record.get("op") == _OP_REQUEST:
+            requests[record["seq"]] = record["request"]
+        elif record.get("op") == _OP_ACK:
+            requests.pop(record["seq"], None)
+
+    return [CollectionRequest.from_dict(requests[seq]) for seq in sorted(requests)]
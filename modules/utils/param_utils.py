@@ -2,7 +2,7 @@ import logging
 from datetime import datetime
 from typing import Optional, Any, Dict, Tuple
 
-from flask import Response, jsonify
+from flask import Response, jsonify, request
 
 logging.basicConfig(
     level=logging.INFO,
@@ -77,6 +77,28 @@ def api_response(data: Any, status_code: int = 200) -> tuple[Response, int]:
     return jsonify(data), status_code
 
 
+def conditional_response(data: Any, etag: str) -> tuple[Response, int]:
+    """
+    Create an API response tagged with an ETag, or an empty 304 if the
+    client's If-None-Match already holds that ETag.
+
+    Args:
+        data: The data to include in the response
+        etag: Validator of the data (also matched by a weak W/"..." tag, as sent back by proxies)
+
+    Returns:
+        Tuple of (Flask Response object, status code)
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response, 304
+
+    response, status_code = api_response(data)
+    response.set_etag(etag)
+    return response, status_code
+
+
 def handle_request_error(e: Exception, error_msg: str = 'Internal server error', status_code: int = 500) -> tuple[
     Response, int]:
     """
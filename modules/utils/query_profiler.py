@@ -0,0 +1,320 @@
+"""
+Per-call-site profiling of the MongoDB commands the application sends.
+
+`QueryProfiler` is a pymongo CommandListener registered on both clients (see
+modules/db.py). Every command is attributed to the application function that issued
+it (e.g. `market_repo.get_trade_market_item_listings`) and recorded in a latency
+histogram together with the number of documents returned. Reads slower than
+`QUERY_SLOW_MS` are re-run with `explain` on a background thread, which adds the
+documents/keys examined and a summary of the winning plan. `render_prometheus()`
+exposes everything in the Prometheus text format (see /internal/metrics).
+"""
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+from modules.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Commands that can be explained with executionStats
+_EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct'}
+# Fields added by the driver that explain must not receive
+_DRIVER_FIELDS = {'lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'apiVersion', 'apiStrict',
+                  'apiDeprecationErrors', 'cursor', 'batchSize', 'singleBatch'}
+# Modules whose frames identify the application call site of a command
+_APP_PACKAGES = ('modules.', 'jobs.', 'scripts.')
+_UNKNOWN_CALL_SITE = 'unknown'
+
+_EXPLAIN_QUEUE_SIZE = 100
+
+Labels = Tuple[str, str, str]  # (call_site, command, collection)
+
+
+def _call_site() -> str:
+    """
+    `module.function` of the innermost application function on the stack. Lambdas,
+    generator expressions and comprehensions are attributed to their enclosing function.
+    """
+    call_site = _UNKNOWN_CALL_SITE
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith(_APP_PACKAGES) and module != __name__:
+            call_site = f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+            if not frame.f_code.co_name.startswith('<'):
+                break
+        elif call_site != _UNKNOWN_CALL_SITE:
+            break
+        frame = frame.f_back
+    return call_site
+
+
+def _collection_name(command_name: str, command: Dict[str, Any]) -> str:
+    if command_name == 'getMore':
+        return str(command.get('collection', ''))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ''
+
+
+def _documents_returned(command_name: str, reply: Dict[str, Any]) -> int:
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    if command_name == 'count':
+        return 1
+    if command_name == 'distinct':
+        return len(reply.get('values', []))
+    return 0
+
+
+def _find(doc: Any, key: str) -> Optional[Any]:
+    """First value stored under `key` anywhere in a nested explain document."""
+    if isinstance(doc, dict):
+        if key in doc:
+            return doc[key]
+        children = doc.values()
+    elif isinstance(doc, list):
+        children = doc
+    else:
+        return None
+    for child in children:
+        found = _find(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def plan_summary(plan: Dict[str, Any]) -> str:
+    """
+    Compact form of a winning plan, outermost stage first:
+    e.g. `LIMIT>FETCH>IXSCAN(name_1_tier_1_timestamp_-1)` or `SORT>COLLSCAN`.
+    """
+    plan = plan.get('queryPlan', plan)  # slot-based engine
+    stage = plan.get('stage', '?')
+    if plan.get('indexName'):
+        stage = f"{stage}({plan['indexName']})"
+
+    children = [plan['inputStage']] if 'inputStage' in plan else plan.get('inputStages', [])
+    if not children:
+        return stage
+    if len(children) == 1:
+        return f"{stage}>{plan_summary(children[0])}"
+    return f"{stage}>[{'|'.join(plan_summary(child) for child in children)}]"
+
+
+def _explain_stats(explain: Dict[str, Any]) -> Tuple[int, int, int, str]:
+    """(docs examined, keys examined, docs returned, plan summary) of an explain result."""
+    stats = _find(explain, 'executionStats') or {}
+    winning_plan = _find(explain, 'winningPlan') or {}
+    return (
+        int(stats.get('totalDocsExamined', 0)),
+        int(stats.get('totalKeysExamined', 0)),
+        int(stats.get('nReturned', 0)),
+        plan_summary(winning_plan) if winning_plan else _UNKNOWN_CALL_SITE,
+    )
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Iterable[str], values: Iterable[Any]) -> str:
+    return ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """
+    Command listener recording, per (call site, command, collection):
+      - a latency histogram and the number of failed commands
+      - the number of documents returned to the application
+      - for slow reads (explained at most once per QUERY_EXPLAIN_INTERVAL seconds per label set):
+        documents and keys examined, documents returned and a count per winning plan
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[Any, int], Tuple[Labels, Optional[Dict[str, Any]]]] = {}
+        self._latency: Dict[Labels, _Histogram] = defaultdict(_Histogram)
+        self._failures: Dict[Labels, int] = defaultdict(int)
+        self._returned: Dict[Labels, int] = defaultdict(int)
+        self._explained: Dict[Labels, List[int]] = defaultdict(lambda: [0, 0, 0, 0])  # samples, docs, keys, returned
+        self._plans: Dict[Tuple[str, str, str, str], int] = defaultdict(int)
+        self._last_explain: Dict[Labels, float] = {}
+        self._explain_queue: "queue.Queue[Tuple[Labels, str, Dict[str, Any]]]" = queue.Queue(_EXPLAIN_QUEUE_SIZE)
+        self._explain_thread: Optional[threading.Thread] = None
+
+    # --- CommandListener -------------------------------------------------------------
+
+    def started(self, event):
+        if event.command_name == 'explain':
+            return
+        labels = (_call_site(), event.command_name, _collection_name(event.command_name, event.command))
+        command = event.command if event.command_name in _EXPLAINABLE_COMMANDS else None
+        with self._lock:
+            self._in_flight[(event.connection_id, event.request_id)] = (labels, command)
+
+    def succeeded(self, event):
+        with self._lock:
+            entry = self._in_flight.pop((event.connection_id, event.request_id), None)
+            if entry is None:
+                return
+            labels, command = entry
+            seconds = event.duration_micros / 1e6
+            self._latency[labels].observe(seconds)
+            self._returned[labels] += _documents_returned(event.command_name, event.reply)
+
+        if command is not None and seconds * 1000 >= Config.QUERY_SLOW_MS:
+            self._slow_query(labels, event.database_name, command, seconds)
+
+    def failed(self, event):
+        with self._lock:
+            entry = self._in_flight.pop((event.connection_id, event.request_id), None)
+            if entry is None:
+                return
+            labels = entry[0]
+            self._latency[labels].observe(event.duration_micros / 1e6)
+            self._failures[labels] += 1
+
+    # --- Slow queries ----------------------------------------------------------------
+
+    def _slow_query(self, labels: Labels, database_name: str, command: Dict[str, Any], seconds: float):
+        logger.warning(f"Slow query {labels[1]} on {labels[2]} from {labels[0]}: {seconds * 1000:.0f} ms")
+
+        if any('$out' in stage or '$merge' in stage for stage in command.get('pipeline', [])):
+            return  # explaining executionStats would run the writes again
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_explain.get(labels, float('-inf')) < Config.QUERY_EXPLAIN_INTERVAL:
+                return
+            self._last_explain[labels] = now
+            if self._explain_thread is None:
+                self._explain_thread = threading.Thread(target=self._explain_loop, name="query-explain",
+                                                        daemon=True)
+                self._explain_thread.start()
+
+        explain_command = {key: value for key, value in command.items() if key not in _DRIVER_FIELDS}
+        try:
+            self._explain_queue.put_nowait((labels, database_name, explain_command))
+        except queue.Full:
+            pass
+
+    def _explain_loop(self):
+        while True:
+            labels, database_name, command = self._explain_queue.get()
+            try:
+                self.record_explain(labels, self._explain(database_name, command))
+            except PyMongoError as e:
+                logger.info(f"Could not explain slow {labels[1]} from {labels[0]}: {str(e)}")
+
+    @staticmethod
+    def _explain(database_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+        from modules.db import get_client
+        admin_db = get_client("admin").get_default_database()
+        client = get_client("admin" if admin_db.name == database_name else "current")
+        return client[database_name].command('explain', command, verbosity='executionStats')
+
+    def record_explain(self, labels: Labels, explain: Dict[str, Any]):
+        """Add the execution statistics and winning plan of an explain result."""
+        docs_examined, keys_examined, returned, plan = _explain_stats(explain)
+        with self._lock:
+            totals = self._explained[labels]
+            totals[0] += 1
+            totals[1] += docs_examined
+            totals[2] += keys_examined
+            totals[3] += returned
+            self._plans[(*labels, plan)] += 1
+
+    # --- Export ----------------------------------------------------------------------
+
+    def render_prometheus(self, const_labels: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        The recorded metrics as Prometheus text format lines. `const_labels` are added to
+        every sample (e.g. the pid, since each process keeps its own counters).
+        """
+        const_names, const_values = tuple(const_labels or {}), tuple((const_labels or {}).values())
+        names = const_names + ('call_site', 'command', 'collection')
+        with self._lock:
+            latency = {const_values + labels: (list(h.buckets), h.sum, h.count) for labels, h in self._latency.items()}
+            failures = {const_values + labels: value for labels, value in self._failures.items()}
+            returned = {const_values + labels: value for labels, value in self._returned.items()}
+            explained = {const_values + labels: list(totals) for labels, totals in self._explained.items()}
+            plans = {const_values + labels: value for labels, value in self._plans.items()}
+
+        lines = [
+            '# HELP mongo_command_duration_seconds Duration of MongoDB commands per call site.',
+            '# TYPE mongo_command_duration_seconds histogram',
+        ]
+        for labels, (buckets, total, count) in sorted(latency.items()):
+            label_str = _labels(names, labels)
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f'mongo_command_duration_seconds_bucket{{{label_str},le="{bound}"}} {cumulative}')
+            lines.append(f'mongo_command_duration_seconds_bucket{{{label_str},le="+Inf"}} {count}')
+            lines.append(f'mongo_command_duration_seconds_sum{{{label_str}}} {total:.6f}')
+            lines.append(f'mongo_command_duration_seconds_count{{{label_str}}} {count}')
+
+        lines += _counter('mongo_command_failures_total', 'Failed MongoDB commands per call site.',
+                          names, failures.items())
+        lines += _counter('mongo_documents_returned_total', 'Documents returned by MongoDB commands per call site.',
+                          names, returned.items())
+        lines += _counter('mongo_slow_query_explains_total', 'Slow queries explained per call site.',
+                          names, ((labels, totals[0]) for labels, totals in explained.items()))
+        lines += _counter('mongo_slow_query_docs_examined_total', 'Documents examined by explained slow queries.',
+                          names, ((labels, totals[1]) for labels, totals in explained.items()))
+        lines += _counter('mongo_slow_query_keys_examined_total', 'Index keys examined by explained slow queries.',
+                          names, ((labels, totals[2]) for labels, totals in explained.items()))
+        lines += _counter('mongo_slow_query_docs_returned_total', 'Documents returned by explained slow queries.',
+                          names, ((labels, totals[3]) for labels, totals in explained.items()))
+        lines += _counter('mongo_slow_query_plans_total', 'Winning plans of explained slow queries.',
+                          names + ('plan',), plans.items())
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._in_flight.clear()
+            self._latency.clear()
+            self._failures.clear()
+            self._returned.clear()
+            self._explained.clear()
+            self._plans.clear()
+            self._last_explain.clear()
+
+
+def _counter(name: str, help_text: str, names: Tuple[str, ...], samples: Iterable[Tuple[tuple, int]]) -> List[str]:
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+    lines += [f'{name}{{{_labels(names, labels)}}} {value}' for labels, value in sorted(samples)]
+    return lines
+
+
+# Process-wide profiler, registered on the MongoClients by modules/db.py
+profiler = QueryProfiler()
@@ -18,79 +18,243 @@ if not any(isinstance(h, StreamHandler) for h in root.handlers):
 
 logger = logging.getLogger(__name__)
 
-from queue import Queue
-from threading import Thread
+import time
 import traceback
+from queue import Queue, Full, Empty
+from threading import Thread
+from typing import Any, Dict, List, Optional, Tuple
 
+from modules.config import Config
 from modules.models.collection_types import Collection
 from modules.models.collection_request import CollectionRequest
-from modules.repositories import market_repo, lootpool_repo, raidpool_repo
+from modules.repositories import ingest_queue_repo, market_repo
 from modules.repositories.usage_repo import UsageRepository
+from modules.utils.ingest_dispatch import process_request
+from modules.utils.ingest_journal import IngestJournal
+
+# ─── FULL-QUEUE POLICIES ───────────────────────────────────────────────────────
+POLICY_BLOCK = "block"  # wait up to INGEST_QUEUE_BLOCK_TIMEOUT for space, then reject
+POLICY_DROP_OLDEST = "drop_oldest"  # evict the oldest queued request to make room
+POLICY_REJECT = "reject"  # fail immediately; routes answer 503
+FULL_POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_REJECT)
+
+
+# ─── INGEST MODES ──────────────────────────────────────────────────────────────
+INGEST_MODE_INLINE = "inline"  # this process' worker threads perform the writes
+INGEST_MODE_EXTERNAL = "external"  # writes are pushed to INGEST_QUEUE for `python -m modules.ingest`
+
+
+class QueueFullError(Exception):
+    """Raised by enqueue() when the target partition is full and the policy rejects the request."""
+
+
+# Queue entry: (enqueued_at, request, journal sequence number or None)
+_Entry = Tuple[float, CollectionRequest, Optional[int]]
+
+
+# ─── PARTITIONS ────────────────────────────────────────────────────────────────
+# Data partition of each collection type, modulo the number of partitions. Market listings
+# get their own partition (so market batches are not interrupted by pool saves) whenever
+# INGEST_WORKER_THREADS >= 2. API usage never shares a partition with mod data, see _usage_partition.
+_PARTITION_SLOTS: Dict[Collection, int] = {
+    Collection.MARKET_LISTINGS: 0,
+    Collection.LOOT: 1,
+    Collection.RAID: 1,
+    Collection.GAMBIT: 1,
+}
+
+
+class _Partition:
+    """
+    A bounded queue drained by its own consumer thread. Every collection type is
+    always routed to the same partition, so requests of one type stay in order.
+    """
+
+    def __init__(self, index: int, max_depth: int):
+        self.index = index
+        self.queue: Queue = Queue(maxsize=max_depth)
+        self.thread = Thread(target=_worker_loop, args=(self,), daemon=True, name=f"queue-worker-{index}")
+
+        # metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_lag = 0.0
+
+    def oldest_age(self) -> float:
+        """Seconds the request at the head of the queue has been waiting."""
+        with self.queue.mutex:
+            head = self.queue.queue[0] if self.queue.queue else None
+        if head is None:
+            return 0.0
+        return time.monotonic() - head[0]
+
+
+def _partition_for(collection_type: Any) -> _Partition:
+    if collection_type == Collection.API_USAGE:
+        return _usage_partition
+    return _partitions[_PARTITION_SLOTS.get(collection_type, 0) % len(_partitions)]
+
 
-# ─── INTERNAL QUEUE & REPO MAPPING ─────────────────────────────────────────────
-_request_queue = Queue()
+def _all_partitions() -> List[_Partition]:
+    return _partitions + [_usage_partition]
 
+
+def _evict_oldest(partition: _Partition) -> Optional[_Entry]:
+    """Remove the oldest queued request, never the shutdown sentinel. None if only sentinels are queued."""
+    request_queue = partition.queue
+    with request_queue.mutex:
+        index = next((i for i, entry in enumerate(request_queue.queue) if entry is not None), None)
+        if index is None:
+            return None
+        dropped = request_queue.queue[index]
+        del request_queue.queue[index]
+        request_queue.not_full.notify()
+    request_queue.task_done()
+    return dropped
+
+
+def _put(partition: _Partition, entry: _Entry, policy: str) -> None:
+    if policy == POLICY_DROP_OLDEST:
+        while True:
+            try:
+                partition.queue.put_nowait(entry)
+                return
+            except Full:
+                dropped = _evict_oldest(partition)
+                partition.dropped += 1
+                # Nothing but the shutdown sentinel to evict: drop the new request instead
+                _ack([dropped if dropped is not None else entry])
+                if dropped is None:
+                    return
+
+    try:
+        if policy == POLICY_BLOCK:
+            partition.queue.put(entry, timeout=Config.INGEST_QUEUE_BLOCK_TIMEOUT)
+        else:
+            partition.queue.put_nowait(entry)
+    except Full:
+        partition.rejected += 1
+        raise QueueFullError(f"Queue partition {partition.index} is full ({partition.queue.maxsize} requests)")
+
+
+# ─── INTERNAL QUEUES & REPO MAPPING ────────────────────────────────────────────
 _usage_repo = UsageRepository()
 
+# Optional on-disk journal: requests are written before they are queued and
+# acknowledged after processing, so a killed process loses nothing
+_journal: Optional[IngestJournal] = IngestJournal(Config.INGEST_JOURNAL_DIR) if Config.INGEST_JOURNAL_DIR else None
+
+
+def _ack(entries: List[_Entry]) -> None:
+    """Acknowledge processed (or discarded) queue entries in the journal."""
+    if _journal is None:
+        return
+    try:
+        _journal.ack([entry[2] for entry in entries if entry[2] is not None])
+    except Exception as e:
+        logger.error(f"Error acknowledging journal entries: {str(e)}")
+
+
+# ─── MARKET MICRO-BATCHING ─────────────────────────────────────────────────────
+def _collect_market_batch(partition: _Partition, first: _Entry) -> Tuple[CollectionRequest, List[_Entry], List[Any]]:
+    """
+    Merge the MARKET_LISTINGS requests waiting in the partition into a single request,
+    so they are written with one insert_many. Requests of other types taken off the queue
+    meanwhile are set aside, in order, to be processed right after the batch. Stops once
+    MARKET_BATCH_MAX_ITEMS listings are collected, MARKET_BATCH_MAX_WAIT_MS have passed
+    without the batch filling up, or the shutdown sentinel is reached.
+
+    Returns:
+        (merged request, queue entries merged into it, entries set aside in queue order,
+        ending with the shutdown sentinel if it was taken).
+    """
+    items = list(first[1].items)
+    consumed = [first]
+    deferred = []
+    deadline = time.monotonic() + Config.MARKET_BATCH_MAX_WAIT_MS / 1000
+
+    while len(items) < Config.MARKET_BATCH_MAX_ITEMS:
+        remaining = deadline - time.monotonic()
+        try:
+            # Past the deadline, still take whatever is already waiting
+            entry = partition.queue.get(timeout=remaining) if remaining > 0 else partition.queue.get_nowait()
+        except Empty:
+            break
+
+        if entry is None:
+            deferred.append(entry)
+            break
+        if entry[1].type != Collection.MARKET_LISTINGS:
+            deferred.append(entry)
+            continue
+
+        items.extend(entry[1].items)
+        consumed.append(entry)
+
+    return CollectionRequest(type=Collection.MARKET_LISTINGS, items=items), consumed, deferred
+
 
 # ─── WORKER LOOP ────────────────────────────────────────────────────────────────
-def _worker_loop():
+def _worker_loop(partition: _Partition):
     """
-    Main worker loop that processes items from the queue.
+    Main worker loop that processes items from a partition's queue.
     Runs in a separate thread and continues until shutdown is signaled.
     """
+    request_queue = partition.queue
+    deferred = []  # entries the last market batch took off the queue but did not merge
+
     while True:
         try:
-            # Get the next item from the queue (blocking operation)
-            request = _request_queue.get()
-            queue_size = _request_queue.qsize()
+            # Get the next item from the queue (blocking operation), unless the
+            # previous market batch already took it off the queue
+            entry = deferred.pop(0) if deferred else request_queue.get()
+            queue_size = request_queue.qsize()
 
             # Check if this is a shutdown signal
-            if request is None:
-                _request_queue.task_done()
-                logger.info(f"Worker is shutting down, {queue_size} items remaining in queue")
+            if entry is None:
+                request_queue.task_done()
+                logger.info(f"Worker {partition.index} is shutting down, {queue_size} items remaining in queue")
                 break
 
+            enqueued_at, request, _ = entry
+            partition.last_lag = time.monotonic() - enqueued_at
+            consumed = [entry]
+
             collection_type = request.type
-            if collection_type is not None:
-                if collection_type != Collection.API_USAGE:
-                    logger.info(
-                        f"Processing {collection_type.name} item, queue size: {queue_size}, items in request: {len(request.items)}")
-            else:
+            if collection_type is None:
                 logger.warning(
                     f"Processing item with unknown collection type, queue size: {queue_size}. Skipping request")
-                _request_queue.task_done()
+                request_queue.task_done()
+                _ack(consumed)
                 continue
 
+            if collection_type == Collection.MARKET_LISTINGS:
+                request, consumed, deferred = _collect_market_batch(partition, entry)
+
+            if collection_type != Collection.API_USAGE:
+                logger.info(
+                    f"Processing {collection_type.name} item, queue size: {queue_size}, "
+                    f"lag: {partition.last_lag:.2f}s, requests: {len(consumed)}, items in request: {len(request.items)}")
+
             # Process the item based on its collection type
             try:
-                items_to_process = request.items
-
-                if items_to_process:
-                    if collection_type == Collection.MARKET_LISTINGS:
-                        market_repo.save(items_to_process)
-                    elif collection_type == Collection.LOOT:
-                        lootpool_repo.save(items_to_process)
-                    elif collection_type == Collection.RAID:
-                        raidpool_repo.save(items_to_process)
-                    elif collection_type == Collection.GAMBIT:
-                        raidpool_repo.save_gambits(items_to_process)
-                    elif collection_type == Collection.API_USAGE:
-                        _usage_repo.save(items_to_process)
-                    else:
-                        logger.error(f"No repository configured for {collection_type!r}")
+                if request.items:
+                    process_request(request, _usage_repo)
                 else:
                     logger.warning(f"No items were passed in request {request}")
-                    _request_queue.task_done()
-                    continue
 
             except Exception as e:
                 logger.error(f"Error processing {collection_type} item: {str(e)}")
                 # We still mark the task as done even if it failed
                 # This prevents the queue from getting stuck
 
-            # Mark the task as done
-            _request_queue.task_done()
+            # Mark the tasks as done
+            _ack(consumed)
+            partition.processed += len(consumed)
+            for _ in consumed:
+                request_queue.task_done()
 
         except Exception as e:
             # Catch any exceptions in the worker loop itself to prevent thread termination
@@ -100,9 +264,33 @@ def _worker_loop():
 
 
 # ─── START UP WORKERS ──────────────────────────────────────────────────────────
-_worker_thread = Thread(target=_worker_loop, daemon=True)
-_worker_thread.start()
-logger.info("Queue worker started")
+def _validate_full_policy(policy: str) -> None:
+    """Refuse to start with an unknown INGEST_QUEUE_FULL_POLICY instead of rejecting every full-queue request."""
+    if policy not in FULL_POLICIES:
+        raise ValueError(f"Unknown INGEST_QUEUE_FULL_POLICY {policy!r}, expected one of {', '.join(FULL_POLICIES)}")
+
+
+_validate_full_policy(Config.INGEST_QUEUE_FULL_POLICY)
+_partitions: List[_Partition] = [
+    _Partition(index, Config.INGEST_QUEUE_MAX_DEPTH) for index in range(max(1, Config.INGEST_WORKER_THREADS))
+]
+# API usage records (one per authenticated request) get a partition of their own, so their
+# drop_oldest policy can only ever evict other usage records, never queued mod submissions
+_usage_partition = _Partition(len(_partitions), Config.INGEST_QUEUE_MAX_DEPTH)
+for _partition in _all_partitions():
+    _partition.thread.start()
+logger.info(f"Queue worker started with {len(_partitions)} partitions and an API usage partition")
+
+
+def _replay_journal():
+    """Re-queue requests left behind in the journals of processes that died before processing them."""
+    try:
+        replayed = _journal.replay_orphans(lambda request: _enqueue(request, POLICY_BLOCK))
+        if replayed:
+            logger.info(f"Replayed {replayed} requests from orphaned ingest journals")
+    except Exception as e:
+        logger.error(f"Error replaying ingest journals: {str(e)}")
+        logger.info(f"Error details: {traceback.format_exc()}")
 
 
 # ─── PUBLIC API ────────────────────────────────────────────────────────────────
@@ -114,40 +302,134 @@ def enqueue(request: CollectionRequest):
         request (CollectionRequest): A CollectionRequest object containing:
             - type: The type of collection (MARKET, LOOT, RAID, API_USAGE)
             - items: A list of items to be processed
+
+    With INGEST_MODE=external, everything except API usage records is pushed to the shared
+    INGEST_QUEUE collection instead and written by the dedicated ingest process.
+
+    Raises:
+        QueueFullError: If the partition is full and the configured policy rejects the request.
+            API usage records are never rejected; the oldest queued usage records are dropped instead.
     """
-    _request_queue.put(request)
+    policy = POLICY_DROP_OLDEST if request.type == Collection.API_USAGE else Config.INGEST_QUEUE_FULL_POLICY
+    _enqueue(request, policy)
 
 
-def shutdown_workers():
+def _enqueue(request: CollectionRequest, policy: str) -> None:
+    # API usage is buffered per process, so it always stays local
+    if Config.INGEST_MODE == INGEST_MODE_EXTERNAL and request.type != Collection.API_USAGE:
+        ingest_queue_repo.push(request)
+        return
+
+    partition = _partition_for(request.type)
+    seq = _journal.append(request) if _journal is not None else None
+    entry = (time.monotonic(), request, seq)
+
+    try:
+        _put(partition, entry, policy)
+    except QueueFullError:
+        _ack([entry])
+        raise
+    partition.enqueued += 1
+
+
+def get_queue_metrics() -> List[Dict[str, Any]]:
     """
-    Gracefully shut down the worker thread and ensure all data is saved.
+    Snapshot of the ingest queues, one entry per partition (the last one is the API usage
+    partition): depth, capacity, counters, the age of the oldest waiting request (lag)
+    and the queue wait of the most recently processed one.
+    """
+    return [
+        {
+            "partition": partition.index,
+            "depth": partition.queue.qsize(),
+            "max_depth": partition.queue.maxsize,
+            "enqueued": partition.enqueued,
+            "processed": partition.processed,
+            "dropped": partition.dropped,
+            "rejected": partition.rejected,
+            "lag_seconds": round(partition.oldest_age(), 3),
+            "last_lag_seconds": round(partition.last_lag, 3),
+        }
+        for partition in _all_partitions()
+    ]
+
+
+def _signal_shutdown(partition: _Partition) -> None:
+    """
+    Queue the shutdown sentinel without blocking. A full partition gets it past its bound,
+    behind everything already queued, instead of aborting the shutdown with queue.Full.
     """
     try:
-        queue_size = _request_queue.qsize()
-        logger.info(f"shutdown_workers() called, stopping worker thread with {queue_size} items in queue")
+        partition.queue.put_nowait(None)
+    except Full:
+        request_queue = partition.queue
+        with request_queue.mutex:
+            request_queue.queue.append(None)
+            request_queue.unfinished_tasks += 1
+            request_queue.not_empty.notify()
+        logger.warning(f"Queue partition {partition.index} is full, shutdown signal queued past its bound")
 
-        # 1) tell the worker to stop once it's picked up everything
-        _request_queue.put(None)  # <-- send a single None, not a tuple
-        logger.info("Shutdown signal added to queue")
 
-        # 2) wait for the worker to drain the queue and exit
-        logger.info("Waiting for worker thread to complete processing remaining items")
-        _worker_thread.join(timeout=60)
+def _flush_buffers() -> bool:
+    """Flush every in-memory buffer, even if an earlier one fails. Returns whether all succeeded."""
+    flushed = True
+    for name, flush in (("API usage", _usage_repo.flush_all), ("moving averages", market_repo.flush_moving_averages)):
+        try:
+            flush()
+        except Exception as e:
+            flushed = False
+            logger.error(f"Error flushing {name} buffers: {str(e)}")
+            logger.info(f"Error details: {traceback.format_exc()}")
+    return flushed
 
-        if _worker_thread.is_alive():
-            logger.error("Worker thread did not exit within timeout period")
-            return False
 
-        logger.info("Worker thread has exited successfully")
+def shutdown_workers():
+    """
+    Gracefully shut down the worker threads and ensure all data is saved.
+    The in-memory buffers are flushed even if a worker does not exit in time.
+    """
+    workers_exited = False
+    try:
+        partitions = _all_partitions()
+        queue_size = sum(partition.queue.qsize() for partition in partitions)
+        logger.info(f"shutdown_workers() called, stopping {len(partitions)} worker threads "
+                    f"with {queue_size} items in queue")
 
-        # 3) now flush any in-memory buffers
-        logger.info("Flushing in-memory buffers")
-        _usage_repo.flush_all()
+        # 1) tell every worker to stop once it's picked up everything
+        for partition in partitions:
+            _signal_shutdown(partition)  # <-- a single None
+        logger.info("Shutdown signal added to queues")
 
-        logger.info("All queue workers have shut down and buffers flushed")
-        return True
+        # 2) wait for the workers to drain their queues and exit
+        logger.info("Waiting for worker threads to complete processing remaining items")
+        deadline = time.monotonic() + Config.INGEST_SHUTDOWN_TIMEOUT
+        for partition in partitions:
+            partition.thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+        workers_exited = not any(partition.thread.is_alive() for partition in partitions)
+        if workers_exited:
+            logger.info("Worker threads have exited successfully")
+        else:
+            # Anything still queued stays in the journal (if enabled) and is replayed by the next process
+            logger.error("Worker thread did not exit within timeout period")
 
     except Exception as e:
         logger.error(f"Error during shutdown: {str(e)}")
         logger.info(f"Error details: {traceback.format_exc()}")
-        return False
+
+    # 3) now flush any in-memory buffers; they only hold already processed requests
+    logger.info("Flushing in-memory buffers")
+    flushed = _flush_buffers()
+
+    # A worker still running would acknowledge into a closed journal
+    if workers_exited and _journal is not None:
+        _journal.close()
+
+    if workers_exited and flushed:
+        logger.info("All queue workers have shut down and buffers flushed")
+    return workers_exited and flushed
+
+
+# ─── JOURNAL RECOVERY ──────────────────────────────────────────────────────────
+if _journal is not None:
+    _replay_journal()
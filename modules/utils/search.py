@@ -0,0 +1,38 @@
+import unicodedata
+from typing import List
+
+# Length of the n-grams stored in `search_tokens`. Queries shorter than this
+# cannot be answered from the tokens and fall back to a regex on `search_name`.
+NGRAM_SIZE = 3
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize an item name for searching: strip accents and non-ASCII characters,
+    collapse whitespace and casefold, so "Nirvána " and "nirvana" compare equal.
+    """
+    name = unicodedata.normalize('NFKD', name)
+    cleaned = ''.join(c for c in name if not unicodedata.combining(c) and ord(c) < 128)
+    return ' '.join(cleaned.split()).casefold()
+
+
+def name_tokens(normalized: str) -> List[str]:
+    """
+    Distinct character trigrams of an already normalized name, in order of first occurrence.
+    Every substring query of at least NGRAM_SIZE characters shares all of its trigrams
+    with the names that contain it, so they can be matched with `$all` on an index.
+    """
+    tokens = []
+    seen = set()
+    for i in range(len(normalized) - NGRAM_SIZE + 1):
+        token = normalized[i:i + NGRAM_SIZE]
+        if token not in seen:
+            seen.add(token)
+            tokens.append(token)
+    return tokens
+
+
+def search_fields(name: str) -> dict:
+    """The `search_name` / `search_tokens` fields stored on a document with the given name."""
+    normalized = normalize_name(name or '')
+    return {'search_name': normalized, 'search_tokens': name_tokens(normalized)}
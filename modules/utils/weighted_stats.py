@@ -0,0 +1,97 @@
+import math
+from typing import List, Optional, Sequence, Tuple, Union
+
+Number = Union[int, float]
+
+# (price, amount) pairs, sorted ascending by price. A pair with amount=4 stands for
+# four identical data points, without materializing them.
+WeightedPrices = Sequence[Tuple[Number, int]]
+
+
+def total_weight(pairs: WeightedPrices) -> int:
+    """Number of data points represented by the pairs."""
+    return sum(amount for _, amount in pairs)
+
+
+def weighted_sum(pairs: WeightedPrices) -> Number:
+    """Sum of all data points represented by the pairs."""
+    return sum(price * amount for price, amount in pairs)
+
+
+def element_at(pairs: WeightedPrices, index: int) -> Optional[Number]:
+    """
+    Return the data point at `index` of the expanded (one entry per unit) price list.
+    """
+    position = 0
+    for price, amount in pairs:
+        position += amount
+        if index < position:
+            return price
+    return None
+
+
+def weighted_median(pairs: WeightedPrices) -> Optional[Number]:
+    """
+    Median of the expanded price list:
+      - odd count: middle element
+      - even count: average of the two middle elements
+    """
+    n = total_weight(pairs)
+    if n == 0:
+        return None
+
+    middle = n // 2
+    if n % 2 == 0:
+        return (element_at(pairs, middle - 1) + element_at(pairs, middle)) / 2
+    return element_at(pairs, middle)
+
+
+def _slice_sum(pairs: WeightedPrices, start: int, count: int) -> Number:
+    """Sum of the expanded price list over the unit range [start, start + count)."""
+    end = start + count
+    total = 0
+    position = 0
+    for price, amount in pairs:
+        lo = max(position, start)
+        hi = min(position + amount, end)
+        if hi > lo:
+            total += price * (hi - lo)
+        position += amount
+        if position >= end:
+            break
+    return total
+
+
+def weighted_mid_80_mean(pairs: WeightedPrices) -> Optional[float]:
+    """
+    Mean of the expanded price list after discarding ceil(10%) of the data points
+    at each end. Falls back to the plain mean for fewer than 3 data points.
+    """
+    n = total_weight(pairs)
+    if n == 0:
+        return None
+    if n <= 2:
+        return weighted_sum(pairs) / n
+
+    trim = math.ceil(n * 0.1)
+    count = n - 2 * trim
+    return _slice_sum(pairs, trim, count) / count
+
+
+def summarize(pairs: List[Tuple[Number, int]]) -> dict:
+    """
+    Compute count, min, max, mean, median and mid-80% mean of weighted prices.
+    Values are left unrounded; `pairs` must be sorted ascending by price.
+    """
+    n = total_weight(pairs)
+    if n == 0:
+        return {'count': 0, 'min': None, 'max': None, 'mean': None, 'median': None, 'mid_80_mean': None}
+
+    return {
+        'count': n,
+        'min': pairs[0][0],
+        'max': pairs[-1][0],
+        'mean': weighted_sum(pairs) / n,
+        'median': weighted_median(pairs),
+        'mid_80_mean': weighted_mid_80_mean(pairs),
+    }
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+
+from modules.db import get_collection
+from modules.indexes import ensure_indexes
+from modules.models.collection_types import Collection
+from modules.repositories.market_repo import PERIOD_MONTH, PERIOD_WEEK, rebuild_archive_rollup
+
+COLLECTION = get_collection(Collection.MARKET_ARCHIVE)
+
+
+def backfill_rollups():
+    """
+    Build the weekly and monthly rollups of every period in MARKET_ARCHIVE.
+    Safe to re-run: each period is rebuilt from the daily snapshots and replaces
+    the stored rollup.
+    """
+    first = COLLECTION.find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+    if first is None:
+        print("MARKET_ARCHIVE is empty, nothing to roll up.")
+        return
+
+    now = datetime.now(timezone.utc)
+    for period in (PERIOD_WEEK, PERIOD_MONTH):
+        count = 0
+        day = first["timestamp"]
+        while day <= now:
+            print(f"Rolling up {period} of {day.date()}...")
+            day = rebuild_archive_rollup(period, day)
+            count += 1
+        print(f"Rebuilt {count} {period} rollups.")
+
+
+def main():
+    print("Creating missing indexes...")
+    ensure_indexes()
+    print("Backfilling archive rollups...")
+    backfill_rollups()
+
+
+if __name__ == '__main__':
+    main()
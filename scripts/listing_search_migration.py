@@ -0,0 +1,45 @@
+from pymongo import UpdateOne
+
+from modules.db import get_collection
+from modules.indexes import ensure_indexes
+from modules.models.collection_types import Collection
+from modules.utils.search import search_fields
+
+COLLECTION = get_collection(Collection.MARKET_LISTINGS)
+
+
+def backfill_search_fields():
+    """
+    Add `search_name` / `search_tokens` to listings stored before they were
+    written on insert, so name searches can use the search indexes.
+    """
+    BATCH_SIZE = 1000
+    updates = []
+    count = 0
+
+    cursor = COLLECTION.find({"search_name": {"$exists": False}}, {"name": 1})
+    for doc in cursor:
+        updates.append(
+            UpdateOne({"_id": doc["_id"]}, {"$set": search_fields(doc.get("name"))})
+        )
+
+        count += 1
+        if len(updates) >= BATCH_SIZE:
+            COLLECTION.bulk_write(updates, ordered=False)
+            updates = []
+            print(f"Processed {count} documents...")
+
+    if updates:
+        COLLECTION.bulk_write(updates, ordered=False)
+    print(f"Processed {count} documents in total.")
+
+
+def main():
+    print("Creating missing indexes...")
+    ensure_indexes()
+    print("Backfilling listing search fields...")
+    backfill_search_fields()
+
+
+if __name__ == '__main__':
+    main()
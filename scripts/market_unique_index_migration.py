@@ -0,0 +1,60 @@
+from modules.db import get_collection
+from modules.indexes import diff_indexes, ensure_indexes
+from modules.models.collection_types import Collection
+
+# collection -> (unique key fields, sort that puts the survivor of a duplicate group first)
+COLLECTIONS = {
+    # The first submission of a listing, like insert_many(ordered=False) keeps it
+    Collection.MARKET_LISTINGS: (["hash_code"], {"timestamp": 1, "_id": 1}),
+    # The most recently recomputed average
+    Collection.MARKET_AVERAGES: (["name", "tier", "shiny"], {"updated_at": -1, "timestamp": -1, "_id": -1}),
+}
+
+
+def remove_duplicates(collection: Collection):
+    """
+    Keep one document per unique key, so the unique index of the registry can be built.
+    Duplicates were possible while the key was upserted / inserted without a unique index.
+    """
+    coll = get_collection(collection)
+    key_fields, survivor_sort = COLLECTIONS[collection]
+    pipeline = [
+        # Documents lacking the key are left alone (listings without hash_code: scripts/hash_code_migration.py)
+        {"$match": {field: {"$ne": None} for field in key_fields}},
+        {"$sort": survivor_sort},
+        {"$group": {"_id": {field: f"${field}" for field in key_fields},
+                    "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+
+    removed = 0
+    for group in coll.aggregate(pipeline, allowDiskUse=True):
+        removed += coll.delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+    print(f"Removed {removed} duplicate {collection.value} documents.")
+
+    unkeyed = coll.count_documents({"$or": [{field: None} for field in key_fields]})
+    if unkeyed:
+        print(f"{unkeyed} {collection.value} documents lack {', '.join(key_fields)}; "
+              f"the unique index cannot be built until they are fixed.")
+
+
+def replace_key_index(collection: Collection):
+    """Drop a non-unique key index, so ensure_indexes() builds the unique one."""
+    coll = get_collection(collection)
+    key_fields, _ = COLLECTIONS[collection]
+    for index in diff_indexes(collection)["conflicting"]:
+        if list(index["key"]) != key_fields:
+            continue
+        print(f"Dropping {collection.value}.{index['name']}")
+        coll.drop_index(index["name"])
+
+
+def main():
+    for collection in COLLECTIONS:
+        remove_duplicates(collection)
+        replace_key_index(collection)
+    print(f"Built {ensure_indexes(list(COLLECTIONS))} indexes.")
+
+
+if __name__ == '__main__':
+    main()
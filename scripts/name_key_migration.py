@@ -0,0 +1,45 @@
+from modules.db import get_collection
+from modules.indexes import ensure_indexes
+from modules.models.collection_types import Collection
+from modules.utils.search import normalize_name
+
+COLLECTIONS = [
+    Collection.MARKET_AVERAGES,
+    Collection.MARKET_ARCHIVE,
+    Collection.MARKET_ARCHIVE_WEEKLY,
+    Collection.MARKET_ARCHIVE_MONTHLY,
+]
+
+
+def backfill_name_keys(collection: Collection):
+    """
+    Add `name_key` to price documents stored before it was written on upsert,
+    so history lookups by normalized name find them. One update per distinct name.
+    Matches null as well as missing keys: rollups built from daily documents without
+    `name_key` store `name_key: null` ($last of a missing field).
+    """
+    coll = get_collection(collection)
+    names = coll.distinct("name", {"name_key": None})
+
+    count = 0
+    for name in names:
+        if not name:
+            continue
+        result = coll.update_many(
+            {"name": name, "name_key": None},
+            {"$set": {"name_key": normalize_name(name)}}
+        )
+        count += result.modified_count
+    print(f"Updated {count} {collection.value} documents ({len(names)} names).")
+
+
+def main():
+    print("Creating missing indexes...")
+    ensure_indexes()
+    for collection in COLLECTIONS:
+        print(f"Backfilling name keys of {collection.value}...")
+        backfill_name_keys(collection)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+from pymongo import UpdateOne
+
+from modules.db import get_collection
+from modules.models.collection_types import Collection
+from modules.repositories.base_pool_repo import pool_item_key
+
+COLLECTIONS = [Collection.LOOT, Collection.RAID]
+
+
+def add_item_keys(collection: Collection):
+    """
+    Give the items of stored regions the merge fields of BasePoolRepo.save(), so a new
+    submission confirms them instead of appending duplicates. Their submitters are unknown:
+    they start with no submitters and 0 confirmations.
+    """
+    coll = get_collection(collection)
+    ops = []
+    for doc in coll.find({"items": {"$elemMatch": {"key": {"$exists": False}}}}, projection={"items": 1}):
+        items = {}
+        for item in doc["items"]:
+            key = item.get("key") or pool_item_key(item)
+            items.setdefault(key, {"submitters": [], "confirmations": 0, **item, "key": key})
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"items": list(items.values())}}))
+
+    if ops:
+        coll.bulk_write(ops, ordered=False)
+    print(f"Added item keys to {len(ops)} {collection.value} documents.")
+
+
+def main():
+    for collection in COLLECTIONS:
+        add_item_keys(collection)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+from modules.db import get_collection
+from modules.indexes import diff_indexes, ensure_indexes
+from modules.models.collection_types import Collection
+
+# collection -> (unique key fields, list field counted to pick the survivor)
+COLLECTIONS = {
+    Collection.LOOT: (["year", "week", "region"], "items"),
+    Collection.RAID: (["year", "week", "region"], "items"),
+    Collection.GAMBIT: (["year", "month", "day"], "gambits"),
+}
+
+
+def remove_duplicate_regions(collection: Collection):
+    """
+    Keep one document per unique key (region and week, or gambit day): the one with
+    the most items, then the newest. Duplicates were possible while saves were find + delete + insert.
+    """
+    coll = get_collection(collection)
+    key_fields, items_field = COLLECTIONS[collection]
+    pipeline = [
+        {"$project": {**{field: 1 for field in key_fields}, "timestamp": 1,
+                      "item_count": {"$size": {"$ifNull": [f"${items_field}", []]}}}},
+        {"$sort": {"item_count": -1, "timestamp": -1}},
+        {"$group": {"_id": {field: f"${field}" for field in key_fields},
+                    "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+
+    removed = 0
+    for group in coll.aggregate(pipeline, allowDiskUse=True):
+        removed += coll.delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+    print(f"Removed {removed} duplicate {collection.value} documents.")
+
+
+def replace_region_index(collection: Collection):
+    """Drop the non-unique key index, so ensure_indexes() builds the unique one."""
+    coll = get_collection(collection)
+    for index in diff_indexes(collection)["conflicting"]:
+        print(f"Dropping {collection.value}.{index['name']}")
+        coll.drop_index(index["name"])
+
+
+def main():
+    for collection in COLLECTIONS:
+        remove_duplicate_regions(collection)
+        replace_region_index(collection)
+    print(f"Built {ensure_indexes(list(COLLECTIONS))} indexes.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import argparse
+
+from pymongo.errors import OperationFailure
+
+from modules.db import get_collection
+from modules.indexes import INDEXES, diff_indexes, ensure_indexes, index_usage, redundant_indexes
+
+
+def _describe(index: dict) -> str:
+    keys = ", ".join(f"{field}: {direction}" for field, direction in index["key"].items())
+    options = ", ".join(f"{option}={index[option]}" for option in ("unique", "expireAfterSeconds") if option in index)
+    return f"{index['name']} ({keys}){' ' + options if options else ''}"
+
+
+def reconcile(apply: bool = False):
+    """
+    Diff the index registry (modules/indexes.py) against the live database and print,
+    per collection, the missing, conflicting, undeclared, unused and redundant indexes.
+    With apply=True the missing indexes are built afterwards.
+    """
+    for collection in INDEXES:
+        diff = diff_indexes(collection)
+        live = list(get_collection(collection).list_indexes())
+        try:
+            usage = index_usage(collection)
+        except OperationFailure as e:
+            print(f"[{collection.value}] $indexStats unavailable: {str(e)}")
+            usage = {}
+
+        print(f"\n[{collection.value}] {len(live)} indexes, {len(INDEXES[collection])} declared")
+        for index in diff["missing"]:
+            print(f"  MISSING      {_describe(index)}")
+        for index in diff["conflicting"]:
+            print(f"  CONFLICTING  {_describe(index)} -- options differ from the declaration, rebuild manually")
+        for index in diff["undeclared"]:
+            ops = usage.get(index["name"], {}).get("ops")
+            print(f"  UNDECLARED   {_describe(index)} -- {ops if ops is not None else '?'} ops")
+        for index in live:
+            stats = usage.get(index["name"])
+            if index["name"] != "_id_" and stats is not None and stats["ops"] == 0:
+                print(f"  UNUSED       {index['name']} -- 0 ops since {stats['since']:%Y-%m-%d %H:%M}")
+        for index, covering in redundant_indexes(live):
+            print(f"  REDUNDANT    {index} -- prefix of {covering}")
+
+    if apply:
+        print(f"\nBuilt {ensure_indexes()} missing indexes.")
+    else:
+        print("\nDry run; pass --apply to build the missing indexes.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the declared indexes with the live database and report unused or redundant ones."
+    )
+    parser.add_argument("--apply", action="store_true", help="Build the missing indexes.")
+    args = parser.parse_args()
+    reconcile(apply=args.apply)
@@ -2,6 +2,7 @@ import os
 import sys
 import unittest
 from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 from unittest.mock import patch, MagicMock
 
 # Add the parent directory to sys.path to import the module
@@ -125,3 +126,108 @@ class BaseTestCase(unittest.TestCase):
         self.mocks['collection'] = mock_collection
 
         return mock_collection
+
+
+# Value of a field path that does not resolve (a missing field)
+MISSING = object()
+
+_BSON_TYPES = ((bool, "bool"), (int, "int"), (float, "double"), (str, "string"), (list, "array"),
+               (dict, "object"), (datetime, "date"))
+
+
+def _resolve(value, fields):
+    if not fields:
+        return value
+    if isinstance(value, list):
+        # A path through an array yields the values of its elements, skipping missing ones
+        return [found for found in (_resolve(element, fields) for element in value) if found is not MISSING]
+    if isinstance(value, dict) and fields[0] in value:
+        return _resolve(value[fields[0]], fields[1:])
+    return MISSING
+
+
+def evaluate(expression, doc, variables: Optional[Dict[str, Any]] = None):
+    """
+    Evaluate an aggregation expression against a document, like the server does for the
+    operators used by the repositories' update pipelines. Missing fields evaluate to MISSING.
+    """
+    variables = {"ROOT": doc, **(variables or {})}
+    if isinstance(expression, str) and expression.startswith("$$"):
+        name, *fields = expression[2:].split(".")
+        return _resolve(variables[name], fields)
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _resolve(doc, expression[1:].split("."))
+    if isinstance(expression, list):
+        return [evaluate(value, doc, variables) for value in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) != 1 or not next(iter(expression)).startswith("$"):
+        values = {key: evaluate(value, doc, variables) for key, value in expression.items()}
+        return {key: value for key, value in values.items() if value is not MISSING}
+
+    def ev(value, **extra):
+        return evaluate(value, doc, {**variables, **extra})
+
+    operator, args = next(iter(expression.items()))
+    if operator == "$literal":
+        return args
+    if operator == "$cond":
+        condition, then, otherwise = (args["if"], args["then"], args["else"]) if isinstance(args, dict) else args
+        return ev(then) if ev(condition) else ev(otherwise)
+    if operator == "$switch":
+        branch = next((branch for branch in args["branches"] if ev(branch["case"])), None)
+        return ev(branch["then"]) if branch else ev(args["default"])
+    if operator == "$let":
+        return ev(args["in"], **{name: ev(value) for name, value in args["vars"].items()})
+    if operator == "$map":
+        return [ev(args["in"], **{args["as"]: element}) for element in ev(args["input"])]
+    if operator == "$filter":
+        return [element for element in ev(args["input"]) if ev(args["cond"], **{args["as"]: element})]
+    # $or / $and short-circuit like on the server (the stale check never sees a missing timestamp)
+    if operator == "$or":
+        return any(ev(arg) for arg in args)
+    if operator == "$and":
+        return all(ev(arg) for arg in args)
+    if operator == "$type":
+        value = ev(args)
+        if value is MISSING or value is None:
+            return "missing" if value is MISSING else "null"
+        return next(name for bson_type, name in _BSON_TYPES if isinstance(value, bson_type))
+
+    values = ev(args)
+    operators = {
+        "$eq": lambda: values[0] == values[1],
+        "$gt": lambda: values[0] > values[1],
+        "$gte": lambda: values[0] >= values[1],
+        "$lt": lambda: values[0] < values[1],
+        "$in": lambda: values[0] in values[1],
+        "$not": lambda: not values[0],
+        "$ifNull": lambda: next((value for value in values if value is not None and value is not MISSING), None),
+        "$size": lambda: len(values),
+        "$add": lambda: sum(values),
+        "$concat": lambda: "".join(values),
+        "$concatArrays": lambda: [element for array in values for element in array],
+        "$mergeObjects": lambda: {key: value for part in values if part for key, value in part.items()},
+        "$toString": lambda: str(values),
+    }
+    return operators[operator]()
+
+
+def apply_update(pipeline: List[Dict], stored: Optional[Dict]) -> Dict:
+    """
+    The document an update pipeline ($set / $unset / $replaceWith stages) leaves behind.
+    stored=None: no document yet, the pipeline runs against an empty upsert document.
+    """
+    doc = dict(stored or {})
+    for stage in pipeline:
+        (operator, spec), = stage.items()
+        if operator == "$replaceWith":
+            doc = evaluate(spec, doc)
+        elif operator == "$set":
+            values = {field: evaluate(value, doc) for field, value in spec.items()}
+            doc = {**doc, **{field: value for field, value in values.items() if value is not MISSING}}
+        elif operator == "$unset":
+            doc = {field: value for field, value in doc.items() if field not in ([spec] if isinstance(spec, str) else spec)}
+        else:
+            raise ValueError(f"Unsupported update stage: {operator}")
+    return doc
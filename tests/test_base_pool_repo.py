@@ -1,10 +1,20 @@
+import hashlib
 import unittest
 from datetime import datetime, timedelta, timezone
-from unittest.mock import call
+from unittest.mock import MagicMock, call
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from modules.models.collection_types import Collection
-from modules.repositories.base_pool_repo import BasePoolRepo
-from tests.test_base import BaseTestCase
+from modules.repositories import base_pool_repo
+from modules.repositories.base_pool_repo import (
+    BasePoolRepo, POOL_VIEW_ITEMS, POOL_VIEW_CURRENT, merge_pool_pipeline, pool_item_key, pool_submitter_id,
+    replace_pool_pipeline
+)
+from modules.repositories.lootpool_repo import build_lootpool_pipeline
+from modules.repositories.raidpool_repo import build_raidpool_pipeline
+from tests.test_base import BaseTestCase, apply_update, evaluate
 
 
 class TestBasePoolRepo(BaseTestCase):
@@ -22,11 +32,16 @@ class TestBasePoolRepo(BaseTestCase):
 
         # Create mocks
         self.mock_collection = self.setup_collection_mock('modules.repositories.base_pool_repo')
+        self.mock_collection.bulk_write.return_value = self.bulk_result(upserted=[0])
         self.mock_get_week = self.create_patch('modules.repositories.base_pool_repo.get_lootpool_week_for_timestamp')
         self.mock_get_week.return_value = (2025, 18)  # Example year and week
 
         self.mock_datetime = self.setup_datetime_mock(self.current_time, 'modules.repositories.base_pool_repo')
 
+    def bulk_result(self, upserted=(), modified=0):
+        """Create a BulkWriteResult-like mock."""
+        return MagicMock(upserted_ids={index: f"id{index}" for index in upserted}, modified_count=modified)
+
     def create_test_pool(self, region="US", items=None, timestamp=None):
         """Create a test pool with the given parameters."""
         if items is None:
@@ -34,27 +49,11 @@ class TestBasePoolRepo(BaseTestCase):
         if timestamp is None:
             timestamp = "2025-05-05T12:00:00Z"
 
-        return {
-            "region": region,
-            "items": items,
-            "timestamp": timestamp
-        }
-
-    def create_existing_doc(self, region="US", items=None, timestamp_delta=None, week=18, year=2025):
-        """Create an existing document with the given parameters."""
-        if items is None:
-            items = [{"name": "Item1", "amount": 1}, {"name": "Item2", "amount": 2}]
-
-        timestamp = self.current_time
-        if timestamp_delta:
-            timestamp = self.current_time - timestamp_delta
-
         return {
             "region": region,
             "items": items,
             "timestamp": timestamp,
-            "week": week,
-            "year": year
+            "playerName": "Player1"
         }
 
     def create_expected_doc(self, region="US", items=None, week=18, year=2025):
@@ -74,122 +73,439 @@ class TestBasePoolRepo(BaseTestCase):
         """Create a filter for database operations."""
         return {'region': region, 'week': week, 'year': year}
 
-    def verify_find_one(self, region="US", week=18, year=2025):
-        """Verify that find_one was called with the correct filter."""
-        self.mock_collection.find_one.assert_called_once_with(
-            self.create_filter(region, week, year)
+    def create_upsert(self, region="US", items=None, submitter=None):
+        """Create the merge upsert expected for a region."""
+        return UpdateOne(
+            self.create_filter(region),
+            merge_pool_pipeline(self.create_expected_doc(region, items), submitter or pool_submitter_id("Player1")),
+            upsert=True
         )
 
-    def verify_delete_one(self, region="US", week=18, year=2025):
-        """Verify that delete_one was called with the correct filter."""
-        self.mock_collection.delete_one.assert_called_once_with(
-            self.create_filter(region, week, year)
-        )
-
-    def verify_insert_one(self, expected_doc):
-        """Verify that insert_one was called with the correct document."""
-        self.mock_collection.insert_one.assert_called_once_with(expected_doc)
-
     def test_save_new_pool(self):
-        """Test saving a new pool (no existing document)."""
-        # Set up the mock collection to return None (no existing document)
-        self.mock_collection.find_one.return_value = None
-
-        # Create a test pool and save it
+        """Test saving a new pool: one merge upsert, no reads or deletes."""
         test_pool = self.create_test_pool()
         self.repo.save([test_pool])
 
-        # Verify database operations
-        self.verify_find_one()
-        self.verify_insert_one(self.create_expected_doc())
+        self.mock_collection.bulk_write.assert_called_once_with([self.create_upsert()], ordered=False)
+        self.mock_collection.find_one.assert_not_called()
         self.mock_collection.delete_one.assert_not_called()
+        self.mock_collection.insert_one.assert_not_called()
 
-    def test_save_replace_more_items(self):
-        """Test saving a pool with more items than the existing one."""
-        # Set up the mock collection to return an existing document with fewer items
-        existing_items = [{"name": "Item1", "amount": 1}]
-        self.mock_collection.find_one.return_value = self.create_existing_doc(
-            items=existing_items,
-            timestamp_delta=timedelta(minutes=30)
-        )
+    def test_save_multiple_pools(self):
+        """All regions of a payload are written with a single bulk_write."""
+        us_items = [{"name": "Item1", "amount": 1}]
+        eu_items = [{"name": "Item2", "amount": 2}]
 
-        # Create a test pool with more items and save it
-        test_pool = self.create_test_pool()
-        self.repo.save([test_pool])
+        test_pools = [
+            self.create_test_pool(region="US", items=us_items),
+            self.create_test_pool(region="EU", items=eu_items)
+        ]
 
-        # Verify database operations
-        self.verify_find_one()
-        self.verify_delete_one()
-        self.verify_insert_one(self.create_expected_doc())
+        self.repo.save(test_pools)
 
-    def test_save_replace_stale(self):
-        """Test saving a pool when the existing one is stale (>1 hour old)."""
-        # Set up the mock collection to return an existing document that's over 1 hour old
-        self.mock_collection.find_one.return_value = self.create_existing_doc(
-            timestamp_delta=timedelta(hours=2)
+        self.mock_collection.bulk_write.assert_called_once_with(
+            [self.create_upsert("US", us_items), self.create_upsert("EU", eu_items)], ordered=False
         )
 
-        # Create a test pool with the same number of items and save it
+    def test_save_merges_for_the_submitter(self):
+        """The payload's submitter id confirms its items; it is not stored on the region."""
         test_pool = self.create_test_pool()
+        test_pool["submitter"] = "abc123"
+
         self.repo.save([test_pool])
 
-        # Verify database operations
-        self.verify_find_one()
-        self.verify_delete_one()
-        self.verify_insert_one(self.create_expected_doc())
-
-    def test_save_skip_insertion(self):
-        """Test skipping insertion when the existing document is newer and has more items."""
-        # Set up the mock collection to return a recent existing document with more items
-        existing_items = [{"name": "Item1", "amount": 1}, {"name": "Item2", "amount": 2},
-                          {"name": "Item3", "amount": 3}]
-        self.mock_collection.find_one.return_value = self.create_existing_doc(
-            items=existing_items,
-            timestamp_delta=timedelta(minutes=30)
-        )
+        expected_doc = self.create_expected_doc()
+        expected_doc["submitter"] = "abc123"
+        self.mock_collection.bulk_write.assert_called_once_with([UpdateOne(
+            self.create_filter(), merge_pool_pipeline(expected_doc, "abc123"), upsert=True
+        )], ordered=False)
 
-        # Create a test pool with fewer items and save it
-        test_pool = self.create_test_pool()
-        self.repo.save([test_pool])
+    def test_save_skips_anonymous_pool(self):
+        """A region without a submitter could confirm items any number of times; it is not written."""
+        anonymous = self.create_test_pool(region="EU")
+        del anonymous["playerName"]
 
-        # Verify database operations
-        self.verify_find_one()
-        self.mock_collection.delete_one.assert_not_called()
-        self.mock_collection.insert_one.assert_not_called()
+        self.repo.save([anonymous, self.create_test_pool()])
 
-    def test_save_multiple_pools(self):
-        """Test saving multiple pools."""
-        # Set up the mock collection to return None for all find_one calls
-        self.mock_collection.find_one.return_value = None
+        self.mock_collection.bulk_write.assert_called_once_with([self.create_upsert()], ordered=False)
 
-        # Create test pools with different regions and items
-        us_items = [{"name": "Item1", "amount": 1}]
-        eu_items = [{"name": "Item2", "amount": 2}]
+    def test_submitter_id_is_keyed(self):
+        """Submitter ids are an HMAC under the configured secret, not a plain hash of the name."""
+        self.create_patch('modules.repositories.base_pool_repo.Config.POOL_SUBMITTER_SECRET', new="secret-a")
+        id_a = pool_submitter_id("Player1")
+        self.assertEqual(pool_submitter_id("player1"), id_a)
+        self.assertNotEqual(id_a, hashlib.sha256(b"player1").hexdigest()[:16])
 
-        test_pools = [
-            self.create_test_pool(region="US", items=us_items),
-            self.create_test_pool(region="EU", items=eu_items)
-        ]
+        self.create_patch('modules.repositories.base_pool_repo.Config.POOL_SUBMITTER_SECRET', new="secret-b")
+        self.assertNotEqual(pool_submitter_id("Player1"), id_a)
 
-        # Call the save method
-        self.repo.save(test_pools)
+        with self.assertRaises(ValueError):
+            pool_submitter_id("")
+
+    def test_save_retries_duplicate_keys(self):
+        """Upserts that raced a concurrent insert are retried once, as updates."""
+        error = BulkWriteError({
+            "writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000 duplicate key error"}],
+            "upserted": [{"index": 0, "_id": "id0"}],
+            "nModified": 0,
+        })
+        self.mock_collection.bulk_write.side_effect = [error, self.bulk_result(modified=1)]
+
+        self.repo.save([self.create_test_pool(region="US"), self.create_test_pool(region="EU")])
+
+        self.assertEqual(self.mock_collection.bulk_write.call_count, 2)
+        self.assertEqual(self.mock_collection.bulk_write.call_args_list[1],
+                         call([self.create_upsert("EU")], ordered=False))
+
+    def test_save_raises_other_write_errors(self):
+        error = BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]})
+        self.mock_collection.bulk_write.side_effect = error
 
-        # Verify the collection.find_one was called twice with the correct filters
-        self.mock_collection.find_one.assert_has_calls([
-            call(self.create_filter(region="US")),
-            call(self.create_filter(region="EU"))
+        with self.assertRaises(BulkWriteError):
+            self.repo.save([self.create_test_pool()])
+
+    def test_save_empty_payload(self):
+        self.repo.save([])
+
+        self.mock_collection.bulk_write.assert_not_called()
+
+    def test_merge_pool_pipeline(self):
+        """New items are keyed and confirmed once; stored items are matched by key."""
+        items = [
+            {"name": "Item1", "amount": 1, "itemType": "GearItem", "rarity": "Mythic"},
+            {"name": "Item1", "amount": 1, "itemType": "GearItem", "rarity": "Mythic"},  # reported twice
+            {"name": "$Item2", "amount": 2, "itemType": "PowderItem", "tier": 3},
+        ]
+        pool = self.create_expected_doc(items=items)
+        pool.update({"type": "LOOT", "modVersion": "1.0.0", "submitter": "abc123"})
+
+        keyed, merge, update, unset = merge_pool_pipeline(pool, "abc123")
+
+        keys = [pool_item_key(items[0]), pool_item_key(items[2])]
+        existing, new = merge["$set"]["_merged_items"]["$concatArrays"]
+        self.assertEqual(existing["$map"]["in"]["$cond"]["if"], {"$in": ["$$item.key", {"$literal": keys}]})
+        self.assertEqual(new["$filter"]["input"], {"$literal": [
+            {**items[0], "key": keys[0], "submitters": ["abc123"], "confirmations": 1},
+            {**items[2], "key": keys[1], "submitters": ["abc123"], "confirmations": 1},
+        ]})
+
+        # Region fields are set, per-submission fields are not
+        self.assertEqual(update["$set"]["region"], {"$literal": "US"})
+        self.assertEqual(update["$set"]["type"], {"$literal": "LOOT"})
+        self.assertNotIn("modVersion", update["$set"])
+        self.assertNotIn("submitter", update["$set"])
+        self.assertEqual(update["$set"]["timestamp"]["$cond"], {
+            "if": {"$eq": ["$_merged_items", "$items"]},
+            "then": "$timestamp",
+            "else": {"$literal": self.current_time}
+        })
+        self.assertEqual(update["$set"]["items"], "$_merged_items")
+        self.assertEqual(unset, {"$unset": "_merged_items"})
+
+    def stored_region(self, items, timestamp=None):
+        """A stored region document with the given items."""
+        return {"_id": "region-id", "region": "US", "year": 2025, "week": 18, "type": "LOOT",
+                "timestamp": timestamp or self.current_time - timedelta(hours=1), "items": items}
+
+    def merged(self, stored, items, submitter):
+        """The region document after merging a submission of `items` into `stored`."""
+        pool = {**self.create_expected_doc(items=items), "type": "LOOT"}
+        return apply_update(merge_pool_pipeline(pool, submitter), stored)
+
+    def keyed_item(self, item, submitters):
+        return {**item, "key": pool_item_key(item), "submitters": submitters, "confirmations": len(submitters)}
+
+    def test_merge_inserts_new_region(self):
+        item = {"name": "Item1", "amount": 1}
+
+        doc = self.merged(None, [item], "abc123")
+
+        self.assertEqual(doc["items"], [self.keyed_item(item, ["abc123"])])
+        self.assertEqual(doc["timestamp"], self.current_time)
+        self.assertEqual((doc["region"], doc["year"], doc["week"], doc["type"]), ("US", 2025, 18, "LOOT"))
+
+    def test_merge_unions_new_items(self):
+        """Reported items not stored yet are appended; stored items not reported are kept."""
+        item1, item2, item3 = ({"name": f"Item{n}", "amount": 1} for n in (1, 2, 3))
+        stored = self.stored_region([self.keyed_item(item1, ["abc123"]), self.keyed_item(item2, ["abc123"])])
+
+        doc = self.merged(stored, [item2, item3], "abc123")
+
+        self.assertEqual(doc["items"], [
+            self.keyed_item(item1, ["abc123"]), self.keyed_item(item2, ["abc123"]), self.keyed_item(item3, ["abc123"])
         ])
+        self.assertEqual(doc["timestamp"], self.current_time)
+
+    def test_merge_same_submitter_is_unchanged(self):
+        """A repeated submission neither confirms again nor moves the timestamp."""
+        item = {"name": "Item1", "amount": 1}
+        stored = self.stored_region([self.keyed_item(item, ["abc123"])])
+
+        doc = self.merged(stored, [item], "abc123")
 
-        # Verify the collection.insert_one was called twice with the correct documents
-        expected_docs = [
-            self.create_expected_doc(region="US", items=us_items),
-            self.create_expected_doc(region="EU", items=eu_items)
+        self.assertEqual(doc, stored)
+
+    def test_merge_new_submitter_confirms(self):
+        item = {"name": "Item1", "amount": 1, "shiny": True}
+        stored = self.stored_region([self.keyed_item(item, ["abc123"])])
+
+        doc = self.merged(stored, [item], "def456")
+
+        self.assertEqual(doc["items"], [self.keyed_item(item, ["abc123", "def456"])])
+        self.assertEqual(doc["items"][0]["confirmations"], 2)
+        self.assertEqual(doc["timestamp"], self.current_time)
+
+    def test_merge_keys_items_stored_before_the_migration(self):
+        """Items without key or submitters are matched by their computed key, not duplicated."""
+        reported = {"name": "Item1", "amount": 1, "itemType": "GearItem", "rarity": "Mythic", "shiny": False}
+        unreported = {"name": "Item2", "amount": 2, "itemType": "PowderItem", "tier": 3}
+        stored = self.stored_region([dict(reported), dict(unreported)])
+
+        doc = self.merged(stored, [reported], "abc123")
+
+        self.assertEqual(doc["items"], [self.keyed_item(reported, ["abc123"]), self.keyed_item(unreported, [])])
+
+    def test_server_item_key_matches_pool_item_key(self):
+        items = [
+            {"name": "Divzer", "amount": 1, "itemType": "GearItem", "type": "Bow", "rarity": "Mythic", "shiny": True},
+            {"name": "Item2", "amount": 2, "itemType": "PowderItem", "tier": 3, "shiny": False},
+            {"name": "Item3", "tier": None},
         ]
+        for item in items:
+            self.assertEqual(evaluate(base_pool_repo._item_key_expression("item"), {}, {"item": item}),
+                             pool_item_key(item))
 
-        self.mock_collection.insert_one.assert_has_calls([
-            call(expected_docs[0]),
-            call(expected_docs[1])
-        ])
+    def test_pool_item_key(self):
+        item = {"name": "Divzer", "amount": 1, "itemType": "GearItem", "type": "Bow", "rarity": "Mythic",
+                "shiny": True, "shinyStat": {"key": "kills"}, "icon": "bow"}
+
+        self.assertEqual(pool_item_key(item), "GearItem|Bow|Divzer|Mythic|None|1|True")
+        self.assertEqual(pool_item_key({**item, "icon": "other", "shinyStat": None}), pool_item_key(item))
+        self.assertNotEqual(pool_item_key({**item, "shiny": False}), pool_item_key(item))
+
+    def test_pool_submitter_id(self):
+        self.assertEqual(pool_submitter_id("Player1"), pool_submitter_id("player1"))
+        self.assertNotEqual(pool_submitter_id("Player1"), pool_submitter_id("Player2"))
+        self.assertNotIn("player1", pool_submitter_id("Player1"))
+        self.assertEqual(len(pool_submitter_id("Player1")), 16)
+
+    def test_render_pipelines_strip_merge_fields(self):
+        """Item keys and submitter ids are removed before the processed views are built."""
+        for pipeline in (build_lootpool_pipeline(2025, 18), build_raidpool_pipeline(2025, 18)):
+            self.assertEqual(pipeline[1], {"$unset": ["items.key", "items.submitters"]})
+
+    def test_replace_pool_pipeline(self):
+        """The replacement rule is evaluated by the server against the stored document."""
+        pool = self.create_expected_doc()
+        stale_before = self.current_time - timedelta(hours=1)
+
+        replace_with = replace_pool_pipeline(pool, stale_before)[0]["$replaceWith"]["$cond"]
+
+        old_count = {"$size": {"$ifNull": ["$items", []]}}
+        self.assertEqual(replace_with["if"], {"$or": [
+            {"$eq": [{"$type": "$timestamp"}, "missing"]},
+            {"$gt": [2, old_count]},
+            {"$and": [{"$lt": ["$timestamp", stale_before]}, {"$gte": [2, old_count]}]}
+        ]})
+        self.assertEqual(replace_with["then"], {"$mergeObjects": [{"_id": "$_id"}, {"$literal": pool}]})
+        self.assertEqual(replace_with["else"], "$$ROOT")
+
+
+class TestBasePoolRepoRendering(BaseTestCase):
+    """Test cases for the rendered pool documents."""
+
+    def setUp(self):
+        super().setUp()
+        self.render_pipeline = [{"$match": {"year": 2025, "week": 18}}]
+        self.repo = BasePoolRepo(Collection.LOOT, Collection.LOOT_RENDERED, lambda year, week: list(self.render_pipeline))
+
+        self.mock_collection = self.setup_collection_mock('modules.repositories.base_pool_repo')
+        self.create_patch('modules.repositories.base_pool_repo.get_lootpool_week_for_timestamp',
+                          return_value=(2025, 18))
+        self.setup_datetime_mock(datetime(2025, 5, 5, 12, 0, 0, tzinfo=timezone.utc),
+                                 'modules.repositories.base_pool_repo')
+
+    def test_accepted_regions_render_the_week_once(self):
+        self.mock_collection.bulk_write.return_value = MagicMock(upserted_ids={0: "id0"}, modified_count=1)
+
+        self.repo.save([{"region": "US", "items": [{"name": "Item1"}], "timestamp": "2025-05-05T12:00:00Z",
+                         "submitter": "abc123"},
+                        {"region": "EU", "items": [{"name": "Item2"}], "timestamp": "2025-05-05T12:00:00Z",
+                         "submitter": "abc123"}])
+
+        self.mock_collection.aggregate.assert_called_once()
+        pipeline = self.mock_collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0], self.render_pipeline[0])
+        self.assertEqual(pipeline[-2]["$project"]["_id"], {"$literal": "2025-18"})
+        merge = pipeline[-1]["$merge"]
+        self.assertEqual(merge["into"], "lootpool_rendered")
+        update = merge["whenMatched"][0]["$replaceWith"]["$cond"]
+        self.assertEqual(update["then"]["$mergeObjects"][1]["version"], {"$add": ["$version", 1]})
+
+    def test_render_keeps_newer_rendered_document(self):
+        """A render built from older regions than the stored document does not overwrite it."""
+        self.repo.render(2025, 18)
+
+        pipeline = self.mock_collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[-3]["$group"]["source_updated_at"], {"$max": "$timestamp"})
+        self.assertEqual(pipeline[-2]["$project"]["source_updated_at"], 1)
+        update = pipeline[-1]["$merge"]["whenMatched"][0]["$replaceWith"]["$cond"]
+        self.assertEqual(update["if"], {"$gte": ["$$new.source_updated_at", "$source_updated_at"]})
+        self.assertEqual(update["then"]["$mergeObjects"][0], "$$ROOT")
+        self.assertEqual(update["then"]["$mergeObjects"][1]["source_updated_at"], "$$new.source_updated_at")
+        self.assertEqual(update["then"]["$mergeObjects"][1]["regions"], "$$new.regions")
+        self.assertEqual(update["else"], "$$ROOT")
+
+    def test_rejected_regions_do_not_render(self):
+        self.mock_collection.bulk_write.return_value = MagicMock(upserted_ids={}, modified_count=0)
+
+        self.repo.save([{"region": "US", "items": [{"name": "Item1"}], "timestamp": "2025-05-05T12:00:00Z",
+                         "submitter": "abc123"}])
+
+        self.mock_collection.bulk_write.assert_called_once()
+        self.mock_collection.aggregate.assert_not_called()
+
+    def test_fetch_rendered(self):
+        rendered = {"year": 2025, "week": 18, "version": 3, "regions": [{"region": "US"}]}
+        self.mock_collection.find_one.return_value = rendered
+
+        self.assertEqual(self.repo.fetch_rendered(2025, 18), rendered)
+        self.assertEqual(self.mock_collection.find_one.call_args_list[0], call({"_id": "2025-18"}, projection={"_id": 0}))
+        self.mock_collection.aggregate.assert_not_called()
+
+    def test_fetch_rendered_renders_again_after_failed_render(self):
+        """A rendered document older than the newest region (its render failed) is rendered again."""
+        stale = {"year": 2025, "week": 18, "version": 1, "regions": [], "source_updated_at": datetime(2025, 5, 5, 11)}
+        fresh = {"year": 2025, "week": 18, "version": 2, "regions": [{"region": "US"}],
+                 "source_updated_at": datetime(2025, 5, 5, 12)}
+        self.mock_collection.find_one.side_effect = [stale, {"timestamp": datetime(2025, 5, 5, 12)}, fresh]
+
+        rendered = self.repo.fetch_rendered(2025, 18)
+
+        self.mock_collection.aggregate.assert_called_once()
+        self.assertEqual(rendered, {"year": 2025, "week": 18, "version": 2, "regions": [{"region": "US"}]})
+
+    def test_fetch_rendered_renders_missing_week(self):
+        rendered = {"year": 2025, "week": 18, "version": 1, "regions": [{"region": "US"}]}
+        self.mock_collection.find_one.side_effect = [None, {"timestamp": datetime(2025, 5, 5, 12)}, rendered]
+
+        self.assertEqual(self.repo.fetch_rendered(2025, 18), rendered)
+        self.mock_collection.aggregate.assert_called_once()
+
+
+class TestPoolCache(BaseTestCase):
+    """Test cases for the per-process cache of the current pool views."""
+
+    def setUp(self):
+        super().setUp()
+        base_pool_repo._pool_cache.clear()
+        self.repo = BasePoolRepo(Collection.LOOT, Collection.LOOT_RENDERED, lambda year, week: [])
+
+        self.mock_collection = self.setup_collection_mock('modules.repositories.base_pool_repo')
+        self.create_patch('modules.repositories.base_pool_repo.get_lootpool_week', return_value=(2025, 18))
+        self.mock_config = self.create_patch('modules.repositories.base_pool_repo.Config')
+        self.mock_config.POOL_CACHE_TTL = 5.0
+        self.mock_time = self.create_patch('modules.repositories.base_pool_repo.time')
+        self.mock_time.monotonic.return_value = 1000.0
+
+        self.rendered = {"year": 2025, "week": 18, "version": 1, "regions": [{"region": "US"}]}
+        self.region_timestamp = datetime(2025, 5, 5, 12)
+        self.mock_collection.find_one.side_effect = self.find_one
+
+    def find_one(self, query, projection=None, sort=None):
+        if projection == {"version": 1}:
+            return {"_id": query["_id"], "version": self.rendered["version"]}
+        if projection == {"_id": 0, "timestamp": 1}:
+            return {"timestamp": self.region_timestamp}
+        return dict(self.rendered)
+
+    def test_view_is_loaded_once_per_version(self):
+        regions, etag = self.repo.fetch_current(POOL_VIEW_ITEMS)
+        self.mock_time.monotonic.return_value = 1004.0
+        cached_regions, cached_etag = self.repo.fetch_current(POOL_VIEW_ITEMS)
+
+        self.assertEqual(regions, [{"region": "US"}])
+        self.assertIs(cached_regions, regions)
+        self.assertEqual(cached_etag, etag)
+        # one version read (rendered version, newest region) + one rendered document load
+        # (checked against the newest region), nothing within the TTL
+        self.assertEqual(self.mock_collection.find_one.call_count, 4)
+
+    def test_unchanged_version_is_revalidated_after_ttl(self):
+        _, etag = self.repo.fetch_current(POOL_VIEW_ITEMS)
+        self.mock_time.monotonic.return_value = 1006.0
+
+        self.assertEqual(self.repo.fetch_current(POOL_VIEW_ITEMS)[1], etag)
+        self.assertEqual(self.mock_collection.find_one.call_count, 6)
+
+    def test_new_version_reloads_view(self):
+        _, etag = self.repo.fetch_current(POOL_VIEW_ITEMS)
+        self.rendered = {"year": 2025, "week": 18, "version": 2, "regions": [{"region": "EU"}]}
+        self.mock_time.monotonic.return_value = 1006.0
+
+        regions, new_etag = self.repo.fetch_current(POOL_VIEW_ITEMS)
+
+        self.assertEqual(regions, [{"region": "EU"}])
+        self.assertNotEqual(new_etag, etag)
+
+    def test_invalidate_cache(self):
+        self.repo.fetch_current(POOL_VIEW_ITEMS)
+        self.rendered = {"year": 2025, "week": 18, "version": 2, "regions": [{"region": "EU"}]}
+
+        self.repo.invalidate_cache(2025, 18)
+
+        self.assertEqual(self.repo.fetch_current(POOL_VIEW_ITEMS)[0], [{"region": "EU"}])
+
+    def test_mongo_is_read_outside_the_cache_lock(self):
+        """Version checks and view loads never hold the module-wide cache lock."""
+        held = []
+        find_one = self.find_one
+
+        def checking_find_one(query, projection=None, sort=None):
+            held.append(base_pool_repo._pool_cache_lock.locked())
+            return find_one(query, projection, sort)
+
+        self.mock_collection.find_one.side_effect = checking_find_one
+        self.repo.fetch_current(POOL_VIEW_ITEMS)
+        self.mock_time.monotonic.return_value = 1006.0
+        self.repo.fetch_current(POOL_VIEW_ITEMS)
+
+        self.assertEqual(held, [False] * 6)
+
+    def test_older_version_does_not_replace_newer_entry(self):
+        """A slow load of an older version is returned but not published over a newer entry."""
+        newer = {"version": (3, self.region_timestamp), "checked_at": 1000.0,
+                 "views": {POOL_VIEW_ITEMS: ([{"region": "EU"}], "etag3")}}
+
+        def load():
+            base_pool_repo._pool_cache[(Collection.LOOT, 2025, 18)] = newer  # published meanwhile
+            return [{"region": "US"}]
+
+        regions, _ = self.repo._cached_view(2025, 18, POOL_VIEW_ITEMS, load)
+
+        self.assertEqual(regions, [{"region": "US"}])
+        self.assertIs(base_pool_repo._pool_cache[(Collection.LOOT, 2025, 18)], newer)
+
+    def test_raw_view_follows_regions_when_render_fails(self):
+        """A merge whose render failed keeps the rendered version, but still refreshes the raw view."""
+        self.mock_collection.aggregate.side_effect = lambda pipeline: iter([{"regions": [{"region": "US"}]}])
+        pool, etag = self.repo.fetch_current(POOL_VIEW_CURRENT)
+
+        self.mock_collection.aggregate.side_effect = lambda pipeline: iter([{"regions": [{"region": "EU"}]}])
+        self.region_timestamp = datetime(2025, 5, 5, 12, 30)
+        self.mock_time.monotonic.return_value = 1006.0
+        new_pool, new_etag = self.repo.fetch_current(POOL_VIEW_CURRENT)
+
+        self.assertEqual(new_pool, {"regions": [{"region": "EU"}]})
+        self.assertNotEqual(new_etag, etag)
+
+    def test_raw_view(self):
+        self.mock_collection.aggregate.return_value = iter([{"year": 2025, "week": 18, "regions": []}])
+
+        pool, _ = self.repo.fetch_current(POOL_VIEW_CURRENT)
+
+        self.assertEqual(pool, {"year": 2025, "week": 18, "regions": []})
+        self.assertEqual(self.mock_collection.aggregate.call_args[0][0][0], {"$match": {"year": 2025, "week": 18}})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+import unittest
+
+from modules.models.collection_types import Collection
+from modules.repositories.base_pool_repo import pool_submitter_id
+from modules.services import base_pool_service
+from tests.test_base import BaseTestCase
+
+
+class TestBasePoolService(BaseTestCase):
+    """Test cases for the base_pool_service module."""
+
+    def setUp(self):
+        super().setUp()
+        self.mock_enqueue = self.create_patch('modules.services.base_pool_service.enqueue')
+        self.create_patch('modules.services.base_pool_service.is_time_valid', return_value=True)
+        self.create_patch('modules.services.base_pool_service.compare_versions', return_value=True)
+
+    def create_item(self, name="Item1"):
+        return {"name": name, "amount": 1, "playerName": "Player1", "modVersion": "1.0.0",
+                "timestamp": "2025-05-05T12:00:00Z"}
+
+    def enqueued_regions(self):
+        return self.mock_enqueue.call_args[0][0].items
+
+    def test_save_hashes_submitter(self):
+        """The submitting player is kept only as a hash, items lose their per-submission fields."""
+        base_pool_service.save(Collection.LOOT, {"region": "US", "modVersion": "1.0.0",
+                                                 "items": [self.create_item("Item1"), self.create_item("Item2")]})
+
+        region = self.enqueued_regions()[0]
+        self.assertEqual(region["submitter"], pool_submitter_id("Player1"))
+        self.assertEqual(region["items"], [{"name": "Item1", "amount": 1}, {"name": "Item2", "amount": 1}])
+
+    def test_save_prefers_region_player_name(self):
+        base_pool_service.save(Collection.RAID, [{"region": "TNA", "modVersion": "1.0.0", "playerName": "Player2",
+                                                  "items": [self.create_item()]}])
+
+        region = self.enqueued_regions()[0]
+        self.assertEqual(region["submitter"], pool_submitter_id("Player2"))
+        self.assertNotIn("playerName", region)
+
+    def test_save_skips_region_without_player_name(self):
+        """Anonymous regions are not enqueued: they could confirm items any number of times."""
+        anonymous = self.create_item()
+        del anonymous["playerName"]
+
+        base_pool_service.save(Collection.LOOT, [
+            {"region": "EU", "modVersion": "1.0.0", "items": [anonymous]},
+            {"region": "US", "modVersion": "1.0.0", "items": [self.create_item()]},
+        ])
+
+        self.assertEqual([region["region"] for region in self.enqueued_regions()], ["US"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import time
+import unittest
+
+from modules.utils.cache import TTLCache
+from tests.test_base import BaseTestCase
+
+
+class TestTTLCache(BaseTestCase):
+    """Test cases for the TTLCache utility."""
+
+    def test_get_returns_cached_value(self):
+        cache = TTLCache()
+        cache.set("key", 1, ttl=60)
+
+        self.assertEqual(cache.get("key"), 1)
+        self.assertIsNone(cache.get("missing"))
+
+    def test_entries_expire(self):
+        cache = TTLCache()
+        cache.set("key", 1, ttl=0.01)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1, ttl=60)
+        cache.set("b", 2, ttl=60)
+        cache.get("a")
+        cache.set("c", 3, ttl=60)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
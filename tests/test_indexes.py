@@ -0,0 +1,90 @@
+import unittest
+
+from bson import SON
+from pymongo.errors import DuplicateKeyError
+
+from modules import indexes
+from modules.models.collection_types import Collection
+from tests.test_base import BaseTestCase
+
+
+def live_index(name, keys, **options):
+    return {"v": 2, "key": SON(keys), "name": name, **options}
+
+
+class TestIndexes(BaseTestCase):
+    """Test cases for the index registry."""
+
+    def setUp(self):
+        super().setUp()
+        self.mock_collection = self.setup_collection_mock('modules.indexes')
+
+    def test_diff_indexes(self):
+        """Indexes are matched by key pattern; options only decide conflicts."""
+        self.mock_collection.list_indexes.return_value = [
+            live_index("_id_", [("_id", 1)]),
+            live_index("custom_name", [("expires_at", 1)], expireAfterSeconds=3600),
+            live_index("legacy_1", [("legacy", 1)]),
+        ]
+
+        diff = indexes.diff_indexes(Collection.MARKET_RANKING)
+
+        self.assertEqual([index["name"] for index in diff["missing"]], ["start_date_1_end_date_1"])
+        self.assertEqual([index["name"] for index in diff["conflicting"]], ["custom_name"])
+        self.assertEqual([index["name"] for index in diff["undeclared"]], ["legacy_1"])
+
+    def test_ttl_zero_matches_declaration(self):
+        """expireAfterSeconds=0 is a real option, not a missing one."""
+        self.mock_collection.list_indexes.return_value = [
+            live_index("expires_at_1", [("expires_at", 1)], expireAfterSeconds=0),
+            live_index("start_date_1_end_date_1", [("start_date", 1), ("end_date", 1)]),
+        ]
+
+        diff = indexes.diff_indexes(Collection.MARKET_RANKING)
+
+        self.assertEqual(diff, {"missing": [], "conflicting": [], "undeclared": []})
+
+    def test_ensure_indexes_builds_only_missing(self):
+        self.mock_collection.list_indexes.return_value = [
+            live_index("expires_at_1", [("expires_at", 1)], expireAfterSeconds=0),
+        ]
+
+        built = indexes.ensure_indexes([Collection.MARKET_RANKING])
+
+        self.assertEqual(built, 1)
+        models = self.mock_collection.create_indexes.call_args.args[0]
+        self.assertEqual([model.document["name"] for model in models], ["start_date_1_end_date_1"])
+
+    def test_failed_index_does_not_block_the_others(self):
+        """A unique index over duplicate data fails alone; the rest are still built."""
+        self.mock_collection.list_indexes.return_value = []
+        self.mock_collection.create_indexes.side_effect = [DuplicateKeyError("E11000 duplicate key error"), None]
+
+        with self.assertLogs('modules.indexes', level='ERROR') as logs:
+            built = indexes.ensure_indexes([Collection.MARKET_AVERAGES])
+
+        self.assertEqual(built, 1)
+        built_models = [call.args[0] for call in self.mock_collection.create_indexes.call_args_list]
+        self.assertEqual([[model.document["name"] for model in models] for models in built_models],
+                         [["name_1_tier_1_shiny_1"], ["updated_at_1"]])
+        self.assertIn("name_1_tier_1_shiny_1", logs.output[0])
+
+    def test_redundant_indexes(self):
+        """A plain index that is a prefix of another is redundant; unique ones are kept."""
+        live = [
+            live_index("_id_", [("_id", 1)]),
+            live_index("year_1", [("year", 1)]),
+            live_index("year_1_week_1_region_1", [("year", 1), ("week", 1), ("region", 1)]),
+            live_index("hash_code_1", [("hash_code", 1)], unique=True),
+            live_index("hash_code_1_name_1", [("hash_code", 1), ("name", 1)]),
+            live_index("week_1", [("week", 1)]),
+        ]
+
+        self.assertEqual(indexes.redundant_indexes(live), [("year_1", "year_1_week_1_region_1")])
+
+    def test_every_collection_is_declared(self):
+        self.assertEqual(set(indexes.INDEXES), set(Collection))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from modules import ingest
+from modules.models.collection_types import Collection
+from tests.test_base import BaseTestCase
+
+
+class TestIngestConsumer(BaseTestCase):
+    """Test cases for the dedicated ingest consumer."""
+
+    def setUp(self):
+        super().setUp()
+        self.mock_queue = self.create_patch('modules.ingest.ingest_queue_repo')
+        self.mock_market_save = self.create_patch('modules.repositories.market_repo.save')
+        self.mock_loot_save = self.create_patch('modules.repositories.lootpool_repo.save')
+        self.create_patch('modules.ingest.Config.INGEST_MAX_ATTEMPTS', new=3)
+
+    @staticmethod
+    def _doc(_id, collection_type, items, attempts=1):
+        return {"_id": _id, "type": collection_type.value, "items": items, "attempts": attempts}
+
+    def test_empty_queue(self):
+        """Nothing is processed when no request can be claimed."""
+        self.mock_queue.claim.return_value = None
+
+        self.assertFalse(ingest.process_next())
+        self.mock_queue.ack.assert_not_called()
+
+    def test_processes_and_acks_request(self):
+        """A claimed request is written by its repository and removed from the queue."""
+        self.mock_queue.claim.return_value = self._doc(1, Collection.LOOT, [{"region": "SE"}])
+
+        self.assertTrue(ingest.process_next())
+
+        self.mock_loot_save.assert_called_once_with([{"region": "SE"}])
+        self.mock_queue.ack.assert_called_once_with([1])
+
+    def test_merges_market_requests(self):
+        """Waiting market requests are claimed and written with a single insert."""
+        self.mock_queue.claim.side_effect = [
+            self._doc(1, Collection.MARKET_LISTINGS, [{"id": 1}]),
+            self._doc(2, Collection.MARKET_LISTINGS, [{"id": 2}]),
+            None,
+        ]
+
+        ingest.process_next()
+
+        self.mock_market_save.assert_called_once_with([{"id": 1}, {"id": 2}])
+        self.mock_queue.ack.assert_called_once_with([1, 2])
+        self.assertEqual(self.mock_queue.claim.call_args_list[1].args[1], Collection.MARKET_LISTINGS)
+
+    def test_failed_request_is_retried_until_attempts_run_out(self):
+        """A failing request stays leased for a retry and is dropped after INGEST_MAX_ATTEMPTS."""
+        self.mock_loot_save.side_effect = Exception("boom")
+
+        self.mock_queue.claim.return_value = self._doc(1, Collection.LOOT, [{"region": "SE"}], attempts=1)
+        ingest.process_next()
+        self.mock_queue.ack.assert_called_with([])
+
+        self.mock_queue.claim.return_value = self._doc(1, Collection.LOOT, [{"region": "SE"}], attempts=3)
+        ingest.process_next()
+        self.mock_queue.ack.assert_called_with([1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from modules.models.collection_request import CollectionRequest
+from modules.models.collection_types import Collection
+from modules.utils.ingest_journal import IngestJournal
+from tests.test_base import BaseTestCase
+
+
+class TestIngestJournal(BaseTestCase):
+    """Test cases for the on-disk ingest journal."""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.journal = IngestJournal(self.directory)
+
+    def tearDown(self):
+        super().tearDown()
+        self.journal.close(remove=False)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _orphan(self, name="ingest-orphan.journal"):
+        """Copy the current journal contents to a file no process holds."""
+        path = os.path.join(self.directory, name)
+        with open(self.journal.path, "rb") as src, open(path, "wb") as dst:
+            dst.write(src.read())
+        return path
+
+    def _replay(self):
+        """Replay the orphans of the directory the way a newly started process would."""
+        replayed = []
+        fresh = IngestJournal(self.directory)
+        try:
+            fresh.replay_orphans(replayed.append)
+        finally:
+            fresh.close()
+        return replayed
+
+    def test_replays_unacknowledged_requests(self):
+        """Only requests without an ack are replayed, in their original order."""
+        first = self.journal.append(CollectionRequest(type=Collection.LOOT, items=[{"id": 1}]))
+        self.journal.append(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 2}]))
+        self.journal.append(CollectionRequest(type=Collection.RAID, items=[{"id": 3}]))
+        self.journal.ack([first])
+        orphan = self._orphan()
+
+        replayed = self._replay()
+
+        self.assertEqual([r.type for r in replayed], [Collection.MARKET_LISTINGS, Collection.RAID])
+        self.assertEqual([r.items for r in replayed], [[{"id": 2}], [{"id": 3}]])
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_reused_pid_does_not_claim_orphan(self):
+        """A process reusing a dead worker's pid gets its own file and replays the orphan intact."""
+        self.journal.append(CollectionRequest(type=Collection.LOOT, items=[{"id": 1}]))
+        orphan = self._orphan(f"ingest-{os.getpid()}.journal")  # pre-uuid name of a dead worker
+        size = os.path.getsize(orphan)
+
+        fresh = IngestJournal(self.directory)
+        try:
+            self.assertNotEqual(fresh.path, orphan)
+            self.assertNotEqual(fresh.path, self.journal.path)
+            self.assertEqual(os.path.getsize(orphan), size)
+
+            replayed = []
+            fresh.replay_orphans(replayed.append)
+        finally:
+            fresh.close()
+
+        self.assertEqual([r.items for r in replayed], [[{"id": 1}]])
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_live_journal_is_not_replayed(self):
+        """A journal still locked by its process is left alone."""
+        self.journal.append(CollectionRequest(type=Collection.LOOT, items=[{"id": 1}]))
+
+        self.assertEqual(self._replay(), [])
+        self.assertTrue(os.path.exists(self.journal.path))
+
+    def test_torn_tail_is_ignored(self):
+        """A record cut off by a crash mid-write is skipped; earlier records survive."""
+        self.journal.append(CollectionRequest(type=Collection.LOOT, items=[{"id": 1}]))
+        self.journal.append(CollectionRequest(type=Collection.LOOT, items=[{"id": 2}]))
+        orphan = self._orphan()
+        with open(orphan, "r+b") as f:
+            f.truncate(os.path.getsize(orphan) - 3)
+
+        replayed = self._replay()
+
+        self.assertEqual([r.items for r in replayed], [[{"id": 1}]])
+
+    def test_file_is_emptied_when_idle(self):
+        """Once every request is acknowledged the journal is truncated."""
+        seqs = [self.journal.append(CollectionRequest(type=Collection.LOOT, items=[{"id": i}])) for i in range(3)]
+        self.journal.ack(seqs)
+
+        self.assertEqual(os.path.getsize(self.journal.path), 0)
+        self.assertEqual(self.journal.pending(), 0)
+
+    def test_compaction_keeps_outstanding_requests(self):
+        """A journal above max_bytes is rewritten with only the outstanding requests."""
+        self.journal.max_bytes = 1
+        kept = self.journal.append(CollectionRequest(type=Collection.LOOT, items=[{"id": "kept"}]))
+        done = self.journal.append(CollectionRequest(type=Collection.LOOT, items=[{"id": "done"}]))
+        self.journal.ack([done])
+        self._orphan()
+
+        replayed = self._replay()
+
+        self.assertEqual([r.items for r in replayed], [[{"id": "kept"}]])
+        self.assertEqual(self.journal.pending(), 1)
+        self.assertEqual(kept, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
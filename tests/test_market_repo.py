@@ -0,0 +1,611 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from modules.models.collection_types import Collection
+from modules.models.sort_options import SortOption
+from modules.repositories import market_repo
+from modules.utils.cursor import decode_cursor, encode_cursor
+from tests.test_base import BaseTestCase
+
+
+class TestMarketRepo(BaseTestCase):
+    """Test cases for the market_repo module."""
+
+    def setUp(self):
+        """Set up test fixtures before each test."""
+        super().setUp()
+
+        self.current_time = datetime(2025, 5, 5, 12, 0, 0, tzinfo=timezone.utc)
+        self.mock_collection = self.setup_collection_mock('modules.repositories.market_repo')
+        self.mock_config = self.create_patch('modules.repositories.market_repo.Config')
+        self.mock_config.MARKET_RECOMPUTE_WINDOW = 60.0
+        self.mock_config.LISTINGS_COUNT_EXACT_LIMIT = 100
+        self.mock_config.LISTINGS_COUNT_SAMPLE_SIZE = 50
+        self.mock_config.LISTINGS_COUNT_CACHE_TTL = 30.0
+        self.mock_config.MARKET_AVERAGES_CACHE_TTL = 0
+        self.mock_config.MARKET_RANKING_CACHE_TTL = 3600.0
+        self.mock_config.MARKET_RANKING_MAX_DAYS = 90
+        self.mock_config.HISTORY_MAX_POINTS = 120
+
+        market_repo._dirty_items.clear()
+        market_repo._listing_counts.clear()
+        market_repo._ranking_cache.clear()
+        market_repo.invalidate_archive_priors()
+        self.reset_averages_cache()
+        self.mock_collection.estimated_document_count.return_value = 0
+        self.mock_collection.count_documents.return_value = 0
+
+    def tearDown(self):
+        """Clean up after each test."""
+        timer = market_repo._flush_timer
+        if timer is not None:
+            timer.cancel()
+        market_repo._flush_timer = None
+        market_repo._dirty_items.clear()
+        market_repo.invalidate_archive_priors()
+        super().tearDown()
+
+    @staticmethod
+    def reset_averages_cache():
+        market_repo._averages_cache = {}
+        market_repo._averages_watermark = None
+        market_repo._averages_loaded_at = None
+        market_repo._averages_checked_at = 0.0
+
+    def create_listing(self, name="Divzer", tier=None, shiny_stat=None, timestamp=None, item_type="GearItem"):
+        """Create a listing as stored by market_repo.save()."""
+        return {
+            "name": name,
+            "tier": tier,
+            "shiny_stat": shiny_stat,
+            "item_type": item_type,
+            "icon": None,
+            "timestamp": timestamp or self.current_time,
+        }
+
+    def test_mark_dirty_coalesces_same_key(self):
+        """Repeated listings of the same item are flushed as a single stub."""
+        mock_update = self.create_patch('modules.repositories.market_repo.update_moving_averages')
+        later = self.current_time.replace(minute=5)
+
+        market_repo.mark_dirty([self.create_listing()])
+        market_repo.mark_dirty([self.create_listing(timestamp=later), self.create_listing(name="Idol")])
+        market_repo.flush_moving_averages()
+
+        mock_update.assert_called_once()
+        stubs = mock_update.call_args.kwargs['items']
+        self.assertEqual(len(stubs), 2)
+        divzer = next(stub for stub in stubs if stub['name'] == "Divzer")
+        self.assertEqual(divzer['last_ts'], later)
+
+    def test_flush_without_pending_keys(self):
+        """Flushing with nothing marked dirty does not touch the database."""
+        mock_update = self.create_patch('modules.repositories.market_repo.update_moving_averages')
+
+        market_repo.flush_moving_averages()
+
+        mock_update.assert_not_called()
+
+    def test_update_moving_averages_single_bulk_write(self):
+        """All stale keys are written with one bulk_write."""
+        self.mock_collection.find.return_value = []
+        self.mock_collection.aggregate.side_effect = [
+            iter([
+                {'_id': {'name': "Divzer", 'tier': None, 'shiny': False}, 'identifiedPrices': [{'p': 100, 'a': 1}]},
+                {'_id': {'name': "Idol", 'tier': None, 'shiny': False}, 'identifiedPrices': [{'p': 50, 'a': 1}]},
+            ]),
+            iter([]),  # daily prior load
+            iter([]),  # lookup of keys without a recent snapshot
+        ]
+
+        market_repo.update_moving_averages([
+            self.create_listing(),
+            self.create_listing(),
+            self.create_listing(name="Idol"),
+        ])
+
+        self.mock_collection.bulk_write.assert_called_once()
+        ops = self.mock_collection.bulk_write.call_args.args[0]
+        self.assertEqual(len(ops), 2)
+        self.assertEqual(ops[0]._filter, {'name': "Divzer", 'tier': None, 'shiny': False})
+        self.assertEqual(ops[0]._doc['$set']['average_p50_ema_price'], 100)
+        self.assertEqual(ops[0]._doc['$set']['name_key'], "divzer")
+        # The cache watermark uses the server's write time, not the chunk's start
+        self.assertNotIn('updated_at', ops[0]._doc['$set'])
+        self.assertEqual(ops[0]._doc['$currentDate'], {'updated_at': True})
+
+    def test_update_moving_averages_skips_fresh_keys(self):
+        """Keys whose stored average is newer than the listings are not recomputed."""
+        self.mock_collection.find.return_value = [
+            {'name': "Divzer", 'tier': None, 'shiny': False, 'timestamp': self.current_time}
+        ]
+
+        market_repo.update_moving_averages([self.create_listing()])
+
+        self.mock_collection.aggregate.assert_not_called()
+        self.mock_collection.bulk_write.assert_not_called()
+
+    def test_update_moving_averages_complete_single_scan(self):
+        """The complete recompute derives stubs and statistics from one listings scan."""
+        last_ts = self.current_time
+        self.mock_collection.aggregate.side_effect = [
+            iter([
+                {'_id': {'name': "Divzer", 'tier': None, 'shiny': False}, 'identifiedPrices': [{'p': 100, 'a': 1}],
+                 'icon': None, 'item_type': "GearItem", 'last_ts': last_ts},
+                {'_id': {'name': "Refined Oak Wood", 'tier': 2, 'shiny': False}, 'identifiedPrices': [{'p': 10, 'a': 64}],
+                 'icon': None, 'item_type': "MaterialItem", 'last_ts': last_ts},
+            ]),
+            iter([
+                {'_id': {'name': "Divzer", 'tier': None, 'shiny': False}, 'p50_price': 80},
+                {'_id': {'name': "Refined Oak Wood", 'tier': 2, 'shiny': False}, 'p50_price': 10},
+            ]),
+        ]
+
+        market_repo.update_moving_averages_complete(force_update=True)
+
+        # one listings scan + one daily archive-prior load
+        self.assertEqual(self.mock_collection.aggregate.call_count, 2)
+        ops = self.mock_collection.bulk_write.call_args.args[0]
+        self.assertEqual([op._filter for op in ops], [
+            {'name': "Divzer", 'tier': None, 'shiny': False},
+            {'name': "Refined Oak Wood", 'tier': 2, 'shiny': False},
+        ])
+        self.assertEqual(ops[1]._doc['$set']['item_type'], "MaterialItem")
+        self.assertEqual(ops[0]._doc['$set']['average_p50_ema_price'], 85.0)
+
+    def test_archive_priors_cached_per_day(self):
+        """Priors are loaded once per calendar day and reloaded after a rollover or invalidation."""
+        key = ("Divzer", None, False)
+        self.mock_collection.aggregate.side_effect = lambda *args, **kwargs: iter([
+            {'_id': {'name': "Divzer", 'tier': None, 'shiny': False}, 'average_p50_ema_price': 90}
+        ])
+
+        priors = market_repo._get_archive_priors([key], self.current_time)
+        market_repo._get_archive_priors([key], self.current_time.replace(hour=23))
+        self.assertEqual(priors[key], (90, None))
+        self.assertEqual(self.mock_collection.aggregate.call_count, 1)
+
+        market_repo._get_archive_priors([key], self.current_time.replace(day=6))
+        self.assertEqual(self.mock_collection.aggregate.call_count, 2)
+
+        market_repo.invalidate_archive_priors()
+        market_repo._get_archive_priors([key], self.current_time.replace(day=6))
+        self.assertEqual(self.mock_collection.aggregate.call_count, 3)
+
+    def test_archive_priors_memoize_missing_keys(self):
+        """Keys without any archive history are looked up once and remembered."""
+        key = ("Idol", None, False)
+        self.mock_collection.aggregate.side_effect = lambda *args, **kwargs: iter([])
+
+        market_repo._get_archive_priors([key], self.current_time)
+        priors = market_repo._get_archive_priors([key], self.current_time)
+
+        self.assertEqual(priors[key], (None, None))
+        # daily load + one lookup for the missing key
+        self.assertEqual(self.mock_collection.aggregate.call_count, 2)
+
+    def test_calculate_listing_averages_weights_amount(self):
+        """A stack of listings counts once per unit without being expanded in the pipeline."""
+        self.mock_collection.aggregate.return_value.next.return_value = {
+            '_id': None,
+            'name': "Refined Oak Wood",
+            'tier': 2,
+            'identifiedPrices': [{'p': 10, 'a': 64}, {'p': 20, 'a': 1}],
+            'unidentifiedPrices': [],
+        }
+
+        stats = market_repo.calculate_listing_averages("Refined Oak Wood", tier=2)
+
+        pipeline = self.mock_collection.aggregate.call_args.args[0]
+        self.assertNotIn('$unwind', [stage_name for stage in pipeline for stage_name in stage])
+        self.assertEqual(stats['total_count'], 65)
+        self.assertEqual(stats['p50_price'], 10)
+        self.assertEqual(stats['highest_price'], 20)
+        self.assertEqual(stats['average_price'], round((640 + 20) / 65, 2))
+        self.assertIsNone(stats['unidentified_p50_price'])
+        self.assertEqual(stats['unidentified_count'], 0)
+
+    def test_save_stores_search_fields(self):
+        """Listings are stored with a normalized name and its trigrams."""
+        self.mock_collection.insert_many.return_value.inserted_ids = [1]
+        self.create_patch('modules.repositories.market_repo.mark_dirty')
+        listing = {"name": "Nirvána  Tome"}
+
+        market_repo.save([listing])
+
+        self.assertEqual(listing["search_name"], "nirvana tome")
+        self.assertEqual(listing["search_tokens"][:3], ["nir", "irv", "rva"])
+
+    def test_listings_name_search_uses_tokens(self):
+        """Name searches match trigrams plus a regex on the normalized name, not a raw regex on name."""
+        self.mock_collection.find.return_value.sort.return_value.skip.return_value.limit.return_value = []
+
+        market_repo.get_trade_market_item_listings(item_name="Divz")
+
+        query = self.mock_collection.find.call_args.kwargs["filter"]
+        self.assertNotIn("name", query)
+        self.assertEqual(query["search_name"], {"$regex": "divz"})
+        self.assertEqual(query["search_tokens"], {"$all": ["div", "ivz"]})
+
+    def test_listings_short_name_search(self):
+        """Queries shorter than a trigram only use the search_name regex."""
+        self.mock_collection.find.return_value.sort.return_value.skip.return_value.limit.return_value = []
+
+        market_repo.get_trade_market_item_listings(item_name="Di")
+
+        query = self.mock_collection.find.call_args.kwargs["filter"]
+        self.assertEqual(query["search_name"], {"$regex": "di"})
+        self.assertNotIn("search_tokens", query)
+
+    def test_listings_return_next_cursor(self):
+        """A full page returns a cursor pointing after its last listing; _id is not exposed."""
+        ts = self.current_time
+        self.mock_collection.find.return_value.sort.return_value.skip.return_value.limit.return_value = [
+            {"_id": ObjectId("0123456789abcdef01234567"), "name": "A", "timestamp": ts},
+            {"_id": ObjectId("0123456789abcdef01234568"), "name": "B", "timestamp": ts},
+        ]
+
+        result = market_repo.get_trade_market_item_listings(page_size=2)
+
+        self.assertNotIn("_id", result["items"][0])
+        self.assertEqual(decode_cursor(result["next_cursor"]), {
+            "sort": "timestamp_desc", "value": ts, "id": ObjectId("0123456789abcdef01234568")
+        })
+        self.mock_collection.find.return_value.sort.assert_called_once_with([("timestamp", -1), ("_id", -1)])
+
+    def test_listings_cursor_seeks_instead_of_skipping(self):
+        """A cursor page filters past the last (sort value, _id) and does not skip."""
+        last_id = ObjectId("0123456789abcdef01234568")
+        cursor = encode_cursor({"sort": "listing_price_asc", "value": 500, "id": last_id})
+        self.mock_collection.find.return_value.sort.return_value.skip.return_value.limit.return_value = []
+
+        result = market_repo.get_trade_market_item_listings(
+            item_type="GearItem", sort_option=SortOption.LISTING_PRICE_ASC, page=7, cursor=cursor)
+
+        query = self.mock_collection.find.call_args.kwargs["filter"]
+        self.assertEqual(query, {"$and": [
+            {"item_type": "GearItem"},
+            {"$or": [{"listing_price": {"$gt": 500}}, {"listing_price": 500, "_id": {"$gt": last_id}}]},
+        ]})
+        self.mock_collection.find.return_value.sort.return_value.skip.assert_called_once_with(0)
+        self.assertIsNone(result["next_cursor"])
+        self.assertIsNone(result["page"])
+
+    def test_listings_cursor_after_null_values(self):
+        """Descending seeks past a null sort value stay within the trailing null group."""
+        last_id = ObjectId("0123456789abcdef01234568")
+        seek = market_repo._listing_seek_filter(
+            {"sort": "overall_roll_desc", "value": None, "id": last_id}, SortOption.OVERALL_ROLL_DESC)
+
+        self.assertEqual(seek, {"overall_roll": None, "_id": {"$lt": last_id}})
+
+    def test_listings_cursor_must_match_sort(self):
+        """A cursor issued for another sort order is rejected."""
+        cursor = encode_cursor({"sort": "timestamp_asc", "value": None, "id": ObjectId()})
+
+        with self.assertRaises(ValueError):
+            market_repo.get_trade_market_item_listings(cursor=cursor)
+        with self.assertRaises(ValueError):
+            market_repo.get_trade_market_item_listings(cursor="not-a-cursor")
+
+    def test_listings_count_exact_for_selective_filters(self):
+        """Filters matching fewer than the exact limit get an exact, bounded count."""
+        self.mock_collection.count_documents.return_value = 42
+
+        total = market_repo._count_listings(self.mock_collection, {"item_type": "GearItem"})
+
+        self.assertEqual(total, (42, False))
+        self.mock_collection.count_documents.assert_called_once_with({"item_type": "GearItem"}, limit=100)
+
+    def test_listings_count_estimated_for_broad_filters(self):
+        """Filters reaching the exact limit are estimated from a random sample."""
+        self.mock_collection.count_documents.return_value = 100
+        self.mock_collection.estimated_document_count.return_value = 10000
+        self.mock_collection.aggregate.return_value = iter([{"matched": 20}])
+
+        total = market_repo._count_listings(self.mock_collection, {"unidentified": {"$eq": True}})
+
+        self.assertEqual(total, (4000, True))
+        pipeline = self.mock_collection.aggregate.call_args.args[0]
+        self.assertEqual(pipeline[0], {"$sample": {"size": 50}})
+
+    def test_listings_count_unfiltered_uses_metadata(self):
+        """Unfiltered pages use the collection metadata count."""
+        self.mock_collection.estimated_document_count.return_value = 12345
+
+        self.assertEqual(market_repo._count_listings(self.mock_collection, {}), (12345, True))
+        self.mock_collection.count_documents.assert_not_called()
+
+    def test_listings_count_cached_per_filter(self):
+        """Repeated requests for the same filter reuse the cached total."""
+        self.mock_collection.count_documents.return_value = 7
+
+        market_repo._count_listings(self.mock_collection, {"item_type": "GearItem", "tier": None})
+        total = market_repo._count_listings(self.mock_collection, {"tier": None, "item_type": "GearItem"})
+
+        self.assertEqual(total, (7, False))
+        self.mock_collection.count_documents.assert_called_once()
+
+    def test_item_prices_single_query(self):
+        """Many price keys are resolved with one $or query and mapped back by key."""
+        self.mock_collection.find.return_value = [
+            {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 100},
+            {"name": "Paper", "tier": 2, "shiny": False, "p50_price": 5},
+        ]
+
+        prices = market_repo.get_trademarket_item_prices([
+            ("Divzer", False, None), ("Divzer", False, -1), ("Paper", False, 2), ("Unknown", True, None)
+        ])
+
+        self.mock_collection.find.assert_called_once()
+        clauses = self.mock_collection.find.call_args.args[0]["$or"]
+        self.assertEqual(len(clauses), 3)
+        self.assertEqual(prices[("Divzer", False, None)]["p50_price"], 100)
+        self.assertEqual(prices[("Paper", False, 2)]["p50_price"], 5)
+        self.assertEqual(prices[("Unknown", True, None)], {})
+
+    def test_price_key_normalizes_tier(self):
+        """Negative tiers mean "no tier"; positive ones and None are kept."""
+        self.assertEqual(market_repo.price_key("Divzer", False, -1), ("Divzer", False, None))
+        self.assertEqual(market_repo.price_key("Divzer", False, None), ("Divzer", False, None))
+        self.assertEqual(market_repo.price_key("Paper", 1, 2), ("Paper", True, 2))
+
+    def test_price_lookups_served_from_averages_cache(self):
+        """With the cache enabled, averages are loaded once and lookups don't query Mongo."""
+        self.mock_config.MARKET_AVERAGES_CACHE_TTL = 60
+        self.mock_collection.find.return_value = [
+            {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 100, "updated_at": self.current_time},
+        ]
+
+        first = market_repo.get_trademarket_item_price("Divzer")
+        second = market_repo.get_trademarket_item_prices([("Divzer", False, None), ("Unknown", False, None)])
+
+        self.mock_collection.find.assert_called_once_with({}, {"_id": False, "name_key": False})
+        self.mock_collection.find_one.assert_not_called()
+        self.assertEqual(first, {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 100})
+        self.assertEqual(second[("Divzer", False, None)]["p50_price"], 100)
+        self.assertEqual(second[("Unknown", False, None)], {})
+
+    def test_averages_cache_hides_internal_fields(self):
+        """Cached lookups return the same fields as uncached ones: no name_key or updated_at."""
+        self.mock_config.MARKET_AVERAGES_CACHE_TTL = 60
+        stored = {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 100,
+                  "name_key": "divzer", "updated_at": self.current_time}
+
+        def find(query, projection):
+            hidden = {field for field, shown in projection.items() if not shown}
+            return [{field: value for field, value in stored.items() if field not in hidden}]
+
+        self.mock_collection.find.side_effect = find
+
+        price = market_repo.get_trademarket_item_price("Divzer")
+        prices = market_repo.get_trademarket_item_prices([("Divzer", False, None)])
+
+        expected = {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 100}
+        self.assertEqual(price, expected)
+        self.assertEqual(prices[("Divzer", False, None)], expected)
+        self.assertEqual(market_repo._averages_watermark, self.current_time)
+
+    def test_averages_reload_does_not_mutate_published_cache(self):
+        """A reader holding the cache dict during a full reload keeps seeing complete data."""
+        self.mock_config.MARKET_AVERAGES_CACHE_TTL = 60
+        self.mock_collection.find.return_value = [
+            {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 100, "updated_at": self.current_time},
+        ]
+        held = market_repo._get_cached_averages()
+
+        market_repo._averages_loaded_at -= market_repo._AVERAGES_FULL_RELOAD_SECONDS
+        market_repo.invalidate_averages_cache()
+        self.mock_collection.find.return_value = [
+            {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 120, "updated_at": self.current_time},
+        ]
+        reloaded = market_repo._get_cached_averages()
+
+        self.assertEqual(held[("Divzer", False, None)]["p50_price"], 100)
+        self.assertEqual(reloaded[("Divzer", False, None)]["p50_price"], 120)
+        self.assertIsNot(held, reloaded)
+
+    def test_averages_cache_polls_deltas_after_invalidation(self):
+        """After our own write (or the TTL), only documents past the watermark are fetched."""
+        self.mock_config.MARKET_AVERAGES_CACHE_TTL = 60
+        self.mock_collection.find.return_value = [
+            {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 100, "updated_at": self.current_time},
+        ]
+        market_repo.get_trademarket_item_price("Divzer")
+
+        later = self.current_time + timedelta(minutes=1)
+        self.mock_collection.find.return_value = [
+            {"name": "Divzer", "tier": None, "shiny": False, "p50_price": 120, "updated_at": later},
+        ]
+        market_repo.invalidate_averages_cache()
+        price = market_repo.get_trademarket_item_price("Divzer")
+
+        self.assertEqual(price["p50_price"], 120)
+        delta_query = self.mock_collection.find.call_args.args[0]
+        self.assertEqual(delta_query, {"updated_at": {"$gte": self.current_time - timedelta(seconds=5)}})
+        self.assertEqual(market_repo._averages_watermark, later)
+
+    def test_ranking_served_from_snapshot(self):
+        """The stored default-window snapshot is returned without aggregating the archive."""
+        snapshot = {"items": [{"rank": 1, "name": "Divzer"}], "etag": "abc"}
+        self.mock_collection.find_one.return_value = snapshot
+        start_date, end_date = market_repo._archive_window()
+
+        result = market_repo.get_ranking_snapshot()
+
+        self.assertEqual(result, snapshot)
+        query = self.mock_collection.find_one.call_args.args[0]
+        self.assertEqual(query["_id"], market_repo._ranking_snapshot_id(start_date, end_date))
+        self.mock_collection.aggregate.assert_not_called()
+
+    def test_default_window_stored_on_miss(self):
+        """Before the archive job ran, the default window is computed once and stored."""
+        self.mock_collection.find_one.return_value = None
+        self.mock_collection.aggregate.return_value = []
+
+        result = market_repo.get_ranking_snapshot()
+
+        replace_filter, stored = self.mock_collection.replace_one.call_args.args
+        self.assertEqual(replace_filter, {"_id": market_repo._ranking_snapshot_id(*market_repo._archive_window())})
+        self.assertIs(stored, result)
+
+    def test_custom_range_cached_in_process(self):
+        """A custom range is ranked once, cached with a stable ETag and never stored."""
+        self.mock_collection.aggregate.return_value = [
+            {"_id": {"name": "Divzer", "tier": None}, "average_price": 200.0},
+            {"_id": {"name": "Nirvana", "tier": None}, "average_price": 100.0},
+        ]
+
+        result = market_repo.get_ranking_snapshot(datetime(2025, 5, 1, 15), datetime(2025, 5, 3, 9))
+        again = market_repo.get_ranking_snapshot(datetime(2025, 5, 1), datetime(2025, 5, 3))
+
+        self.assertEqual([item["rank"] for item in result["items"]], [1, 2])
+        self.assertEqual(result["etag"], market_repo._ranking_etag(result["items"]))
+        self.assertEqual(result["start_date"], datetime(2025, 5, 1, tzinfo=timezone.utc))
+        self.assertIs(again, result)
+        self.mock_collection.aggregate.assert_called_once()
+        self.mock_collection.find_one.assert_not_called()
+        self.mock_collection.replace_one.assert_not_called()
+
+    def test_custom_range_cache_is_bounded(self):
+        """Varying the dates evicts older ranges instead of growing the cache."""
+        self.mock_collection.aggregate.return_value = []
+
+        for offset in range(market_repo._ranking_cache.maxsize + 10):
+            start_date = datetime(2024, 1, 1) + timedelta(days=offset)
+            market_repo.get_ranking_snapshot(start_date, start_date + timedelta(days=6))
+
+        self.assertEqual(len(market_repo._ranking_cache), market_repo._ranking_cache.maxsize)
+
+    def test_custom_range_not_cached_without_ttl(self):
+        self.mock_config.MARKET_RANKING_CACHE_TTL = 0
+        self.mock_collection.aggregate.return_value = []
+
+        market_repo.get_ranking_snapshot(datetime(2025, 5, 1), datetime(2025, 5, 3))
+        market_repo.get_ranking_snapshot(datetime(2025, 5, 1), datetime(2025, 5, 3))
+
+        self.assertEqual(self.mock_collection.aggregate.call_count, 2)
+
+    def test_ranking_range_limited(self):
+        """Ranges longer than MARKET_RANKING_MAX_DAYS, or reversed, are rejected before aggregating."""
+        with self.assertRaises(ValueError):
+            market_repo.get_ranking_snapshot(datetime(2025, 1, 1), datetime(2025, 4, 1))
+        with self.assertRaises(ValueError):
+            market_repo.get_ranking_snapshot(datetime(2025, 5, 3), datetime(2025, 5, 1))
+
+        market_repo.get_ranking_snapshot(datetime(2025, 1, 1), datetime(2025, 3, 31))
+        self.mock_collection.aggregate.assert_called_once()
+
+    def test_refresh_ranking_snapshots_drops_covering_ranges(self):
+        """The archive job invalidates every range containing the archived day."""
+        self.mock_collection.delete_many.return_value.deleted_count = 2
+        self.mock_collection.aggregate.return_value = []
+        archived_day = datetime(2025, 5, 4, tzinfo=timezone.utc)
+
+        snapshot = market_repo.refresh_ranking_snapshots(archived_day)
+
+        self.mock_collection.delete_many.assert_called_once_with({
+            "start_date": {"$lte": archived_day},
+            "end_date": {"$gte": archived_day},
+        })
+        self.assertEqual(snapshot["items"], [])
+        self.mock_collection.replace_one.assert_called_once()
+
+    def test_rollup_segments_use_whole_months_and_weeks(self):
+        """A long range is covered by whole months, then whole weeks, then single days."""
+        utc = timezone.utc
+        segments = market_repo._rollup_segments(datetime(2025, 1, 29, tzinfo=utc), datetime(2025, 4, 20, tzinfo=utc))
+
+        self.assertEqual(segments, [
+            ("day", datetime(2025, 1, 29, tzinfo=utc), datetime(2025, 2, 1, tzinfo=utc)),
+            ("month", datetime(2025, 2, 1, tzinfo=utc), datetime(2025, 4, 1, tzinfo=utc)),
+            ("day", datetime(2025, 4, 1, tzinfo=utc), datetime(2025, 4, 7, tzinfo=utc)),
+            ("week", datetime(2025, 4, 7, tzinfo=utc), datetime(2025, 4, 14, tzinfo=utc)),
+            ("day", datetime(2025, 4, 14, tzinfo=utc), datetime(2025, 4, 20, tzinfo=utc)),
+        ])
+
+    def test_price_history_switches_to_weekly_rollups(self):
+        """Ranges longer than the point budget are read from the weekly rollups."""
+        self.mock_collection.find.return_value = []
+
+        market_repo.get_price_history("Divzer", start_date=datetime(2025, 1, 1), end_date=datetime(2025, 12, 31))
+
+        self.mocks['get_collection'].assert_called_with(Collection.MARKET_ARCHIVE_WEEKLY)
+        kwargs = self.mock_collection.find.call_args.kwargs
+        self.assertEqual(kwargs["filter"]["timestamp"]["$gte"], datetime(2024, 12, 30, tzinfo=timezone.utc))
+        self.assertEqual(kwargs["projection"], market_repo._ROLLUP_PROJECTION)
+
+    def test_price_history_short_range_reads_daily_archive(self):
+        self.mock_collection.find.return_value = []
+
+        market_repo.get_price_history("Divzer", start_date=datetime(2025, 1, 1), end_date=datetime(2025, 1, 31))
+
+        self.mocks['get_collection'].assert_called_with(Collection.MARKET_ARCHIVE)
+
+    def test_price_history_projects_requested_fields(self):
+        """A field selection only fetches those statistics plus the item metadata."""
+        self.mock_collection.find.return_value = []
+
+        market_repo.get_price_history("Divzer", start_date=datetime(2025, 1, 1), end_date=datetime(2025, 1, 7),
+                                      fields=["p50_price"])
+
+        projection = self.mock_collection.find.call_args.kwargs["projection"]
+        self.assertFalse(projection.pop("_id"))
+        self.assertEqual(set(projection), {"p50_price", "name", "tier", "shiny", "item_type", "icon", "timestamp",
+                                           "period"})
+
+    def test_history_lookups_use_name_key(self):
+        """Both history endpoints match the normalized name instead of a regex or the raw name."""
+        self.mock_collection.find.return_value = []
+
+        market_repo.get_price_history("  Nirvána TOME", start_date=datetime(2025, 1, 1), end_date=datetime(2025, 1, 7))
+        history_filter = self.mock_collection.find.call_args.kwargs["filter"]
+        market_repo.get_historic_average("Nirvana Tome", start_date=datetime(2025, 1, 1), end_date=datetime(2025, 1, 7))
+        average_filter = self.mock_collection.find.call_args.args[0]["$and"][0]
+
+        self.assertEqual(history_filter["name_key"], "nirvana tome")
+        self.assertNotIn("name", history_filter)
+        self.assertEqual(average_filter["name_key"], "nirvana tome")
+
+    def test_historic_average_combines_rollups_and_days(self):
+        """Rollup sums/counts combine with daily snapshots like a per-day average."""
+        utc = timezone.utc
+        days = [
+            {"name": "Divzer", "tier": None, "timestamp": datetime(2025, 1, d, tzinfo=utc),
+             "average_price": price, "p50_price": None, "total_count": 2, "average_p50_ema_price": price}
+            for d, price in ((1, 100.0), (2, 200.0), (3, 600.0))
+        ]
+        rollup = {
+            "name": "Divzer", "tier": None, "timestamp": datetime(2025, 1, 1, tzinfo=utc), "period": "week",
+            "document_count": 2, "total_count": 4, "average_p50_ema_price": 200.0,
+            "sums": dict.fromkeys(market_repo._ROLLUP_AVG_FIELDS, 0.0) | {"average_price": 300.0},
+            "counts": dict.fromkeys(market_repo._ROLLUP_AVG_FIELDS, 0) | {"average_price": 2},
+        }
+
+        combined = market_repo._combine_archive_docs([days[2], rollup])
+
+        self.assertEqual(combined["average_price"], 300.0)
+        self.assertEqual(combined["document_count"], 3)
+        self.assertEqual(combined["total_count"], 6)
+        self.assertIsNone(combined["p50_price"])
+        self.assertEqual(combined["average_p50_ema_price"], 600.0)
+        self.assertEqual(market_repo._combine_archive_docs(days), combined)
+
+    def test_update_archive_rollups_merges_week_and_month(self):
+        market_repo.update_archive_rollups(datetime(2025, 5, 14, tzinfo=timezone.utc))
+
+        pipelines = [call.args[0] for call in self.mock_collection.aggregate.call_args_list]
+        self.assertEqual([p[-1]["$merge"]["into"] for p in pipelines],
+                         ["trademarket_archive_weekly", "trademarket_archive_monthly"])
+        self.assertEqual(pipelines[0][0]["$match"]["timestamp"], {
+            "$gte": datetime(2025, 5, 12, tzinfo=timezone.utc), "$lt": datetime(2025, 5, 19, tzinfo=timezone.utc)
+        })
+        self.assertEqual(pipelines[1][0]["$match"]["timestamp"], {
+            "$gte": datetime(2025, 5, 1, tzinfo=timezone.utc), "$lt": datetime(2025, 6, 1, tzinfo=timezone.utc)
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+from flask import Flask, g
+
+from modules.routes.api.market import market_bp
+from modules.schemas.price_request import MAX_PRICE_ITEMS
+from tests.test_base import BaseTestCase
+
+
+class TestMarketRoutes(BaseTestCase):
+    """Test cases for the bulk price (POST /api/trademarket/items/prices) and ranking endpoints."""
+
+    def setUp(self):
+        super().setUp()
+        self.mock_get_prices = self.create_patch('modules.routes.api.market.get_prices', return_value={})
+        self.mock_get_ranking = self.create_patch('modules.routes.api.market.get_ranking')
+        self.create_patch('modules.utils.param_utils.logger')
+
+        app = Flask(__name__)
+        app.register_blueprint(market_bp)
+
+        # Stand-in for require_api_key(): a key holding the endpoint's scope
+        @app.before_request
+        def grant_scope():
+            g.scopes = {'read:market'}
+
+        self.client = app.test_client()
+
+    def post_prices(self, body):
+        return self.client.post('/api/trademarket/items/prices', json=body)
+
+    def test_empty_list_rejected(self):
+        response = self.post_prices([])
+
+        self.assertEqual(response.status_code, 400)
+        self.mock_get_prices.assert_not_called()
+
+    def test_too_many_items_rejected(self):
+        response = self.post_prices([{"name": "Divzer"}] * (MAX_PRICE_ITEMS + 1))
+
+        self.assertEqual(response.status_code, 400)
+        self.mock_get_prices.assert_not_called()
+
+    def test_missing_name_rejected(self):
+        response = self.post_prices([{"name": "Divzer"}, {"tier": 2, "shiny": False}])
+
+        self.assertEqual(response.status_code, 400)
+        self.mock_get_prices.assert_not_called()
+
+    def test_max_items_accepted(self):
+        response = self.post_prices([{"name": "Divzer"}] * MAX_PRICE_ITEMS)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()), MAX_PRICE_ITEMS)
+
+    def test_results_keep_request_order(self):
+        """One result per requested item, in request order; unknown items return {}."""
+        self.mock_get_prices.return_value = {
+            ("Divzer", False, None): {"name": "Divzer", "p50_price": 100},
+            ("Paper", False, 2): {"name": "Paper", "tier": 2, "p50_price": 5},
+        }
+
+        response = self.post_prices([
+            {"name": "Paper", "tier": 2},
+            {"name": "Unknown", "shiny": True},
+            {"name": "Divzer", "tier": -1},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [
+            {"name": "Paper", "tier": 2, "p50_price": 5},
+            {},
+            {"name": "Divzer", "p50_price": 100},
+        ])
+        self.mock_get_prices.assert_called_once_with(
+            [("Paper", False, 2), ("Unknown", True, None), ("Divzer", False, None)]
+        )
+
+    def test_invalid_ranking_range_rejected(self):
+        """A range the repository refuses to aggregate is a client error, not a 500."""
+        self.mock_get_ranking.side_effect = ValueError("Ranking ranges are limited to 90 days")
+
+        response = self.client.get('/api/trademarket/ranking?start_date=2020-01-01&end_date=2025-01-01')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_ranking_served_with_etag(self):
+        self.mock_get_ranking.return_value = {"items": [{"rank": 1, "name": "Divzer"}], "etag": "abc"}
+
+        response = self.client.get('/api/trademarket/ranking')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["ETag"], '"abc"')
+        self.mock_get_ranking.assert_called_once_with(start_date=None, end_date=None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from datetime import datetime, timezone
+
+from modules.services import market_service
+from tests.test_base import BaseTestCase
+
+
+class TestMarketService(BaseTestCase):
+    """Test cases for the market_service module."""
+
+    def test_columnar_history(self):
+        """History documents become shared metadata plus one array per field."""
+        docs = [
+            {"name": "Divzer", "tier": None, "shiny": False, "item_type": "GearItem", "icon": "bow",
+             "timestamp": datetime(2025, 1, day, tzinfo=timezone.utc), "p50_price": price, "total_count": day}
+            for day, price in ((1, 100.0), (2, 120.0))
+        ]
+
+        result = market_service.to_columnar_history(docs, ["p50_price", "total_count", "lowest_price"])
+
+        self.assertEqual(result["name"], "Divzer")
+        self.assertEqual(result["period"], "day")
+        self.assertEqual(result["timestamps"], [1735689600000, 1735776000000])
+        self.assertEqual(result["p50_price"], [100.0, 120.0])
+        self.assertEqual(result["total_count"], [1, 2])
+        self.assertEqual(result["lowest_price"], [None, None])
+
+    def test_columnar_history_of_rollups(self):
+        docs = [{"name": "Divzer", "timestamp": datetime(2025, 1, 6, tzinfo=timezone.utc), "period": "week"}]
+
+        self.assertEqual(market_service.to_columnar_history(docs, [])["period"], "week")
+
+    def test_columnar_history_empty(self):
+        result = market_service.to_columnar_history([], ["p50_price"])
+
+        self.assertIsNone(result["name"])
+        self.assertIsNone(result["period"])
+        self.assertEqual(result["timestamps"], [])
+        self.assertEqual(result["p50_price"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
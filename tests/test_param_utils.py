@@ -0,0 +1,40 @@
+import unittest
+
+from flask import Flask
+
+from modules.utils.param_utils import conditional_response
+from tests.test_base import BaseTestCase
+
+
+class TestConditionalResponse(BaseTestCase):
+    """Test cases for ETag handling in conditional_response()."""
+
+    def setUp(self):
+        super().setUp()
+        self.app = Flask(__name__)
+
+    def respond(self, if_none_match=None):
+        headers = {"If-None-Match": if_none_match} if if_none_match else {}
+        with self.app.test_request_context(headers=headers):
+            response, status_code = conditional_response({"regions": []}, "abc123")
+            return response, status_code
+
+    def test_response_carries_etag(self):
+        response, status_code = self.respond()
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(response.headers["ETag"], '"abc123"')
+
+    def test_matching_etag_is_not_modified(self):
+        self.assertEqual(self.respond('"abc123"')[1], 304)
+
+    def test_weak_etag_from_proxy_is_not_modified(self):
+        """Proxies and CDNs send the tag back weakened (W/"...")."""
+        self.assertEqual(self.respond('W/"abc123"')[1], 304)
+
+    def test_other_etag_is_served(self):
+        self.assertEqual(self.respond('W/"other", "older"')[1], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from types import ModuleType, SimpleNamespace
+from unittest.mock import MagicMock
+
+from modules.utils import query_profiler
+from modules.utils.query_profiler import QueryProfiler, plan_summary
+from tests.test_base import BaseTestCase
+
+LABELS = ('market_repo.get_trade_market_item_listings', 'find', 'trademarket_listings')
+
+
+def started_event(command_name, command, request_id=1):
+    return SimpleNamespace(command_name=command_name, command=command, request_id=request_id,
+                           connection_id=('localhost', 27017), database_name='wynnventory')
+
+
+def succeeded_event(command_name, reply, duration_ms, request_id=1):
+    return SimpleNamespace(command_name=command_name, reply=reply, request_id=request_id,
+                           connection_id=('localhost', 27017), database_name='wynnventory',
+                           duration_micros=int(duration_ms * 1000))
+
+
+class TestQueryProfiler(BaseTestCase):
+    """Test cases for the MongoDB command profiler."""
+
+    def setUp(self):
+        super().setUp()
+        self.create_patch('modules.utils.query_profiler._call_site', return_value=LABELS[0])
+        config = self.create_patch('modules.utils.query_profiler.Config')
+        config.QUERY_SLOW_MS = 100.0
+        config.QUERY_EXPLAIN_INTERVAL = 300.0
+        self.profiler = QueryProfiler()
+        self.profiler._explain_thread = MagicMock()  # keep explains in the queue
+
+    def run_command(self, command, reply, duration_ms, command_name='find', request_id=1):
+        self.profiler.started(started_event(command_name, command, request_id))
+        self.profiler.succeeded(succeeded_event(command_name, reply, duration_ms, request_id))
+
+    def test_records_latency_and_returned_documents(self):
+        reply = {'cursor': {'firstBatch': [{}, {}, {}], 'id': 0}}
+        self.run_command({'find': 'trademarket_listings', 'filter': {}}, reply, 3, request_id=1)
+        self.run_command({'find': 'trademarket_listings', 'filter': {}}, reply, 30, request_id=2)
+
+        lines = self.profiler.render_prometheus()
+        labels = ('call_site="market_repo.get_trade_market_item_listings",'
+                  'command="find",collection="trademarket_listings"')
+        self.assertIn(f'mongo_command_duration_seconds_bucket{{{labels},le="0.005"}} 1', lines)
+        self.assertIn(f'mongo_command_duration_seconds_bucket{{{labels},le="0.05"}} 2', lines)
+        self.assertIn(f'mongo_command_duration_seconds_bucket{{{labels},le="+Inf"}} 2', lines)
+        self.assertIn(f'mongo_command_duration_seconds_count{{{labels}}} 2', lines)
+        self.assertIn(f'mongo_documents_returned_total{{{labels}}} 6', lines)
+        self.assertTrue(self.profiler._explain_queue.empty())
+
+    def test_const_labels_prefix_every_sample(self):
+        """Per-process counters are told apart by a pid label."""
+        self.run_command({'find': 'trademarket_listings', 'filter': {}}, {'cursor': {'firstBatch': [{}], 'id': 0}}, 3)
+
+        lines = self.profiler.render_prometheus({'pid': 1234})
+        samples = [line for line in lines if not line.startswith('#')]
+        self.assertTrue(samples)
+        self.assertTrue(all('{pid="1234",call_site=' in line for line in samples))
+
+    def test_slow_query_is_explained_once_per_interval(self):
+        command = {'find': 'trademarket_listings', 'filter': {'name': 'Divzer'}, 'lsid': {'id': 1},
+                   '$db': 'wynnventory', 'batchSize': 50}
+        self.run_command(command, {'cursor': {'firstBatch': [], 'id': 0}}, 250, request_id=1)
+        self.run_command(command, {'cursor': {'firstBatch': [], 'id': 0}}, 250, request_id=2)
+
+        self.assertEqual(self.profiler._explain_queue.qsize(), 1)
+        labels, database_name, explain_command = self.profiler._explain_queue.get_nowait()
+        self.assertEqual(labels, LABELS)
+        self.assertEqual(database_name, 'wynnventory')
+        self.assertEqual(explain_command, {'find': 'trademarket_listings', 'filter': {'name': 'Divzer'}})
+
+    def test_write_pipelines_are_not_explained(self):
+        command = {'aggregate': 'trademarket_archive', 'pipeline': [{'$match': {}}, {'$merge': {'into': 'x'}}]}
+        self.run_command(command, {'cursor': {'firstBatch': [], 'id': 0}}, 500, command_name='aggregate')
+
+        self.assertTrue(self.profiler._explain_queue.empty())
+
+    def test_record_explain(self):
+        explain = {
+            'queryPlanner': {'winningPlan': {
+                'stage': 'LIMIT', 'inputStage': {
+                    'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'timestamp_-1__id_-1'}}}},
+            'executionStats': {'nReturned': 50, 'totalDocsExamined': 4000, 'totalKeysExamined': 4000},
+        }
+
+        self.profiler.record_explain(LABELS, explain)
+
+        lines = self.profiler.render_prometheus()
+        labels = ('call_site="market_repo.get_trade_market_item_listings",'
+                  'command="find",collection="trademarket_listings"')
+        self.assertIn(f'mongo_slow_query_docs_examined_total{{{labels}}} 4000', lines)
+        self.assertIn(f'mongo_slow_query_docs_returned_total{{{labels}}} 50', lines)
+        self.assertIn(f'mongo_slow_query_plans_total{{{labels},plan="LIMIT>FETCH>IXSCAN(timestamp_-1__id_-1)"}} 1',
+                      lines)
+
+    def test_plan_summary(self):
+        plan = {'stage': 'SUBPLAN', 'inputStage': {'stage': 'OR', 'inputStages': [
+            {'stage': 'IXSCAN', 'indexName': 'a_1'}, {'stage': 'COLLSCAN'}]}}
+
+        self.assertEqual(plan_summary(plan), 'SUBPLAN>OR>[IXSCAN(a_1)|COLLSCAN]')
+        self.assertEqual(plan_summary({'queryPlan': {'stage': 'COLLSCAN'}}), 'COLLSCAN')
+
+    def test_failed_commands_are_counted(self):
+        self.profiler.started(started_event('insert', {'insert': 'trademarket_listings'}))
+        self.profiler.failed(SimpleNamespace(command_name='insert', request_id=1, connection_id=('localhost', 27017),
+                                             duration_micros=2000))
+
+        self.assertIn('mongo_command_failures_total{call_site="market_repo.get_trade_market_item_listings",'
+                      'command="insert",collection="trademarket_listings"} 1', self.profiler.render_prometheus())
+
+    def test_call_site_skips_anonymous_frames(self):
+        self.patches[0].stop()  # the real _call_site
+        self.patches.pop(0)
+        module = ModuleType('modules.repositories.example_repo')
+        exec("from modules.utils.query_profiler import _call_site\n"
+             "def find_items():\n"
+             "    return [_call_site() for _ in (1,)][0], (lambda: _call_site())()\n", module.__dict__)
+
+        self.assertEqual(module.find_items(), ('example_repo.find_items', 'example_repo.find_items'))
+        self.assertEqual(query_profiler._call_site(), 'unknown')
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(query_profiler._labels(('plan',), ('a"b\\c',)), 'plan="a\\"b\\\\c"')
+
+
+if __name__ == '__main__':
+    unittest.main()
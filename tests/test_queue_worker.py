@@ -2,7 +2,7 @@ import logging
 import time
 import unittest
 from queue import Queue
-from unittest.mock import MagicMock, call, patch
+from unittest.mock import MagicMock, patch
 
 from modules.models.collection_types import Collection
 from modules.utils import queue_worker
@@ -19,23 +19,27 @@ class TestQueueWorker(BaseTestCase):
         """Set up test fixtures before each test."""
         super().setUp()
 
-        # Reset the queue and create a new worker thread for each test
-        self.original_queue = queue_worker._request_queue
-        self.original_worker_thread = queue_worker._worker_thread
+        # Keep the running partitions so tests can swap them out
+        self.original_partitions = queue_worker._partitions
+        self.original_usage_partition = queue_worker._usage_partition
 
         # Create a patch for the logger to capture log messages
         self.mock_logger = self.create_patch('modules.utils.queue_worker.logger')
 
         # Reset the mock logger's call history
         self.mock_logger.reset_mock()
+        self.mock_dispatch_logger = self.create_patch('modules.utils.ingest_dispatch.logger')
+
+        # Keep the market batching window short so tests don't wait on it
+        self.create_patch('modules.utils.queue_worker.Config.MARKET_BATCH_MAX_WAIT_MS', new=20)
 
     def tearDown(self):
         """Clean up after each test."""
         super().tearDown()
 
-        # Restore the original queue and worker thread
-        queue_worker._request_queue = self.original_queue
-        queue_worker._worker_thread = self.original_worker_thread
+        # Restore the original partitions
+        queue_worker._partitions = self.original_partitions
+        queue_worker._usage_partition = self.original_usage_partition
 
     @patch('modules.repositories.market_repo.save')
     def test_enqueue_basic(self, mock_save):
@@ -102,7 +106,7 @@ class TestQueueWorker(BaseTestCase):
         time.sleep(0.1)
 
         # Verify the worker continued running despite the error
-        self.assertTrue(queue_worker._worker_thread.is_alive())
+        self.assertTrue(all(p.thread.is_alive() for p in queue_worker._partitions))
 
     def test_shutdown_workers(self):
         """Test the shutdown_workers function."""
@@ -115,26 +119,27 @@ class TestQueueWorker(BaseTestCase):
 
         # Save original objects
         original_usage_repo = queue_worker._usage_repo
-        original_thread = queue_worker._worker_thread
-        original_queue = queue_worker._request_queue
 
-        # Create a new queue for testing
+        # Create a partition with a new queue for testing
         test_queue = Queue()
+        test_partition = MagicMock(queue=test_queue, thread=mock_thread)
+        usage_queue = Queue()
 
         # Replace with mocks
-        queue_worker._worker_thread = mock_thread
+        queue_worker._partitions = [test_partition]
+        queue_worker._usage_partition = MagicMock(queue=usage_queue, thread=mock_thread)
         queue_worker._usage_repo = mock_usage_repo
-        queue_worker._request_queue = test_queue
 
         try:
             # Call shutdown_workers
             result = queue_worker.shutdown_workers()
 
-            # Verify the shutdown signal was added to the queue
+            # Verify the shutdown signal was added to the queues
             self.assertEqual(test_queue.get(), None)
+            self.assertEqual(usage_queue.get(), None)
 
-            # Verify the worker thread was joined
-            mock_thread.join.assert_called_once()
+            # Verify the worker threads were joined
+            self.assertEqual(mock_thread.join.call_count, 2)
 
             # Verify the in-memory buffers were flushed
             mock_usage_repo.flush_all.assert_called_once()
@@ -144,8 +149,60 @@ class TestQueueWorker(BaseTestCase):
         finally:
             # Restore original objects
             queue_worker._usage_repo = original_usage_repo
-            queue_worker._worker_thread = original_thread
-            queue_worker._request_queue = original_queue
+
+    def shutdown_with(self, partition_queue, thread_alive=False):
+        """Run shutdown_workers() on one data partition using `partition_queue`; returns (result, usage repo, flush)."""
+        mock_thread = MagicMock()
+        mock_thread.is_alive.return_value = thread_alive
+        mock_usage_repo = MagicMock()
+        mock_flush = self.create_patch('modules.repositories.market_repo.flush_moving_averages')
+
+        original_usage_repo = queue_worker._usage_repo
+        queue_worker._partitions = [MagicMock(index=0, queue=partition_queue, thread=mock_thread)]
+        queue_worker._usage_partition = MagicMock(index=1, queue=Queue(), thread=mock_thread)
+        queue_worker._usage_repo = mock_usage_repo
+        try:
+            return queue_worker.shutdown_workers(), mock_usage_repo, mock_flush
+        finally:
+            queue_worker._usage_repo = original_usage_repo
+
+    def test_shutdown_with_full_partition(self):
+        """A full partition gets the sentinel behind its queued requests and the buffers are still flushed."""
+        full_queue = Queue(maxsize=1)
+        full_queue.put("queued request")
+
+        result, mock_usage_repo, mock_flush = self.shutdown_with(full_queue)
+
+        self.assertTrue(result)
+        self.assertEqual(list(full_queue.queue), ["queued request", None])
+        self.assertEqual(full_queue.unfinished_tasks, 2)
+        mock_usage_repo.flush_all.assert_called_once()
+        mock_flush.assert_called_once()
+
+    def test_shutdown_flushes_when_worker_hangs(self):
+        result, mock_usage_repo, mock_flush = self.shutdown_with(Queue(), thread_alive=True)
+
+        self.assertFalse(result)
+        mock_usage_repo.flush_all.assert_called_once()
+        mock_flush.assert_called_once()
+
+    def test_shutdown_flushes_moving_averages_after_usage_error(self):
+        """A failing flush does not skip the others."""
+        mock_usage_repo = MagicMock()
+        mock_usage_repo.flush_all.side_effect = Exception("Mongo unavailable")
+        self.create_patch('modules.utils.queue_worker._usage_repo', new=mock_usage_repo)
+        mock_flush = self.create_patch('modules.repositories.market_repo.flush_moving_averages')
+
+        self.assertFalse(queue_worker._flush_buffers())
+        mock_flush.assert_called_once()
+
+    def test_unknown_full_policy_fails_loudly(self):
+        """A typo in INGEST_QUEUE_FULL_POLICY stops the startup instead of rejecting uploads."""
+        for policy in queue_worker.FULL_POLICIES:
+            queue_worker._validate_full_policy(policy)
+
+        with self.assertRaises(ValueError):
+            queue_worker._validate_full_policy("drop-oldest")
 
     @patch('modules.repositories.market_repo.save')
     def test_large_volume(self, mock_save):
@@ -166,16 +223,18 @@ class TestQueueWorker(BaseTestCase):
         # This might take some time, so we'll wait for the queue to be empty
         max_wait = 5  # Maximum wait time in seconds
         start_time = time.time()
-        while not queue_worker._request_queue.empty() and time.time() - start_time < max_wait:
+        partition = queue_worker._partition_for(Collection.MARKET_LISTINGS)
+        while partition.queue.unfinished_tasks and time.time() - start_time < max_wait:
             time.sleep(0.1)
 
         # Verify all items were processed
-        # The call count might be different due to how the queue is processed
+        # Consecutive market requests are merged, so there are fewer calls than requests
         self.assertGreaterEqual(mock_save.call_count, 1)
+        self.assertLess(mock_save.call_count, num_items)
 
-        # Verify the calls were made with the correct items
-        calls = [call([item]) for item in test_items]
-        mock_save.assert_has_calls(calls, any_order=True)
+        # Verify every item was saved exactly once, in order
+        saved = [item for args, _ in mock_save.call_args_list for item in args[0]]
+        self.assertEqual(saved, test_items)
 
     def test_unknown_collection_type(self):
         """Test handling an unknown collection type."""
@@ -202,10 +261,266 @@ class TestQueueWorker(BaseTestCase):
         time.sleep(0.1)
 
         # Verify the error was logged
-        self.mock_logger.error.assert_called_with(
+        self.mock_dispatch_logger.error.assert_called_with(
             f"No repository configured for {mock_collection!r}"
         )
 
+    def _stopped_partition(self, max_depth):
+        """Install a single partition whose consumer is not running, so requests stay queued."""
+        partition = queue_worker._Partition(0, max_depth)
+        queue_worker._partitions = [partition]
+        queue_worker._usage_partition = queue_worker._Partition(1, max_depth)
+        return partition
+
+    def test_reject_policy_raises_when_full(self):
+        """A full partition rejects new requests under the reject policy."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=2)
+
+        with patch('modules.utils.queue_worker.Config.INGEST_QUEUE_FULL_POLICY', queue_worker.POLICY_REJECT):
+            queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": 1}]))
+            queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": 2}]))
+            with self.assertRaises(queue_worker.QueueFullError):
+                queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": 3}]))
+
+        self.assertEqual(partition.queue.qsize(), 2)
+        self.assertEqual(partition.rejected, 1)
+
+    def test_block_policy_rejects_after_timeout(self):
+        """The block policy waits for space and rejects once the timeout expires."""
+        from modules.models.collection_request import CollectionRequest
+        self._stopped_partition(max_depth=1)
+
+        with patch('modules.utils.queue_worker.Config.INGEST_QUEUE_FULL_POLICY', queue_worker.POLICY_BLOCK), \
+                patch('modules.utils.queue_worker.Config.INGEST_QUEUE_BLOCK_TIMEOUT', 0.05):
+            queue_worker.enqueue(CollectionRequest(type=Collection.RAID, items=[{"id": 1}]))
+            with self.assertRaises(queue_worker.QueueFullError):
+                queue_worker.enqueue(CollectionRequest(type=Collection.RAID, items=[{"id": 2}]))
+
+    def test_drop_oldest_policy_evicts_head(self):
+        """The drop_oldest policy makes room by discarding the oldest request."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=2)
+
+        with patch('modules.utils.queue_worker.Config.INGEST_QUEUE_FULL_POLICY', queue_worker.POLICY_DROP_OLDEST):
+            for i in range(3):
+                queue_worker.enqueue(CollectionRequest(type=Collection.GAMBIT, items=[{"id": i}]))
+
+        remaining = [entry[1].items[0]["id"] for entry in list(partition.queue.queue)]
+        self.assertEqual(remaining, [1, 2])
+        self.assertEqual(partition.dropped, 1)
+
+    def test_api_usage_is_never_rejected(self):
+        """API usage records drop the oldest entry instead of failing the request."""
+        from modules.models.collection_request import CollectionRequest
+        self._stopped_partition(max_depth=1)
+        partition = queue_worker._usage_partition
+
+        with patch('modules.utils.queue_worker.Config.INGEST_QUEUE_FULL_POLICY', queue_worker.POLICY_REJECT):
+            queue_worker.enqueue(CollectionRequest(type=Collection.API_USAGE, items=[{"id": 1}]))
+            queue_worker.enqueue(CollectionRequest(type=Collection.API_USAGE, items=[{"id": 2}]))
+
+        self.assertEqual(partition.queue.qsize(), 1)
+        self.assertEqual(partition.dropped, 1)
+
+    def test_api_usage_never_evicts_mod_submissions(self):
+        """Usage records have their own partition, so a flood of them leaves queued mod data alone."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=2)
+
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 1}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": 2}]))
+        for i in range(5):
+            queue_worker.enqueue(CollectionRequest(type=Collection.API_USAGE, items=[{"key": i}]))
+
+        self.assertEqual([entry[1].items for entry in partition.queue.queue], [[{"id": 1}], [{"id": 2}]])
+        self.assertEqual(partition.dropped, 0)
+        self.assertEqual([entry[1].items for entry in queue_worker._usage_partition.queue.queue],
+                         [[{"key": 3}], [{"key": 4}]])
+
+    def test_drop_oldest_never_evicts_shutdown_sentinel(self):
+        """Eviction skips the shutdown signal; with nothing else queued the new request is dropped."""
+        from modules.models.collection_request import CollectionRequest
+        self._stopped_partition(max_depth=2)
+        partition = queue_worker._usage_partition
+
+        queue_worker.enqueue(CollectionRequest(type=Collection.API_USAGE, items=[{"key": 1}]))
+        partition.queue.put(None)
+        queue_worker.enqueue(CollectionRequest(type=Collection.API_USAGE, items=[{"key": 2}]))
+        self.assertEqual([entry and entry[1].items for entry in partition.queue.queue], [None, [{"key": 2}]])
+
+        partition = queue_worker._usage_partition = queue_worker._Partition(1, max_depth=1)
+        partition.queue.put(None)  # full with the sentinel only
+        queue_worker.enqueue(CollectionRequest(type=Collection.API_USAGE, items=[{"key": 3}]))
+
+        self.assertEqual(list(partition.queue.queue), [None])
+        self.assertEqual(partition.dropped, 1)
+        self.assertEqual(partition.queue.unfinished_tasks, 1)
+
+    def test_queue_metrics(self):
+        """Metrics report depth, counters and the age of the oldest queued request."""
+        from modules.models.collection_request import CollectionRequest
+        self._stopped_partition(max_depth=5)
+
+        queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": 1}]))
+        time.sleep(0.05)
+
+        metrics = queue_worker.get_queue_metrics()
+        self.assertEqual(len(metrics), 2)  # data partition + API usage partition
+        self.assertEqual(metrics[0]["depth"], 1)
+        self.assertEqual(metrics[0]["max_depth"], 5)
+        self.assertEqual(metrics[0]["enqueued"], 1)
+        self.assertGreater(metrics[0]["lag_seconds"], 0)
+
+    def test_collection_types_keep_their_partition(self):
+        """Requests of one collection type always land on the same partition."""
+        partitions = [queue_worker._Partition(i, 10) for i in range(2)]
+        queue_worker._partitions = partitions
+
+        self.assertIs(queue_worker._partition_for(Collection.LOOT), queue_worker._partition_for(Collection.LOOT))
+        self.assertIs(queue_worker._partition_for(Collection.MARKET_LISTINGS), partitions[0])
+        self.assertIs(queue_worker._partition_for(Collection.LOOT), partitions[1])
+        self.assertIs(queue_worker._partition_for(Collection.GAMBIT), partitions[1])
+        self.assertIs(queue_worker._partition_for(Collection.API_USAGE), queue_worker._usage_partition)
+        self.assertIs(queue_worker._partition_for("unknown"), partitions[0])
+
+    def test_market_batch_merges_consecutive_requests(self):
+        """Consecutive market requests are merged until the size threshold is reached."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=10)
+        for i in range(1, 5):
+            queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": i}]))
+
+        first = partition.queue.get()
+        with patch('modules.utils.queue_worker.Config.MARKET_BATCH_MAX_ITEMS', 3):
+            merged, consumed, deferred = queue_worker._collect_market_batch(partition, first)
+
+        self.assertEqual(merged.items, [{"id": 1}, {"id": 2}, {"id": 3}])
+        self.assertEqual(len(consumed), 3)
+        self.assertEqual(deferred, [])
+        self.assertEqual(partition.queue.qsize(), 1)
+
+    def test_market_batch_collects_past_other_collections(self):
+        """Requests of other types are set aside in order; later market requests still join the batch."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=10)
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 1}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": "loot"}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 2}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.RAID, items=[{"id": "raid"}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 3}]))
+
+        first = partition.queue.get()
+        merged, consumed, deferred = queue_worker._collect_market_batch(partition, first)
+
+        self.assertEqual(merged.items, [{"id": 1}, {"id": 2}, {"id": 3}])
+        self.assertEqual(len(consumed), 3)
+        self.assertEqual([entry[1].type for entry in deferred], [Collection.LOOT, Collection.RAID])
+
+    def test_market_batch_stops_at_shutdown(self):
+        """The shutdown sentinel ends the batch and is handed back after the set-aside requests."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=10)
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 1}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": "loot"}]))
+        partition.queue.put(None)
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 2}]))
+
+        first = partition.queue.get()
+        merged, consumed, deferred = queue_worker._collect_market_batch(partition, first)
+
+        self.assertEqual(merged.items, [{"id": 1}])
+        self.assertEqual(deferred[0][1].type, Collection.LOOT)
+        self.assertIsNone(deferred[1])
+        self.assertEqual(partition.queue.qsize(), 1)
+
+    @patch('modules.repositories.market_repo.save')
+    def test_market_batch_with_interleaved_usage(self, mock_market_save):
+        """Each mod POST is followed by its usage record; the market requests are still written together."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=10)
+        mock_usage_repo = self.create_patch('modules.utils.queue_worker._usage_repo')
+
+        for i in range(3):
+            queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": i}]))
+            queue_worker.enqueue(CollectionRequest(type=Collection.API_USAGE, items=[{"key": i}]))
+        partition.queue.put(None)
+        queue_worker._usage_partition.queue.put(None)
+
+        queue_worker._worker_loop(partition)
+        queue_worker._worker_loop(queue_worker._usage_partition)
+
+        mock_market_save.assert_called_once_with([{"id": 0}, {"id": 1}, {"id": 2}])
+        self.assertEqual(mock_usage_repo.save.call_count, 3)
+
+    @patch('modules.repositories.lootpool_repo.save')
+    @patch('modules.repositories.market_repo.save')
+    def test_worker_processes_deferred_requests(self, mock_market_save, mock_loot_save):
+        """The worker saves the merged market batch, then the requests set aside while collecting it."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=10)
+
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 1}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": "loot"}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 2}]))
+        partition.queue.put(None)
+
+        queue_worker._worker_loop(partition)
+
+        mock_market_save.assert_called_once_with([{"id": 1}, {"id": 2}])
+        mock_loot_save.assert_called_once_with([{"id": "loot"}])
+        self.assertEqual(partition.processed, 3)
+        self.assertEqual(partition.queue.unfinished_tasks, 0)
+
+    @patch('modules.repositories.market_repo.save')
+    def test_journal_acknowledges_processed_requests(self, mock_market_save):
+        """With a journal, requests are recorded on enqueue and acknowledged once processed."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=10)
+        journal = MagicMock()
+        journal.append.side_effect = [1, 2]
+        self.create_patch('modules.utils.queue_worker._journal', new=journal)
+
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 1}]))
+        queue_worker.enqueue(CollectionRequest(type=Collection.MARKET_LISTINGS, items=[{"id": 2}]))
+        self.assertEqual(journal.append.call_count, 2)
+        journal.ack.assert_not_called()
+
+        partition.queue.put(None)
+        queue_worker._worker_loop(partition)
+
+        journal.ack.assert_called_once_with([1, 2])
+
+    def test_journal_acknowledges_rejected_requests(self):
+        """A request rejected by a full queue is not replayed later."""
+        from modules.models.collection_request import CollectionRequest
+        self._stopped_partition(max_depth=1)
+        journal = MagicMock()
+        journal.append.side_effect = [1, 2]
+        self.create_patch('modules.utils.queue_worker._journal', new=journal)
+
+        with patch('modules.utils.queue_worker.Config.INGEST_QUEUE_FULL_POLICY', queue_worker.POLICY_REJECT):
+            queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": 1}]))
+            with self.assertRaises(queue_worker.QueueFullError):
+                queue_worker.enqueue(CollectionRequest(type=Collection.LOOT, items=[{"id": 2}]))
+
+        journal.ack.assert_called_once_with([2])
+
+    def test_external_mode_pushes_to_ingest_queue(self):
+        """With INGEST_MODE=external, writes go to the shared queue; API usage stays local."""
+        from modules.models.collection_request import CollectionRequest
+        partition = self._stopped_partition(max_depth=10)
+        mock_push = self.create_patch('modules.utils.queue_worker.ingest_queue_repo.push')
+
+        with patch('modules.utils.queue_worker.Config.INGEST_MODE', queue_worker.INGEST_MODE_EXTERNAL):
+            loot_request = CollectionRequest(type=Collection.LOOT, items=[{"id": 1}])
+            queue_worker.enqueue(loot_request)
+            queue_worker.enqueue(CollectionRequest(type=Collection.API_USAGE, items=[{"key": "k"}]))
+
+        mock_push.assert_called_once_with(loot_request)
+        self.assertEqual(partition.queue.qsize(), 0)
+        self.assertEqual(queue_worker._usage_partition.queue.qsize(), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
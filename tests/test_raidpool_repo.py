@@ -1,9 +1,12 @@
 import unittest
 from datetime import datetime, timedelta, timezone
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, call, patch
 
+from pymongo.errors import DuplicateKeyError
+
+from modules.repositories.base_pool_repo import replace_pool_pipeline
 from modules.repositories.raidpool_repo import save, save_gambits
-from tests.test_base import BaseTestCase
+from tests.test_base import BaseTestCase, apply_update
 
 
 class TestRaidpoolRepo(BaseTestCase):
@@ -61,6 +64,7 @@ class TestRaidpoolRepo(BaseTestCase):
             timestamp = self.current_time - timestamp_delta
 
         return {
+            "_id": "existing",
             "playerName": player_name,
             "modVersion": mod_version,
             "timestamp": timestamp,
@@ -99,17 +103,14 @@ class TestRaidpoolRepo(BaseTestCase):
             "day": self.next_reset.day
         }
 
-    def verify_find_one(self):
-        """Verify that find_one was called with the correct filter."""
-        self.mock_collection.find_one.assert_called_once_with(self.create_filter())
-
-    def verify_delete_one(self):
-        """Verify that delete_one was called with the correct filter."""
-        self.mock_collection.delete_one.assert_called_once_with(self.create_filter())
-
-    def verify_insert_one(self, expected_doc):
-        """Verify that insert_one was called with the correct document."""
-        self.mock_collection.insert_one.assert_called_once_with(expected_doc)
+    def verify_upsert(self, expected_doc, call_count=1):
+        """Verify that the gambit day was written with one conditional upsert."""
+        update = replace_pool_pipeline(expected_doc, self.current_time - timedelta(hours=1), items_field="gambits")
+        self.assertEqual(self.mock_collection.update_one.call_args_list,
+                         [call(self.create_filter(), update, upsert=True)] * call_count)
+        self.mock_collection.find_one.assert_not_called()
+        self.mock_collection.delete_one.assert_not_called()
+        self.mock_collection.insert_one.assert_not_called()
 
     def test_save(self):
         """Test the save function."""
@@ -127,10 +128,7 @@ class TestRaidpoolRepo(BaseTestCase):
         self.mock_repo_save.assert_called_once_with(test_pool)
 
     def test_save_gambits_new(self):
-        """Test saving new gambits (no existing document)."""
-        # Set up the mock collection to return None (no existing document)
-        self.mock_collection.find_one.return_value = None
-
+        """Test saving gambits: one conditional upsert, no reads or deletes."""
         # Create test gambits
         test_gambits = [
             self.create_test_gambit("Gambit1", data="test_data1"),
@@ -141,91 +139,130 @@ class TestRaidpoolRepo(BaseTestCase):
         save_gambits(test_gambits)
 
         # Verify database operations
-        self.verify_find_one()
-        self.verify_insert_one(self.create_expected_doc())
-        self.mock_collection.delete_one.assert_not_called()
+        self.verify_upsert(self.create_expected_doc())
+
+    def test_save_gambits_replacement_rule(self):
+        """Existing days are replaced when the upload has more gambits, or is stale (>1 hour) with as many."""
+        save_gambits([
+            self.create_test_gambit("Gambit1", data="test_data1"),
+            self.create_test_gambit("Gambit2", data="test_data2")
+        ])
+
+        update = self.mock_collection.update_one.call_args[0][1]
+        replace_with = update[0]["$replaceWith"]["$cond"]
+
+        old_count = {"$size": {"$ifNull": ["$gambits", []]}}
+        stale_before = self.current_time - timedelta(hours=1)
+        self.assertEqual(replace_with["if"], {"$or": [
+            {"$eq": [{"$type": "$timestamp"}, "missing"]},
+            {"$gt": [2, old_count]},
+            {"$and": [{"$lt": ["$timestamp", stale_before]}, {"$gte": [2, old_count]}]}
+        ]})
+        self.assertEqual(replace_with["then"], {"$mergeObjects": [{"_id": "$_id"}, {"$literal": self.create_expected_doc()}]})
+        self.assertEqual(replace_with["else"], "$$ROOT")
+
+    def stored_after_save(self, test_gambits, existing_doc):
+        """Save the gambits and apply the written update pipeline to the stored document."""
+        save_gambits(test_gambits)
+        return apply_update(self.mock_collection.update_one.call_args[0][1], existing_doc)
+
+    def test_save_gambits_inserts_new_day(self):
+        """Without a stored document the upload is inserted."""
+        stored = self.stored_after_save([
+            self.create_test_gambit("Gambit1", data="test_data1"),
+            self.create_test_gambit("Gambit2", data="test_data2")
+        ], None)
+
+        self.assertEqual(stored, self.create_expected_doc())
 
     def test_save_gambits_replace_more(self):
         """Test replacing existing gambits when the new ones have more items."""
-        # Set up the mock collection to return an existing document with fewer items
         existing_gambits = [self.create_gambit_entry("Gambit1", "2025-05-08 11:30:00", "test_data1")]
-        self.mock_collection.find_one.return_value = self.create_existing_doc(
-            gambits=existing_gambits,
-            timestamp_delta=timedelta(minutes=30)
-        )
+        existing_doc = self.create_existing_doc(gambits=existing_gambits, timestamp_delta=timedelta(minutes=30))
 
-        # Create test gambits with more items
-        test_gambits = [
+        stored = self.stored_after_save([
             self.create_test_gambit("Gambit1", data="test_data1"),
             self.create_test_gambit("Gambit2", data="test_data2")
-        ]
+        ], existing_doc)
 
-        # Call the save_gambits function
-        save_gambits(test_gambits)
-
-        # Verify database operations
-        self.verify_find_one()
-        self.verify_delete_one()
-        self.verify_insert_one(self.create_expected_doc())
+        self.assertEqual(stored, {"_id": "existing", **self.create_expected_doc()})
 
     def test_save_gambits_replace_stale(self):
         """Test replacing existing gambits when they are stale (>1 hour old)."""
-        # Set up the mock collection to return an existing document that's over 1 hour old
         existing_gambits = [
             self.create_gambit_entry("Gambit1", "2025-05-08 10:00:00", "test_data1"),
             self.create_gambit_entry("Gambit2", "2025-05-08 10:00:00", "test_data2")
         ]
-        self.mock_collection.find_one.return_value = self.create_existing_doc(
-            gambits=existing_gambits,
-            timestamp_delta=timedelta(hours=2)
-        )
+        existing_doc = self.create_existing_doc(gambits=existing_gambits, timestamp_delta=timedelta(hours=2))
 
-        # Create test gambits with the same number of items but updated data
-        test_gambits = [
+        stored = self.stored_after_save([
             self.create_test_gambit("Gambit1", data="test_data1_updated"),
             self.create_test_gambit("Gambit2", data="test_data2_updated")
-        ]
-
-        # Call the save_gambits function
-        save_gambits(test_gambits)
+        ], existing_doc)
 
-        # Verify database operations
-        self.verify_find_one()
-        self.verify_delete_one()
-
-        # Create expected document with updated gambits
         expected_gambits = [
             self.create_gambit_entry("Gambit1", data="test_data1_updated"),
             self.create_gambit_entry("Gambit2", data="test_data2_updated")
         ]
-        self.verify_insert_one(self.create_expected_doc(gambits=expected_gambits))
+        self.assertEqual(stored, {"_id": "existing", **self.create_expected_doc(gambits=expected_gambits)})
+
+    def test_save_gambits_keeps_recent_with_as_many(self):
+        """A recent stored day is not replaced by an upload with the same number of gambits."""
+        existing_gambits = [
+            self.create_gambit_entry("Gambit1", "2025-05-08 11:30:00", "test_data1"),
+            self.create_gambit_entry("Gambit2", "2025-05-08 11:30:00", "test_data2")
+        ]
+        existing_doc = self.create_existing_doc(gambits=existing_gambits, timestamp_delta=timedelta(minutes=30))
+
+        stored = self.stored_after_save([
+            self.create_test_gambit("Gambit1", data="test_data1_updated"),
+            self.create_test_gambit("Gambit2", data="test_data2_updated")
+        ], existing_doc)
+
+        self.assertEqual(stored, existing_doc)
 
     def test_save_gambits_skip_insertion(self):
         """Test skipping insertion when the existing document is newer and has more items."""
-        # Set up the mock collection to return a recent existing document with more items
         existing_gambits = [
             self.create_gambit_entry("Gambit1", "2025-05-08 11:30:00", "test_data1"),
             self.create_gambit_entry("Gambit2", "2025-05-08 11:30:00", "test_data2"),
             self.create_gambit_entry("Gambit3", "2025-05-08 11:30:00", "test_data3")
         ]
-        self.mock_collection.find_one.return_value = self.create_existing_doc(
-            gambits=existing_gambits,
-            timestamp_delta=timedelta(minutes=30)
-        )
+        existing_doc = self.create_existing_doc(gambits=existing_gambits, timestamp_delta=timedelta(minutes=30))
 
-        # Create test gambits with fewer items
-        test_gambits = [
+        stored = self.stored_after_save([
             self.create_test_gambit("Gambit1", data="test_data1_updated"),
             self.create_test_gambit("Gambit2", data="test_data2_updated")
+        ], existing_doc)
+
+        self.assertEqual(stored, existing_doc)
+
+    def test_save_gambits_stale_with_fewer_is_kept(self):
+        """Staleness alone does not let an upload with fewer gambits replace the stored day."""
+        existing_gambits = [
+            self.create_gambit_entry("Gambit1", "2025-05-08 10:00:00", "test_data1"),
+            self.create_gambit_entry("Gambit2", "2025-05-08 10:00:00", "test_data2"),
+            self.create_gambit_entry("Gambit3", "2025-05-08 10:00:00", "test_data3")
         ]
+        existing_doc = self.create_existing_doc(gambits=existing_gambits, timestamp_delta=timedelta(hours=2))
 
-        # Call the save_gambits function
-        save_gambits(test_gambits)
+        stored = self.stored_after_save([
+            self.create_test_gambit("Gambit1", data="test_data1_updated"),
+            self.create_test_gambit("Gambit2", data="test_data2_updated")
+        ], existing_doc)
 
-        # Verify database operations
-        self.verify_find_one()
-        self.mock_collection.delete_one.assert_not_called()
-        self.mock_collection.insert_one.assert_not_called()
+        self.assertEqual(stored, existing_doc)
+
+    def test_save_gambits_retries_duplicate_key(self):
+        """A concurrent insert of the same day is retried once, as an update."""
+        self.mock_collection.update_one.side_effect = [DuplicateKeyError("E11000 duplicate key error"), MagicMock()]
+
+        save_gambits([
+            self.create_test_gambit("Gambit1", data="test_data1"),
+            self.create_test_gambit("Gambit2", data="test_data2")
+        ])
+
+        self.verify_upsert(self.create_expected_doc(), call_count=2)
 
     def test_save_gambits_invalid_time(self):
         """Test that gambits with an invalid timestamp are not saved."""
@@ -258,18 +295,12 @@ class TestRaidpoolRepo(BaseTestCase):
                     # Call the save_gambits function
                     save_gambits(test_gambits)
 
-                    # Verify that find_one was NOT called because the timestamp was invalid
+                    # Verify that nothing was written because the timestamp was invalid
                     # and the function returned early.
-                    mock_collection.find_one.assert_not_called()
-
-                    # Verify the collection.insert_one was not called
-                    mock_collection.insert_one.assert_not_called()
+                    mock_collection.update_one.assert_not_called()
 
     def test_save_gambits_mixed_timestamps(self):
         """Test saving gambits where some have invalid timestamps."""
-        # Set up the mock collection to return None (no existing document)
-        self.mock_collection.find_one.return_value = None
-
         # Create test gambits: 3 valid, 1 old (from last raid week)
         valid_ts = "2025-05-07T18:00:43Z"
         old_ts = "2025-05-07T17:57:52Z"  # Last raid week (before May 2nd reset)
@@ -284,9 +315,6 @@ class TestRaidpoolRepo(BaseTestCase):
         # Call the save_gambits function
         save_gambits(test_gambits)
 
-        # Verify database operations
-        self.verify_find_one()
-
         # The expected document should only contain the 3 valid gambits
         expected_gambits = [
             self.create_gambit_entry("Gambit1", valid_ts),
@@ -294,7 +322,7 @@ class TestRaidpoolRepo(BaseTestCase):
             self.create_gambit_entry("Gambit4", valid_ts)
         ]
         expected_ts = datetime(2025, 5, 7, 18, 0, 43, tzinfo=timezone.utc)
-        self.verify_insert_one(self.create_expected_doc(gambits=expected_gambits, timestamp=expected_ts))
+        self.verify_upsert(self.create_expected_doc(gambits=expected_gambits, timestamp=expected_ts))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+import math
+import random
+import unittest
+
+from modules.utils.weighted_stats import element_at, summarize, weighted_median, weighted_mid_80_mean
+from tests.test_base import BaseTestCase
+
+
+def expand(pairs):
+    """Expand (price, amount) pairs into one entry per unit, as the old $unwind pipeline did."""
+    return [price for price, amount in pairs for _ in range(amount)]
+
+
+def reference_median(prices):
+    n = len(prices)
+    if n % 2 == 0:
+        return (prices[n // 2 - 1] + prices[n // 2]) / 2
+    return prices[n // 2]
+
+
+def reference_mid_80(prices):
+    n = len(prices)
+    if n > 2:
+        trim = math.ceil(n * 0.1)
+        kept = prices[trim:trim + n - 2 * trim]
+        return sum(kept) / len(kept)
+    return sum(prices) / n
+
+
+class TestWeightedStats(BaseTestCase):
+    """Test cases for the weighted_stats module."""
+
+    def test_empty(self):
+        """No data points yields empty statistics."""
+        stats = summarize([])
+        self.assertEqual(stats['count'], 0)
+        self.assertIsNone(stats['median'])
+        self.assertIsNone(stats['mid_80_mean'])
+
+    def test_element_at(self):
+        """Indexes address the expanded unit list."""
+        pairs = [(5, 2), (7, 3)]
+        self.assertEqual([element_at(pairs, i) for i in range(5)], [5, 5, 7, 7, 7])
+        self.assertIsNone(element_at(pairs, 5))
+
+    def test_median_even_and_odd(self):
+        """Median matches the middle element(s) of the expanded list."""
+        self.assertEqual(weighted_median([(1, 1), (3, 2)]), 3)
+        self.assertEqual(weighted_median([(1, 2), (3, 2)]), 2.0)
+
+    def test_mid_80_small_counts(self):
+        """Fewer than 3 data points fall back to the plain mean."""
+        self.assertEqual(weighted_mid_80_mean([(10, 1), (20, 1)]), 15.0)
+        self.assertEqual(weighted_mid_80_mean([(10, 2)]), 10.0)
+
+    def test_matches_expanded_statistics(self):
+        """Weighted results equal the statistics of the fully expanded price list."""
+        rng = random.Random(42)
+        for _ in range(200):
+            pairs = sorted(
+                (rng.randint(1, 5000), rng.choice([1, 1, 1, 2, 4, 16, 64]))
+                for _ in range(rng.randint(1, 40))
+            )
+            prices = expand(pairs)
+            stats = summarize(pairs)
+
+            self.assertEqual(stats['count'], len(prices))
+            self.assertEqual(stats['min'], prices[0])
+            self.assertEqual(stats['max'], prices[-1])
+            self.assertAlmostEqual(stats['mean'], sum(prices) / len(prices))
+            self.assertEqual(stats['median'], reference_median(prices))
+            self.assertAlmostEqual(stats['mid_80_mean'], reference_mid_80(prices))
+
+
+if __name__ == "__main__":
+    unittest.main()